@@ -0,0 +1,95 @@
+# Headless command line runner:
+#   python -m mean_field_civil_violence run params.json results.npz
+#   python -m mean_field_civil_violence import-time
+import argparse
+import json
+import sys
+
+from mean_field_civil_violence.headless import (
+    IMPORT_BUDGET,
+    deferred_imports,
+    load_parameters,
+    measure_import_time,
+)
+
+
+def run(args):
+    description = load_parameters(args.parameters)
+    model_name = args.model or description.get("model", "EpsteinNetworkCivilViolence")
+    runs = args.runs or description.get("runs", 1)
+    steps = args.steps or description.get("steps", description["params"].get("max_iters", 1000))
+    seed = args.seed if args.seed is not None else description.get("seed")
+    reporters = description.get("reporters", ["Active_Ratio"])
+
+    with deferred_imports():
+        import numpy as np
+
+        from mean_field_civil_violence.benchmark import load_model
+        from mean_field_civil_violence.ensemble import run_ensemble
+
+    if model_name == "BatchedNetworkCivilViolence":
+        from mean_field_civil_violence.batched import run_batched_ensemble
+        result = run_batched_ensemble(description["params"], runs, steps, reporters, seed)
+    else:
+        result = run_ensemble(
+            description["params"],
+            runs,
+            steps,
+            reporters,
+            processes=args.processes,
+            seed=seed,
+            progress=args.progress,
+            model_cls=load_model(model_name),
+        )
+    for run_index, run_seed, error in result.failures:
+        print(f"run {run_index} (seed {run_seed}) failed:\n{error}", file=sys.stderr)
+
+    params = {
+        name: value.tolist() if isinstance(value, np.ndarray) else value
+        for name, value in description["params"].items()
+    }
+    np.savez(
+        args.output,
+        run_indices=np.asarray(result.run_indices, dtype=np.int64),
+        seeds=np.asarray(result.seeds, dtype=np.uint64),
+        description=json.dumps({
+            "model": model_name, "params": params, "runs": runs, "steps": steps, "seed": seed,
+        }),
+        **result.series,
+    )
+    return 1 if result.failures else 0
+
+
+def import_time(args):
+    elapsed = measure_import_time(args.repeats)
+    within = elapsed <= args.budget
+    print(f"headless import: {elapsed:.3f} s (budget {args.budget:.3f} s)")
+    return 0 if within else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m mean_field_civil_violence")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run a configured model and save its series")
+    run_parser.add_argument("parameters", help="JSON parameter file, see headless.load_parameters")
+    run_parser.add_argument("output", help=".npz file the reporter series are written to")
+    run_parser.add_argument("--model", help="model name, overriding the parameter file's")
+    run_parser.add_argument("--runs", type=int)
+    run_parser.add_argument("--steps", type=int)
+    run_parser.add_argument("--seed", type=int)
+    run_parser.add_argument("--processes", type=int)
+    run_parser.add_argument("--progress", action="store_true")
+    run_parser.set_defaults(handler=run)
+
+    time_parser = commands.add_parser("import-time", help="check the headless import time")
+    time_parser.add_argument("--budget", type=float, default=IMPORT_BUDGET)
+    time_parser.add_argument("--repeats", type=int, default=5)
+    time_parser.set_defaults(handler=import_time)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,9 +2,71 @@ import math
 import numpy as np
 
 from epstein_civil_violence.agent import Citizen, Cop
+from mean_field_civil_violence.datacollection import ACTIVE, BREEDS, CITIZEN, CONDITIONS, COP, QUIESCENT
+
+
+class CodedLabel:
+    """
+    String view of an integer code attribute: reading `agent.condition`
+    gives "Active" or "Quiescent" and assigning either sets
+    `agent.condition_code`, so code written against the string attributes
+    keeps working while the agents only store small ints.
+    Args:
+        labels: label of every code, e.g. CONDITIONS
+        code_name: attribute holding the code
+    """
+
+    def __init__(self, labels, code_name):
+        self.labels = labels
+        self.codes = {label: code for code, label in enumerate(labels)}
+        self.code_name = code_name
+
+    def __get__(self, agent, owner=None):
+        if agent is None:
+            return self
+        return self.labels[getattr(agent, self.code_name)]
+
+    def __set__(self, agent, label):
+        setattr(agent, self.code_name, self.codes[label])
 
 
 class Inhabitant(Citizen):
+    """
+    Citizen of the mean field model. State lives in slots, breed and
+    condition as integer codes behind string views, and the agents seen in
+    a step are not kept once the step is over. (mesa.Agent itself has no
+    slots, so unique_id, model and pos still sit in a small __dict__.)
+    A jailed citizen stays in the schedule and the model's JailWheel
+    holds her until `release`; `jail_sentence` is derived from it.
+    """
+
+    __slots__ = (
+        "breed_code",
+        "condition_code",
+        "hardship",
+        "regime_legitimacy",
+        "risk_aversion",
+        "threshold",
+        "vision",
+        "release",
+        "stepped_at",
+        "grievance",
+        "arrest_probability",
+        "alpha",
+        "jail_factor",
+        "legitimacy_impact",
+        "incitation_num",
+        "use_mean_field",
+        "cops_in_vision",
+        "actives_in_vision",
+        "ideology_not_change",
+        "average_legitimacy",
+        "legitimacy_stability_threshold",
+        "is_stable",
+    )
+
+    breed = CodedLabel(BREEDS, "breed_code")
+    condition = CodedLabel(CONDITIONS, "condition_code")
 
     def __init__(
 
@@ -54,9 +116,10 @@ class Inhabitant(Citizen):
             risk_aversion,
             threshold,
             vision)
-        self.breed = "citizen"
-        self.condition = "Quiescent"
+        self.breed_code = CITIZEN
+        self.condition_code = QUIESCENT
         self.jail_sentence = 0
+        self.stepped_at = -1
         self.grievance = self.hardship * (1 - self.regime_legitimacy)
         self.arrest_probability = None
         self.alpha = alpha
@@ -69,10 +132,9 @@ class Inhabitant(Citizen):
 
         self.cops_in_vision = 0
         self.actives_in_vision = 0
-        self.empty_neighbors = None
 
         # might not use
-        if self.random.random() < 0.2:
+        if self.model.streams.initialization.random() < 0.2:
             self.ideology_not_change = True
         else:
             self.ideology_not_change = False
@@ -92,28 +154,82 @@ class Inhabitant(Citizen):
         self.closed_neighbors = [neighbor for neighbor in next_neighbors if neighbor.breed == "citizen"]
     '''
 
+    @property
+    def jail_sentence(self):
+        """
+        Iterations of jail left to serve, 0 when free.
+        """
+        if self.release is None:
+            return 0
+        return self.release - self.model.jail.clock
+
+    @jail_sentence.setter
+    def jail_sentence(self, sentence):
+        if sentence:
+            self.model.imprison(self, self.model.jail.clock + sentence)
+        elif getattr(self, "release", None) is not None:
+            raise ValueError("A jailed citizen is only freed by the jail")
+        else:
+            self.release = None
+
+    def update_neighbors(self):
+        """
+        Look around and return who my neighbors are, or None when the model
+        counts cops and actives in vision for me. Empty cells are not
+        listed; moves draw them from the grid's occupancy bitmap.
+        """
+        if self.model.neighborhood_counts is not None:
+            return None
+        neighborhood = self.model.grid.get_neighborhood(
+            self.pos, moore=True, radius=self.vision
+        )
+        return self.model.grid.get_cell_list_contents(neighborhood)
+
+    def move(self, origin):
+        """
+        Move to a random cell within vision of `origin` that was empty
+        before my first move of the step. A second move may thus pick the
+        cell I stand on and leave me there, as in the original model.
+        """
+        new_pos = self.model.grid.sample_empty_cell(
+            origin, self.vision, self.model.streams.movement, standing=self.pos
+        )
+        if new_pos is not None:
+            self.model.grid.move_agent(self, new_pos)
+
     def update_next_neighbors(self):
+        """
+        Citizens right next to me, jailed ones included.
+        """
         next_neighbors = self.model.grid.get_neighbors(
             self.pos, moore=True, radius=1
         )
 
-        self.closed_neighbors = [neighbor for neighbor in next_neighbors
-                              if neighbor.breed == "citizen"]
+        return [neighbor for neighbor in next_neighbors
+                if neighbor.breed_code == CITIZEN]
 
-    def update_estimated_arrest_probability(self):
+    def count_in_vision(self, neighbors):
         """
-        Based on the ratio of cops to actives in my neighborhood, estimate the
-        p(Arrest | I go active).
+        Number of cops and of actives (counting herself) among `neighbors`,
+        or read from the model's neighborhood counts when it keeps them.
         """
-        cops_in_vision = len([c for c in self.neighbors if c.breed == "cop"])
+        if neighbors is None:
+            return self.model.neighborhood_counts.vision_counts(self)
+        cops_in_vision = 0
         actives_in_vision = 1.0  # citizen counts herself
-        for c in self.neighbors:
-            if (
-                    c.breed == "citizen"
-                    and c.condition == "Active"
-                    and c.jail_sentence == 0
-            ):
+        for c in neighbors:
+            if c.breed_code == COP:
+                cops_in_vision += 1
+            elif c.condition_code == ACTIVE and c.jail_sentence == 0:
                 actives_in_vision += 1
+        return cops_in_vision, actives_in_vision
+
+    def update_estimated_arrest_probability(self, neighbors):
+        """
+        Based on the ratio of cops to actives in my neighborhood, estimate the
+        p(Arrest | I go active).
+        """
+        cops_in_vision, actives_in_vision = self.count_in_vision(neighbors)
         self.arrest_probability = 1 - math.exp(
             -1 * self.model.arrest_prob_constant * (cops_in_vision / actives_in_vision)
         )
@@ -125,35 +241,12 @@ class Inhabitant(Citizen):
         Decide whether to activate, then move if applicable.
         """
 
-        if self.jail_sentence:
-            self.jail_sentence -= 1
-            if self.jail_sentence == 0:
-                self.update_regime_legitimacy_leave_jail()
-            return  # no other changes or movements if agent is in jail.
-
-
-        # Calculate the legitimacy change
-        legitimacy_difference = abs(self.regime_legitimacy - self.average_legitimacy)
-        self.is_stable = legitimacy_difference < self.legitimacy_stability_threshold
-
-        self.update_neighbors()
-        self.update_next_neighbors()
-        self.update_estimated_arrest_probability()
-
-        if self.use_mean_field:
-            self.mean_field_spread()
-
-        self.grievance = self.hardship * (1 - self.regime_legitimacy)
-
-        net_risk = self.risk_aversion * self.arrest_probability * self.random.randint(0,
-                                                                                      self.model.max_jail_term) ** self.alpha
-        if self.grievance - net_risk > self.threshold:
-            self.condition = "Active"
-        else:
-            self.condition = "Quiescent"
-        if self.model.movement and self.empty_neighbors:
-            new_pos = self.random.choice(self.empty_neighbors)
-            self.model.grid.move_agent(self, new_pos)
+        # jailed citizens are not stepped (see jail.JailActivation)
+        self.stepped_at = self.model.iteration
+        origin = self.pos
+        self.commit(*self.decide())
+        if self.model.movement:
+            self.move(origin)
 
         # net_risk = self.risk_aversion * self.arrest_probability * self.random.randint(0,
         #                                                                               self.model.max_jail_term) ** self.alpha - 0.3
@@ -176,32 +269,84 @@ class Inhabitant(Citizen):
 
 
 
-        if self.model.movement and self.empty_neighbors:
-            new_pos = self.random.choice(self.empty_neighbors)
-            self.model.grid.move_agent(self, new_pos)
+        if self.model.movement:
+            self.move(origin)
+
+
+    def decide(self):
+        """
+        Work out my next regime legitimacy and condition from the current
+        state, changing nothing other agents look at before the commit.
+        Returns:
+            (regime_legitimacy, grievance, condition_code) for `commit`.
+        """
+        # Calculate the legitimacy change
+        legitimacy_difference = abs(self.regime_legitimacy - self.average_legitimacy)
+        self.is_stable = legitimacy_difference < self.legitimacy_stability_threshold
+
+        neighbors = self.update_neighbors()
+        self.update_estimated_arrest_probability(neighbors)
+
+        regime_legitimacy = self.regime_legitimacy
+        if self.use_mean_field:
+            legitimacy_field = self.model.legitimacy_field
+            if legitimacy_field is None:
+                # read off the grid's legitimacy field, kept up to date as
+                # the citizens before me commit
+                regime_legitimacy = self.model.grid.mean_field.update_at(self.pos, self.legitimacy_impact)
+            else:
+                # updated for the whole grid at once by the model
+                regime_legitimacy = float(legitimacy_field[self.pos])
+
+        grievance = self.hardship * (1 - regime_legitimacy)
+
+        net_risk = self.risk_aversion * self.arrest_probability * self.model.streams.activation.randint(0,
+                                                                                                       self.model.max_jail_term) ** self.alpha
+        if grievance - net_risk > self.threshold:
+            condition_code = ACTIVE
+        else:
+            condition_code = QUIESCENT
+        return regime_legitimacy, grievance, condition_code
 
+    def commit(self, regime_legitimacy, grievance, condition_code):
+        """
+        Take on the outcome of `decide`.
+        """
+        self.regime_legitimacy = regime_legitimacy
+        self.grievance = grievance
+        self.condition_code = condition_code
+        self.model.grid.refresh(self)
 
     def update_regime_legitimacy_leave_jail(self):
         self.regime_legitimacy *= self.jail_factor
         self.regime_legitimacy = max(0, min(self.regime_legitimacy, 1))
 
-    def mean_field_spread(self):
+    def mean_field_legitimacy(self, closed_neighbors):
+        """
+        My regime legitimacy pulled towards the mean of my closed neighbors'.
+        """
         # if self.ideology_not_change:
         #     return
-        if not self.closed_neighbors:
-            return
+        if not closed_neighbors:
+            return self.regime_legitimacy
 
         # Calculate the average regime_legitimacy of the surrounding neighbors
-        total_legitimacy = sum(neighbor.regime_legitimacy for neighbor in self.closed_neighbors)+self.regime_legitimacy
-        mean_legitimacy = total_legitimacy / (len(self.closed_neighbors)+1)
+        total_legitimacy = sum(neighbor.regime_legitimacy for neighbor in closed_neighbors)+self.regime_legitimacy
+        mean_legitimacy = total_legitimacy / (len(closed_neighbors)+1)
 
         # Adjust its own regime_legitimacy based on the average regime_legitimacy and its own legitimacy_impact
-        self.regime_legitimacy += self.legitimacy_impact * (mean_legitimacy - self.regime_legitimacy)
+        regime_legitimacy = self.regime_legitimacy + self.legitimacy_impact * (mean_legitimacy - self.regime_legitimacy)
 
         # Ensure that regime_legitimacy is between 0 and 1
-        self.regime_legitimacy = max(0, min(1, self.regime_legitimacy))
+        return max(0, min(1, regime_legitimacy))
 
 class Police(Cop):
+    __slots__ = ("breed_code", "vision")
+
+    breed = CodedLabel(BREEDS, "breed_code")
+    # cops are never jailed
+    release = None
+
     def __init__(self, unique_id, model, pos, vision):
         """
         Create a new Cop.
@@ -213,45 +358,62 @@ class Police(Cop):
             model: model instance
         """
         super().__init__(unique_id, model, pos, vision)
-        self.breed = "cop"
+        self.breed_code = COP
         # self.pos = pos
         # self.vision = vision
 
+    def update_neighbors(self):
+        """
+        Look around and return who my neighbors are. When the grid counts
+        the actives around me and there are none, skip listing them.
+        Empty cells are not listed; moves draw them from the grid's
+        occupancy bitmap.
+        """
+        grid = self.model.grid
+        if grid.tracks_radius(self.vision) and grid.actives_in_window(self.pos, self.vision) == 0:
+            return []
+        neighborhood = grid.get_neighborhood(
+            self.pos, moore=True, radius=self.vision
+        )
+        return grid.get_cell_list_contents(neighborhood)
+
     def step(self):
         """
         Inspect local vision and arrest a random active agent. Move if
         applicable.
         """
-        self.update_neighbors()
+        if not self.pursue() and self.model.movement:
+            new_pos = self.model.grid.sample_empty_cell(self.pos, self.vision, self.model.streams.movement)
+            if new_pos is not None:
+                self.model.grid.move_agent(self, new_pos)
+
+    def pursue(self):
+        """
+        Pick a random active citizen in vision and try to arrest her.
+        Returns whether there was one.
+        """
         active_neighbors = []
-        for agent in self.neighbors:
+        for agent in self.update_neighbors():
             if (
-                    agent.breed == "citizen"
-                    and agent.condition == "Active"
+                    agent.breed_code == CITIZEN
+                    and agent.condition_code == ACTIVE
                     and agent.jail_sentence == 0
             ):
                 active_neighbors.append(agent)
         if active_neighbors:
-            arrestee = self.random.choice(active_neighbors)
-            if self.random.random() < arrestee.arrest_probability:
-                sentence = self.random.randint(0, self.model.max_jail_term)
-                arrestee.jail_sentence = sentence
-                arrestee.condition = "Quiescent"
-                
-            # Get Moore neighborhood of the arrestee
-            arrestee_neighborhood = self.model.grid.get_neighborhood(arrestee.pos, moore=True, radius=1)
-            arrestee_empty_neighbors = [pos for pos in arrestee_neighborhood if self.model.grid.is_cell_empty(pos)]
-            # Filter to ensure the position is within the cop's vision
-            arrestee_empty_neighbors_in_vision = [pos for pos in arrestee_empty_neighbors if pos in self.neighborhood]
-            
-            if arrestee_empty_neighbors_in_vision:
-                new_pos = self.random.choice(arrestee_empty_neighbors_in_vision)
-            elif self.empty_neighbors:
-                new_pos = self.random.choice(self.empty_neighbors)
-        else:
-            if self.model.movement and self.empty_neighbors:
-                new_pos = self.random.choice(self.empty_neighbors)
-                self.model.grid.move_agent(self, new_pos)
+            jail = self.model.streams.jail
+            arrestee = jail.choice(active_neighbors)
+            if jail.random() < arrestee.arrest_probability:
+                sentence = jail.randint(0, self.model.max_jail_term)
+                self.model.arrest(arrestee, sentence)
+
+            # Empty cell next to the arrestee, within the cop's vision
+            new_pos = self.model.grid.sample_empty_cell_near(
+                arrestee.pos, self.pos, self.vision, self.model.streams.movement
+            )
+            if new_pos is None:
+                new_pos = self.model.grid.sample_empty_cell(self.pos, self.vision, self.model.streams.movement)
+        return bool(active_neighbors)
 
 
 
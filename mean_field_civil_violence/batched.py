@@ -0,0 +1,319 @@
+# Replicates of the array-backed engine advanced together as one batch.
+import numpy as np
+
+from mean_field_civil_violence.convergence import LEGITIMACY_DROP_ITERATION
+from mean_field_civil_violence.datacollection import ACTIVE, CITIZEN, COP, QUIESCENT
+from mean_field_civil_violence.diffusion import mean_field_step
+from mean_field_civil_violence.ensemble import EnsembleResult
+from mean_field_civil_violence.rng import spawn_seeds
+from mean_field_civil_violence.space import toroidal_window_sum
+from mean_field_civil_violence.vectorized import EMPTY, VectorizedNetworkCivilViolence, estimate_arrest_probability
+
+# Breed code of the padding rows of replicates with fewer agents.
+NO_AGENT = 255
+
+# Agent arrays the replicates share with the batch.
+SHARED_STATE = (
+    "breed",
+    "cell",
+    "hardship",
+    "risk_aversion",
+    "regime_legitimacy",
+    "average_legitimacy",
+    "condition",
+    "release",
+    "jail_sentence",
+    "arrest_probability",
+    "is_stable",
+)
+
+# Numeric reporters of the vectorized engine, kept as (replicates, steps + 1)
+# arrays.
+BATCH_REPORTERS = (
+    "Quiescent",
+    "Active",
+    "Jailed",
+    "Cops",
+    "Legitimacy",
+    "Cop_Density",
+    "Stable Agents",
+    "Active_Ratio",
+    "Mean_Legitimacy",
+)
+
+
+class BatchedNetworkCivilViolence:
+    """
+    R replicates of VectorizedNetworkCivilViolence advanced as one batch.
+    Agents of every replicate sit in (R, N) arrays padded to the largest
+    population and grids are (R, width, height) fields, so the decisions of
+    the citizens of all replicates, the bulk of the array work of a step,
+    are one set of array operations. The arrests and moves, which go agent
+    by agent, run per replicate through the replicate's own
+    VectorizedNetworkCivilViolence, whose arrays are views into the batch.
+    Every replicate keeps its own random streams and consumes them exactly
+    as the vectorized engine does: replicate r is the run of
+    VectorizedNetworkCivilViolence(**model_params, seed=seeds[r]), i.e. of
+    the synchronous activation of the agent based model.
+    Args:
+        model_params: keyword arguments of VectorizedNetworkCivilViolence;
+            convergence monitoring and recording agents are not supported.
+        seeds: seed of every replicate.
+    Attributes:
+        series: reporter name (BATCH_REPORTERS) -> (R, steps + 1) array.
+        waiting_times, outburst_sizes: per replicate lists.
+    """
+
+    def __init__(self, model_params, seeds):
+        for name in ("convergence", "trajectory_path", "agent_snapshot_every", "agent_snapshot_steps"):
+            if model_params.get(name):
+                raise ValueError(f"The batched engine does not support {name}")
+        # every replicate starts as its own vectorized model
+        replicates = [VectorizedNetworkCivilViolence(**model_params, seed=seed) for seed in seeds]
+        first = replicates[0]
+        for name in (
+                "width", "height", "citizen_vision", "cop_vision", "legitimacy", "cop_density",
+                "max_jail_term", "active_threshold", "arrest_prob_constant", "movement",
+                "max_iters", "alpha", "jail_factor", "legitimacy_impact", "use_mean_field",
+                "cop_density_mode", "legitimacy_mode", "legitimacy_drop",
+                "legitimacy_stability_threshold",
+        ):
+            setattr(self, name, getattr(first, name))
+        self.deterrence = first.deterrence
+        self.replicates = replicates
+        self.num_replicates = len(replicates)
+        self.num_cells = self.width * self.height
+        self.streams = [replicate.streams for replicate in replicates]
+        self.iteration = 0
+
+        self.size = max(len(replicate.cell) for replicate in replicates)
+        shape = (self.num_replicates, self.size)
+        self.breed = np.full(shape, NO_AGENT, dtype=np.uint8)
+        self.cell = np.zeros(shape, dtype=np.int64)
+        self.hardship = np.zeros(shape)
+        self.risk_aversion = np.zeros(shape)
+        self.regime_legitimacy = np.zeros(shape)
+        self.average_legitimacy = np.zeros(shape)
+        self.condition = np.full(shape, QUIESCENT, dtype=np.uint8)
+        self.release = np.full(shape, EMPTY, dtype=np.int64)
+        self.jail_sentence = np.zeros(shape, dtype=np.int64)
+        self.arrest_probability = np.zeros(shape)
+        self.is_stable = np.zeros(shape, dtype=bool)
+        for r, replicate in enumerate(replicates):
+            count = len(replicate.cell)
+            for name in SHARED_STATE:
+                rows = getattr(self, name)
+                rows[r, :count] = getattr(replicate, name)
+                # the replicate works on its row of the batch
+                setattr(replicate, name, rows[r, :count])
+        for name in SHARED_STATE:
+            setattr(self, name, getattr(self, name).reshape(-1))
+        self.replicate = np.repeat(np.arange(self.num_replicates), self.size)
+        # cells are numbered across replicates in the batch's grids
+        self.cell_offset = self.replicate * self.num_cells
+        self.total_citizen = np.array([replicate.total_citizen for replicate in replicates])
+
+        self.active_outburst = np.zeros(self.num_replicates, dtype=bool)
+        self.last_outburst_ended = np.zeros(self.num_replicates, dtype=np.int64)
+        self.current_outburst_size = np.zeros(self.num_replicates, dtype=np.int64)
+        self.waiting_times = [[] for _ in replicates]
+        self.outburst_sizes = [[] for _ in replicates]
+
+        self.capacity = self.max_iters + 2
+        self.series = {
+            name: np.full((self.num_replicates, self.capacity), np.nan) for name in BATCH_REPORTERS
+        }
+        self.update_tally()
+        self.collect()
+
+    @property
+    def running(self):
+        return self.iteration <= self.max_iters
+
+    def draws(self, purpose, replicates):
+        """
+        Uniform draws of `purpose` for requests made by `replicates` (the
+        replicate of each request, in increasing order): each replicate
+        takes its share from its own stream, in request order.
+        """
+        counts = np.bincount(replicates, minlength=self.num_replicates)
+        return np.concatenate([
+            streams[purpose].uniforms(int(count)) for streams, count in zip(self.streams, counts)
+        ])
+
+    def integers(self, purpose, replicates, low, high):
+        """
+        RandomStream.integers on `draws`.
+        """
+        span = high - low
+        values = (self.draws(purpose, replicates) * span).astype(np.int64)
+        return low + np.minimum(values, span - 1)
+
+    def run(self, steps):
+        """
+        Step every replicate `steps` times, or until max_iters.
+        """
+        for _ in range(steps):
+            if not self.running:
+                break
+            self.step()
+
+    def step(self):
+        active_count = self.tally["Active"]
+        if self.iteration == LEGITIMACY_DROP_ITERATION and self.legitimacy_mode == 'drop':
+            self.legitimacy = max(0, self.legitimacy - self.legitimacy_drop)
+        elif self.legitimacy_mode == 'gradual':
+            self.legitimacy = max(0, self.legitimacy - 0.001)
+        if self.cop_density_mode == 'gradual':
+            self.cop_density = max(0, self.cop_density - 0.00005)
+
+        for r in range(self.num_replicates):
+            if active_count[r] >= 100 and not self.active_outburst[r]:
+                if self.last_outburst_ended[r] != 0:
+                    self.waiting_times[r].append(self.iteration - int(self.last_outburst_ended[r]))
+                self.active_outburst[r] = True
+            if active_count[r] < 100 and self.active_outburst[r]:
+                self.last_outburst_ended[r] = self.iteration
+                self.active_outburst[r] = False
+
+            if active_count[r] >= 100:
+                self.current_outburst_size[r] += active_count[r]
+            elif self.current_outburst_size[r] > 0:
+                self.outburst_sizes[r].append(int(self.current_outburst_size[r]))
+                self.current_outburst_size[r] = 0
+
+        self.advance_agents()
+        self.update_tally()
+        self.iteration += 1
+        self.collect()
+
+    def advance_agents(self):
+        """
+        Citizen decisions of every replicate at once, then the arrests,
+        moves and releases of each replicate.
+        """
+        free = np.flatnonzero((self.breed == CITIZEN) & (self.release == EMPTY))
+        self.update_citizens(free)
+        replicate_of = self.replicate[free]
+        for r, replicate in enumerate(self.replicates):
+            replicate.iteration = self.iteration
+            replicate.arrest_and_move(free[replicate_of == r] - r * self.size)
+
+    def grid_field(self, values, mask):
+        """
+        Scatter per-agent values onto (R, width, height) grids; empty cells
+        and agents outside `mask` contribute zero.
+        """
+        field = np.zeros(self.num_replicates * self.num_cells, dtype=np.float64)
+        field[(self.cell + self.cell_offset)[mask]] = values[mask] if np.ndim(values) else values
+        return field.reshape(self.num_replicates, self.width, self.height)
+
+    def active_mask(self):
+        return (
+            (self.breed == CITIZEN)
+            & (self.condition == ACTIVE)
+            & (self.release == EMPTY)
+        )
+
+    def update_citizens(self, free):
+        """
+        Arrest probability estimate, mean field legitimacy update and
+        activation decision of the free citizens `free`, as
+        VectorizedNetworkCivilViolence.update_citizens.
+        """
+        if len(free) == 0:
+            return
+        cells = (self.cell + self.cell_offset)[free]
+        active = self.active_mask()
+        cops_field = self.grid_field(1.0, self.breed == COP)
+        actives_field = self.grid_field(1.0, active)
+        cops_in_vision = toroidal_window_sum(cops_field, self.citizen_vision).ravel()[cells]
+        actives_in_vision = 1.0 + (
+            toroidal_window_sum(actives_field, self.citizen_vision).ravel()[cells]
+            - active[free]
+        )
+        self.arrest_probability[free] = estimate_arrest_probability(
+            cops_in_vision, actives_in_vision, self.arrest_prob_constant
+        )
+
+        legitimacy = self.regime_legitimacy[free]
+        self.is_stable[free] = (
+            np.abs(legitimacy - self.average_legitimacy[free])
+            < self.legitimacy_stability_threshold
+        )
+
+        if self.use_mean_field:
+            citizens = self.breed == CITIZEN
+            legitimacy_field = mean_field_step(
+                self.grid_field(self.regime_legitimacy, citizens),
+                self.grid_field(1.0, citizens) > 0,
+                self.legitimacy_impact,
+            )
+            legitimacy = legitimacy_field.ravel()[cells]
+            self.regime_legitimacy[free] = legitimacy
+
+        grievance = self.hardship[free] * (1 - legitimacy)
+        jail_term = self.integers("activation", self.replicate[free], 0, self.max_jail_term + 1)
+        net_risk = self.risk_aversion[free] * self.arrest_probability[free] * self.deterrence[jail_term]
+        self.condition[free] = np.where(
+            grievance - net_risk > self.active_threshold, ACTIVE, QUIESCENT
+        )
+
+    def count(self, mask):
+        """
+        Agents in `mask`, per replicate.
+        """
+        return np.bincount(self.replicate[mask], minlength=self.num_replicates)
+
+    def update_tally(self):
+        """
+        Per replicate counts of quiescent, active and jailed citizens, cops
+        and stable agents, and mean regime legitimacy of the citizens.
+        """
+        citizens = self.breed == CITIZEN
+        free = citizens & (self.jail_sentence == 0)
+        active = self.count(free & (self.condition == ACTIVE))
+        legitimacy = self.regime_legitimacy.reshape(self.num_replicates, self.size)
+        citizen_rows = citizens.reshape(self.num_replicates, self.size)
+        self.tally = {
+            "Quiescent": self.count(free) - active,
+            "Active": active,
+            "Jailed": self.count(citizens) - self.count(free),
+            "Cops": self.count(self.breed == COP),
+            "Stable Agents": self.count(self.is_stable & citizens),
+            # summed in unique_id order, as the vectorized engine does
+            "Mean_Legitimacy": np.array([
+                float(np.cumsum(row[mask])[-1]) / total if mask.any() else np.nan
+                for row, mask, total in zip(legitimacy, citizen_rows, self.total_citizen)
+            ]),
+        }
+
+    def collect(self):
+        column = self.iteration
+        for name in ("Quiescent", "Active", "Jailed", "Cops", "Stable Agents", "Mean_Legitimacy"):
+            self.series[name][:, column] = self.tally[name]
+        self.series["Legitimacy"][:, column] = self.legitimacy
+        self.series["Cop_Density"][:, column] = self.cop_density
+        self.series["Active_Ratio"][:, column] = self.tally["Active"] / self.total_citizen
+
+
+def run_batched_ensemble(model_params, num_runs, steps, reporters=("Active_Ratio",), seed=None):
+    """
+    run_ensemble for VectorizedNetworkCivilViolence, with the replicates
+    advanced as one batch in this process. The replicate seeds are spawned
+    from `seed` as run_ensemble does, so both return the same series.
+    `reporters` None returns every BATCH_REPORTERS series.
+    Returns:
+        EnsembleResult with (num_runs, steps + 1) series.
+    """
+    reporters = BATCH_REPORTERS if reporters is None else reporters
+    seeds = spawn_seeds(seed, num_runs)
+    batch = BatchedNetworkCivilViolence(model_params, seeds)
+    batch.run(steps)
+    series = {}
+    for name in reporters:
+        data = np.full((num_runs, steps + 1), np.nan)
+        length = min(steps + 1, batch.iteration + 1)
+        data[:, :length] = batch.series[name][:, :length]
+        series[name] = data
+    return EnsembleResult(series, list(range(num_runs)), seeds, [])
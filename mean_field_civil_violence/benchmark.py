@@ -0,0 +1,431 @@
+# Performance benchmarks of the civil violence models.
+import argparse
+import datetime
+import fnmatch
+import gc
+import importlib
+import inspect
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from mean_field_civil_violence.cache import _plain, code_version, model_parameters
+
+# Benchmarked models by name, imported on use.
+MODELS = {
+    "EpsteinCivilViolence": "epstein_civil_violence.model.EpsteinCivilViolence",
+    "EpsteinNetworkCivilViolence": "mean_field_civil_violence.model.EpsteinNetworkCivilViolence",
+    "VectorizedNetworkCivilViolence": "mean_field_civil_violence.vectorized.VectorizedNetworkCivilViolence",
+    "KernelNetworkCivilViolence": "mean_field_civil_violence.kernels.KernelNetworkCivilViolence",
+    "TiledNetworkCivilViolence": "mean_field_civil_violence.tiled.TiledNetworkCivilViolence",
+}
+DEFAULT_MODELS = ("EpsteinCivilViolence", "EpsteinNetworkCivilViolence")
+
+# Regional legitimacies of the by_regions cases.
+REGION_MATRIX = [[0.9, 0.7], [0.8, 0.6]]
+
+# The sweep varies one axis at a time around the default configuration.
+SWEEP = {
+    "grid": [{"width": size, "height": size} for size in (40, 100, 200, 400)],
+    "vision": [{"citizen_vision": vision, "cop_vision": vision} for vision in (1, 4, 7, 10)],
+    "legitimacy_type": [
+        {"legitimacy_type": "basic"},
+        {"legitimacy_type": "heterogeneous"},
+        {"legitimacy_type": "by_regions", "legitimacy_matrix": REGION_MATRIX},
+    ],
+    "mean_field": [{"use_mean_field": True}, {"use_mean_field": False}],
+}
+
+# A configuration with repeated outbursts, where the engines can differ.
+EQUIVALENCE_PARAMS = {"legitimacy": 0.7, "max_jail_term": 30, "cop_density": 0.04}
+
+# Alternative engines as (runner, activation of the agent based model it
+# runs), runners taking (model_params, num_runs, steps, seed) and returning
+# an EnsembleResult. Every engine is tested against
+# EpsteinNetworkCivilViolence with its activation, and an engine that
+# differs fails the check.
+EQUIVALENCE = {
+    "VectorizedNetworkCivilViolence": ("vectorized", "synchronous"),
+    "BatchedNetworkCivilViolence": ("batched", "synchronous"),
+    "KernelNetworkCivilViolence": ("kernel", "random"),
+    "TiledNetworkCivilViolence": ("tiled", "synchronous"),
+}
+
+
+def load_model(name):
+    module, _, attribute = MODELS[name].rpartition(".")
+    return getattr(importlib.import_module(module), attribute)
+
+
+def case_name(params):
+    return ",".join(f"{key}={_plain(value)}" for key, value in sorted(params.items()))
+
+
+def accepted_parameters(model_cls):
+    """
+    Constructor parameter names of `model_cls`, following **kwargs up the
+    base classes.
+    """
+    accepted = set()
+    for cls in model_cls.__mro__:
+        if "__init__" not in vars(cls):
+            continue
+        parameters = inspect.signature(cls.__init__).parameters.values()
+        accepted.update(p.name for p in parameters if p.kind is not p.VAR_KEYWORD)
+        if not any(p.kind is p.VAR_KEYWORD for p in parameters):
+            break
+    return accepted
+
+
+def sweep_cases(model_cls):
+    """
+    (name, params) of every sweep point `model_cls` takes. Parameters the
+    model lacks (e.g. legitimacy_type of the original Epstein model) are
+    dropped, and points that come out as the same configuration, such as
+    the defaults on every axis, are kept once.
+    """
+    accepted = accepted_parameters(model_cls)
+    cases = {}
+    for points in SWEEP.values():
+        for point in points:
+            params = {key: value for key, value in point.items() if key in accepted}
+            configuration = json.dumps(model_parameters(model_cls, params), sort_keys=True)
+            cases.setdefault(configuration, (case_name(params), params))
+    return list(cases.values())
+
+
+def build(model_cls, params, seed):
+    if "seed" in accepted_parameters(model_cls):
+        params = dict(params, seed=seed)
+    return model_cls(**params)
+
+
+def measure(model_cls, params, steps, repeats=3, seed=0, budget=60.0):
+    """
+    Best of `repeats` construction times and step rates of one configuration,
+    and the peak traced memory of constructing it and taking one step,
+    measured in a separate pass since tracing slows allocation down. A
+    repeat stops stepping once it has run `budget` seconds, so the largest
+    grids of the agent models stay affordable. One untimed run first fills
+    the process wide caches (neighborhood tables, compiled kernels).
+    """
+    model = build(model_cls, params, seed)
+    model.step()
+    getattr(model, "close", lambda: None)()
+    construction = []
+    rates = []
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        model = build(model_cls, params, seed)
+        built = time.perf_counter()
+        done = 0
+        end = built
+        while done < steps and end - built < budget:
+            model.step()
+            done += 1
+            end = time.perf_counter()
+        construction.append(built - start)
+        rates.append(done / (end - built))
+        getattr(model, "close", lambda: None)()
+        del model
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        model = build(model_cls, params, seed)
+        model.step()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    getattr(model, "close", lambda: None)()
+    return {
+        "construction_s": min(construction),
+        "steps_per_s": max(rates),
+        "peak_memory_mb": peak / 2 ** 20,
+    }
+
+
+def run_benchmarks(models=DEFAULT_MODELS, steps=10, repeats=3, cases="*", budget=60.0, progress=False):
+    """
+    Benchmark every sweep case of every model in `models`.
+    Args:
+        models: names in MODELS.
+        steps: steps timed per repeat.
+        repeats: the best of this many repeats is kept.
+        cases: fnmatch pattern on the case names, e.g. "*width=40*".
+        budget: seconds of stepping per repeat, see `measure`.
+        progress: print every result as it comes.
+    Returns:
+        Machine readable results, {"metadata": ..., "results": [...]}.
+    """
+    results = []
+    for name in models:
+        model_cls = load_model(name)
+        for case, params in sweep_cases(model_cls):
+            if not fnmatch.fnmatch(case, cases):
+                continue
+            result = {"model": name, "case": case, "params": _plain(params), "steps": steps}
+            result.update(measure(model_cls, params, steps, repeats, budget=budget))
+            results.append(result)
+            if progress:
+                print(
+                    f"{name} {case}: {result['construction_s']:.3f} s construction, "
+                    f"{result['steps_per_s']:.2f} steps/s, {result['peak_memory_mb']:.1f} MiB",
+                    flush=True,
+                )
+    metadata = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "code_version": code_version(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+    }
+    return {"metadata": metadata, "results": results}
+
+
+def save_results(results, path):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=1)
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+# Metric -> +1 when larger is better, -1 when smaller is better.
+METRICS = {"construction_s": -1, "steps_per_s": 1, "peak_memory_mb": -1}
+
+
+def compare_results(baseline, current, tolerance=0.2):
+    """
+    Relative change of every metric of the (model, case) pairs found in
+    both result sets.
+    Returns:
+        (rows, regressions): one row (model, case, metric, baseline,
+        current, change) per metric, and the rows worse than the baseline
+        by more than `tolerance`.
+    """
+    reference = {(r["model"], r["case"]): r for r in baseline["results"]}
+    rows = []
+    regressions = []
+    for result in current["results"]:
+        base = reference.get((result["model"], result["case"]))
+        if base is None:
+            continue
+        for metric, sign in METRICS.items():
+            change = result[metric] / base[metric] - 1 if base[metric] else 0.0
+            row = (result["model"], result["case"], metric, base[metric], result[metric], change)
+            rows.append(row)
+            if sign * change < -tolerance:
+                regressions.append(row)
+    return rows, regressions
+
+
+def _ensemble_runner(engine):
+    """
+    Ensemble runner of one engine, see EQUIVALENCE.
+    """
+    from mean_field_civil_violence.ensemble import run_ensemble
+    from mean_field_civil_violence.model import EpsteinNetworkCivilViolence
+
+    if engine == "batched":
+        from mean_field_civil_violence.batched import run_batched_ensemble
+        return run_batched_ensemble
+    model_params = {}
+    if engine in ("random", "synchronous"):
+        model_cls = EpsteinNetworkCivilViolence
+        model_params = {"activation": engine}
+    else:
+        model_cls = load_model({
+            "vectorized": "VectorizedNetworkCivilViolence",
+            "kernel": "KernelNetworkCivilViolence",
+            "tiled": "TiledNetworkCivilViolence",
+        }[engine])
+
+    def run(params, num_runs, steps, seed):
+        return run_ensemble(dict(params, **model_params), num_runs, steps, seed=seed, model_cls=model_cls)
+    return run
+
+
+def _run_all(engine, model_params, num_runs, steps, seed):
+    """
+    Active_Ratio of `num_runs` runs of `engine`; a failed run fails the check.
+    """
+    result = _ensemble_runner(engine)(model_params, num_runs, steps, seed=seed)
+    if result.failures:
+        run_index, run_seed, error = result.failures[0]
+        raise RuntimeError(f"{engine} run {run_index} (seed {run_seed}) failed:\n{error}")
+    return result["Active_Ratio"]
+
+
+def check_equivalence(engines=tuple(EQUIVALENCE), model_params=None, num_runs=30, steps=100, seed=0, alpha=0.01):
+    """
+    Two-sample Kolmogorov-Smirnov tests of the Active_Ratio of every engine
+    against the agent based model with the engine's activation (see
+    EQUIVALENCE), on the per-run mean and final values. Engine and
+    reference runs use different seeds.
+    Returns:
+        One dict per engine with the reference activation, the test
+        statistics, p-values, the largest difference of the mean series in
+        standard errors and `equivalent`, False when a test rejects at
+        `alpha`.
+    """
+    from scipy.stats import ks_2samp
+
+    model_params = dict(model_params or EQUIVALENCE_PARAMS, max_iters=steps)
+    seeds = np.random.SeedSequence(seed).generate_state(2)
+    references = {}
+    reports = []
+    for name in engines:
+        engine, reference = EQUIVALENCE[name]
+        if reference not in references:
+            references[reference] = _run_all(reference, model_params, num_runs, steps, int(seeds[1]))
+        theirs = references[reference]
+        ours = _run_all(engine, model_params, num_runs, steps, int(seeds[0]))
+        report = {"engine": name, "reference": reference, "runs": num_runs, "steps": steps}
+        for statistic, values in (
+                ("mean", lambda data: np.nanmean(data[:, 1:], axis=1)),
+                ("final", lambda data: data[:, -1]),
+        ):
+            test = ks_2samp(values(ours), values(theirs))
+            report[f"{statistic}_ks"] = float(test.statistic)
+            report[f"{statistic}_p"] = float(test.pvalue)
+        error = np.sqrt(np.nanvar(ours, axis=0) / num_runs + np.nanvar(theirs, axis=0) / num_runs)
+        difference = np.abs(np.nanmean(ours, axis=0) - np.nanmean(theirs, axis=0))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z = np.where(error > 0, difference / error, 0.0)
+        report["max_z"] = float(np.nanmax(z))
+        report["equivalent"] = min(report["mean_p"], report["final_p"]) >= alpha
+        reports.append(report)
+    return reports
+
+
+def compare_kernel_backends(model_params=None, steps=50, seed=0):
+    """
+    Run EpsteinNetworkCivilViolence and KernelNetworkCivilViolence with the
+    python and the numba backend for `steps` steps from the same seed (the
+    model defaults: a 40x40 grid, vision 7), check that all give the same
+    series and time them. The first step, which compiles the numba kernel
+    unless it is cached, is timed apart.
+    Returns:
+        dict with `identical`, per engine ("agent", "python", "numba") the
+        seconds of the first step and the steps per second after it,
+        `speedup`, the ratio of the numba to the agent model step rate, and
+        `backend_speedup`, that of numba to python.
+    """
+    from mean_field_civil_violence.kernels import KernelNetworkCivilViolence
+    from mean_field_civil_violence.model import EpsteinNetworkCivilViolence
+
+    model_params = dict(model_params or {}, max_iters=steps + 1)
+    report = {"steps": steps}
+    series = {}
+    for engine in ("agent", "python", "numba"):
+        start = time.perf_counter()
+        if engine == "agent":
+            model = EpsteinNetworkCivilViolence(**model_params, seed=seed)
+        else:
+            model = KernelNetworkCivilViolence(**model_params, seed=seed, backend=engine)
+        model.step()
+        first = time.perf_counter()
+        for _ in range(steps - 1):
+            model.step()
+        end = time.perf_counter()
+        report[f"{engine}_first_step_s"] = first - start
+        report[f"{engine}_steps_per_s"] = (steps - 1) / (end - first)
+        series[engine] = model.datacollector.model_vars
+
+    def same(engine, names):
+        return all(
+            np.array_equal(np.asarray(series["numba"][name]), np.asarray(series[engine][name]), equal_nan=True)
+            for name in names
+        )
+
+    # the tallies sum the legitimacy in another order, so the mean of the
+    # agent model may differ from the kernels' in the last digits
+    report["identical"] = (
+        same("python", ("Active", "Jailed", "Quiescent", "Mean_Legitimacy"))
+        and same("agent", ("Active", "Jailed", "Quiescent"))
+    )
+    report["speedup"] = report["numba_steps_per_s"] / report["agent_steps_per_s"]
+    report["backend_speedup"] = report["numba_steps_per_s"] / report["python_steps_per_s"]
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m mean_field_civil_violence.benchmark")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="benchmark the sweep and write the results")
+    run.add_argument("output", help="JSON file the results are written to")
+    run.add_argument("--models", nargs="+", default=list(DEFAULT_MODELS), choices=sorted(MODELS))
+    run.add_argument("--steps", type=int, default=10)
+    run.add_argument("--repeats", type=int, default=3)
+    run.add_argument("--cases", default="*", help="fnmatch pattern on the case names")
+    run.add_argument("--budget", type=float, default=60.0, help="seconds of stepping per repeat")
+
+    compare = commands.add_parser("compare", help="flag regressions against a baseline")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--tolerance", type=float, default=0.2)
+
+    equivalence = commands.add_parser("equivalence", help="test the alternative engines")
+    equivalence.add_argument("--engines", nargs="+", default=list(EQUIVALENCE), choices=sorted(EQUIVALENCE))
+    equivalence.add_argument("--runs", type=int, default=30)
+    equivalence.add_argument("--steps", type=int, default=100)
+    equivalence.add_argument("--seed", type=int, default=0)
+    equivalence.add_argument("--alpha", type=float, default=0.01)
+    equivalence.add_argument("--output", help="JSON file the reports are written to")
+
+    kernel = commands.add_parser("kernel", help="compare the numba kernel with the agent model")
+    kernel.add_argument("--steps", type=int, default=50)
+    kernel.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        results = run_benchmarks(
+            args.models, args.steps, args.repeats, args.cases, args.budget, progress=True
+        )
+        save_results(results, args.output)
+        return 0
+    if args.command == "compare":
+        rows, regressions = compare_results(
+            load_results(args.baseline), load_results(args.current), args.tolerance
+        )
+        for model, case, metric, base, current, change in rows:
+            flag = "  REGRESSION" if (model, case, metric, base, current, change) in regressions else ""
+            print(f"{model} {case} {metric}: {base:.4g} -> {current:.4g} ({change:+.1%}){flag}")
+        print(f"{len(regressions)} regressions beyond {args.tolerance:.0%}")
+        return 1 if regressions else 0
+    if args.command == "kernel":
+        report = compare_kernel_backends(None, args.steps, args.seed)
+        for engine in ("agent", "python", "numba"):
+            print(
+                f"{engine}: first step {report[engine + '_first_step_s']:.2f} s, "
+                f"{report[engine + '_steps_per_s']:.1f} steps/s after it"
+            )
+        print(
+            f"numba {report['speedup']:.1f}x the agent model, {report['backend_speedup']:.1f}x python, "
+            f"{'identical' if report['identical'] else 'DIFFERENT'} series"
+        )
+        return 0 if report["identical"] else 1
+    reports = check_equivalence(args.engines, None, args.runs, args.steps, args.seed, args.alpha)
+    for report in reports:
+        flag = "" if report["equivalent"] else "  NOT EQUIVALENT"
+        print(
+            f"{report['engine']} vs the {report['reference']} activation: mean KS p={report['mean_p']:.3g}, "
+            f"final KS p={report['final_p']:.3g}, max |z|={report['max_z']:.2f}{flag}"
+        )
+    if args.output:
+        save_results({"reports": reports}, args.output)
+    return 0 if all(report["equivalent"] for report in reports) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
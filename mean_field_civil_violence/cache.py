@@ -0,0 +1,227 @@
+# Content-addressed on-disk cache of simulation runs.
+import functools
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+from mean_field_civil_violence.ensemble import run_replicate
+
+_PACKAGES = ("epstein_civil_violence", "mean_field_civil_violence")
+
+
+@functools.lru_cache(maxsize=None)
+def code_version():
+    """
+    Hash of the source of the model packages, so that cached runs are not
+    reused once the model code changes.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    digest = hashlib.sha256()
+    for package in _PACKAGES:
+        directory = os.path.join(root, package)
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".py"):
+                digest.update(name.encode())
+                with open(os.path.join(directory, name), "rb") as f:
+                    digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def _plain(value):
+    if isinstance(value, np.ndarray):
+        return _plain(value.tolist())
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _plain(item) for key, item in value.items()}
+    return value
+
+
+def model_parameters(model_cls, model_params):
+    """
+    Every constructor parameter of `model_cls`, defaults filled in, as plain
+    JSON values. Spelling a default out or leaving it implicit gives the
+    same parameters.
+    """
+    signature = inspect.signature(model_cls.__init__)
+    bound = signature.bind_partial(None, **model_params)
+    bound.apply_defaults()
+    params = dict(bound.arguments)
+    params.pop("self", None)
+    params.pop("seed", None)
+    return _plain(params)
+
+
+def run_key(model_cls, model_params, seed, steps):
+    """
+    Stable hash of a run: model class, all constructor parameters, seed,
+    number of steps and code version.
+    """
+    description = {
+        "model": f"{model_cls.__module__}.{model_cls.__qualname__}",
+        "params": model_parameters(model_cls, model_params),
+        "seed": seed,
+        "steps": steps,
+        "code_version": code_version(),
+    }
+    encoded = json.dumps(description, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class RunCache:
+    """
+    On-disk cache of model reporter series keyed by run_key.
+    Every run is one .npz file holding its numeric model reporter series.
+    An SQLite index records the parameters, seed and steps of every entry
+    so computed parameter points can be looked up without opening the
+    files, together with sizes and access times for LRU eviction.
+    Attributes:
+        directory: cache directory
+        max_bytes: total size of the stored runs above which the least
+            recently used ones are evicted; None for no bound
+    """
+
+    def __init__(self, directory, max_bytes=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._index = sqlite3.connect(os.path.join(directory, "index.sqlite"))
+        with self._index:
+            self._index.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                "key TEXT PRIMARY KEY, model TEXT, params TEXT, seed INTEGER, "
+                "steps INTEGER, code_version TEXT, size INTEGER, last_access REAL)"
+            )
+
+    def close(self):
+        self._index.close()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def __contains__(self, key):
+        row = self._index.execute("SELECT 1 FROM runs WHERE key = ?", (key,)).fetchone()
+        return row is not None
+
+    def get(self, model_cls, model_params, seed, steps, reporters=None):
+        """
+        Cached reporter series of a run, or None on a miss. A run cached
+        without some of the requested `reporters` is a miss.
+        """
+        if seed is None:
+            return None
+        key = run_key(model_cls, model_params, seed, steps)
+        if key not in self:
+            return None
+        try:
+            with np.load(self._path(key)) as stored:
+                if reporters is None:
+                    reporters = list(stored.files)
+                if not set(reporters) <= set(stored.files):
+                    return None
+                series = {name: stored[name] for name in reporters}
+        except FileNotFoundError:
+            self._forget(key)
+            return None
+        with self._index:
+            self._index.execute(
+                "UPDATE runs SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+        return series
+
+    def put(self, model_cls, model_params, seed, steps, series):
+        """
+        Store the reporter series of a run. Runs without a seed are not
+        reproducible and are not stored.
+        """
+        if seed is None:
+            return
+        key = run_key(model_cls, model_params, seed, steps)
+        path = self._path(key)
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as f:
+            np.savez(f, **series)
+        os.replace(temporary, path)
+        with self._index:
+            self._index.execute(
+                "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    f"{model_cls.__module__}.{model_cls.__qualname__}",
+                    json.dumps(model_parameters(model_cls, model_params), sort_keys=True),
+                    seed,
+                    steps,
+                    code_version(),
+                    os.path.getsize(path),
+                    time.time(),
+                ),
+            )
+        self.evict()
+
+    def run(self, model_cls, model_params, seed, steps, reporters=None):
+        """
+        Reporter series of a run, simulated only on a cache miss.
+        """
+        series = self.get(model_cls, model_params, seed, steps, reporters)
+        if series is not None:
+            return series
+        series = run_replicate(model_cls, model_params, steps, None, seed)
+        self.put(model_cls, model_params, seed, steps, series)
+        if reporters is not None:
+            series = {name: series[name] for name in reporters}
+        return series
+
+    def entries(self, **params):
+        """
+        Index rows (key, model, parameters, seed, steps) of the cached runs
+        of the current code version whose parameters match `params`.
+        """
+        rows = self._index.execute(
+            "SELECT key, model, params, seed, steps FROM runs WHERE code_version = ?",
+            (code_version(),),
+        ).fetchall()
+        wanted = _plain(params)
+        entries = []
+        for key, model, encoded, seed, steps in rows:
+            run_params = json.loads(encoded)
+            if all(run_params.get(name) == value for name, value in wanted.items()):
+                entries.append((key, model, run_params, seed, steps))
+        return entries
+
+    def size(self):
+        return self._index.execute("SELECT COALESCE(SUM(size), 0) FROM runs").fetchone()[0]
+
+    def evict(self):
+        """
+        Drop least recently used runs until the cache fits in max_bytes;
+        runs of older code versions go first.
+        """
+        if self.max_bytes is None:
+            return
+        excess = self.size() - self.max_bytes
+        if excess <= 0:
+            return
+        rows = self._index.execute(
+            "SELECT key, size FROM runs ORDER BY code_version = ?, last_access",
+            (code_version(),),
+        ).fetchall()
+        for key, size in rows:
+            if excess <= 0:
+                break
+            self._forget(key)
+            excess -= size
+
+    def _forget(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+        with self._index:
+            self._index.execute("DELETE FROM runs WHERE key = ?", (key,))
@@ -0,0 +1,53 @@
+# Snapshots of a running model, to restart it or branch scenarios off it.
+import os
+import pickle
+
+# Model parameters that fix the grid; a snapshot only restores into a model
+# with the same values.
+GRID_PARAMETERS = ("width", "height")
+
+
+class ModelSnapshot:
+    """
+    Complete state of an EpsteinNetworkCivilViolence at one point of a run,
+    as returned by its `snapshot()` method. Agents are stored as one array
+    per attribute, in schedule order; attributes every citizen shares with
+    the model (alpha, vision, ...) are taken from the parameters on restore,
+    so forks can change them.
+    Attributes:
+        parameters: constructor keyword arguments of the model.
+        state: model level state: iteration, legitimacy, cop density,
+            outburst counters, scheduler clock and tally.
+        agents: attribute name -> per-agent array.
+        streams: state of the model's random streams.
+        data: state of the model's data collector.
+    """
+
+    def __init__(self, parameters, state, agents, streams, data):
+        self.parameters = parameters
+        self.state = state
+        self.agents = agents
+        self.streams = streams
+        self.data = data
+
+    @property
+    def iteration(self):
+        return self.state["iteration"]
+
+    def save(self, path):
+        """
+        Write the snapshot to `path`; the file is replaced atomically, so an
+        interrupted save leaves the previous snapshot intact.
+        """
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            snapshot = pickle.load(f)
+        if not isinstance(snapshot, cls):
+            raise ValueError(f"{path} does not hold a model snapshot")
+        return snapshot
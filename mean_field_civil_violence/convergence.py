@@ -0,0 +1,114 @@
+# Steady-state detection for stopping runs early.
+import numpy as np
+
+# Iteration at which legitimacy_mode 'drop' applies the shock.
+LEGITIMACY_DROP_ITERATION = 300
+
+
+class ConvergenceMonitor:
+    """
+    Decides when a run has reached a steady state, from the model reporters
+    collected so far. After every step the last `window` collections must
+    show all of:
+        - a share of stable citizens of at least `stable_share`,
+        - a variance of Active_Ratio of at most `active_ratio_variance`,
+        - a change of Mean_Legitimacy over the window of at most
+          `legitimacy_drift`.
+    A criterion set to None is not checked. Runs whose legitimacy or cop
+    density is still scheduled to change (gradual modes, or a drop not yet
+    applied, or applied less than a window ago) never count as converged.
+    Args:
+        window: number of steps the criteria are evaluated over.
+        stable_share: minimum share of citizens with is_stable.
+        active_ratio_variance: maximum variance of Active_Ratio.
+        legitimacy_drift: maximum absolute change of the citizens' mean
+            regime legitimacy.
+        min_steps: steps run before convergence is checked at all.
+        pad: once converged, report the model series as if the run had
+            gone on to max_iters, repeating the last collected values, so
+            they line up with runs that did not stop early.
+    """
+
+    def __init__(
+            self,
+            window=50,
+            stable_share=0.9,
+            active_ratio_variance=1e-4,
+            legitimacy_drift=1e-3,
+            min_steps=0,
+            pad=False,
+    ):
+        self.window = window
+        self.stable_share = stable_share
+        self.active_ratio_variance = active_ratio_variance
+        self.legitimacy_drift = legitimacy_drift
+        self.min_steps = min_steps
+        self.pad = pad
+
+    @staticmethod
+    def scheduled_changes(model, window):
+        """
+        Whether legitimacy or cop density still change by schedule, or
+        changed less than `window` steps ago.
+        """
+        return (
+            model.legitimacy_mode == "gradual"
+            or model.cop_density_mode == "gradual"
+            or (
+                model.legitimacy_mode == "drop"
+                and model.iteration <= LEGITIMACY_DROP_ITERATION + window
+            )
+        )
+
+    def check(self, model):
+        """
+        Reason the model has converged, or None if it has not.
+        """
+        data = model.datacollector
+        if model.iteration < max(self.min_steps, self.window) or self.scheduled_changes(model, self.window):
+            return None
+        reasons = []
+        if self.stable_share is not None:
+            share = data.recent("Stable Agents", 1)[0] / model.total_citizen
+            if share < self.stable_share:
+                return None
+            reasons.append(f"stable share {share:.3g}")
+        if self.active_ratio_variance is not None:
+            variance = float(np.var(data.recent("Active_Ratio", self.window)))
+            if variance > self.active_ratio_variance:
+                return None
+            reasons.append(f"Active_Ratio variance {variance:.3g}")
+        if self.legitimacy_drift is not None:
+            legitimacy = data.recent("Mean_Legitimacy", self.window + 1)
+            drift = abs(float(legitimacy[-1] - legitimacy[0]))
+            if drift > self.legitimacy_drift:
+                return None
+            reasons.append(f"legitimacy drift {drift:.3g}")
+        return (
+            f"steady state at iteration {model.iteration} over {self.window} steps: "
+            + ", ".join(reasons)
+        )
+
+
+def update_running(model):
+    """
+    Stop `model` once it is past max_iters or its convergence monitor (if
+    any) finds a steady state, recording why in `model.stop_reason` and
+    closing its trajectory.
+    """
+    if model.iteration > model.max_iters:
+        stop(model, "max_iters")
+        return
+    if model.convergence is None:
+        return
+    reason = model.convergence.check(model)
+    if reason is not None:
+        stop(model, reason)
+        if model.convergence.pad:
+            model.datacollector.pad_to = model.max_iters + 2
+
+
+def stop(model, reason):
+    model.running = False
+    model.stop_reason = reason
+    model.datacollector.close()
@@ -0,0 +1,275 @@
+# Columnar data collection for the civil violence models.
+import copy
+import numbers
+
+import numpy as np
+
+BREEDS = ("citizen", "cop")
+CONDITIONS = ("Quiescent", "Active")
+MISSING_CODE = 255
+
+# Integer codes of breeds and conditions: their index in BREEDS and CONDITIONS.
+CITIZEN, COP = range(len(BREEDS))
+QUIESCENT, ACTIVE = range(len(CONDITIONS))
+
+# Compact dtype of every agent snapshot column.
+AGENT_DTYPES = {
+    "unique_id": np.uint32,
+    "x": np.uint16,
+    "y": np.uint16,
+    "breed": np.uint8,
+    "jail_sentence": np.uint16,
+    "condition": np.uint8,
+    "arrest_probability": np.float32,
+    "regime_legitimacy": np.float32,
+}
+
+# Columns stored as codes into these labels.
+AGENT_CODES = {"breed": BREEDS, "condition": CONDITIONS}
+
+
+def encode(labels, values):
+    """
+    uint8 codes of string `values`; anything not in `labels` (e.g. None)
+    becomes MISSING_CODE.
+    """
+    lookup = {label: code for code, label in enumerate(labels)}
+    return np.array([lookup.get(value, MISSING_CODE) for value in values], dtype=np.uint8)
+
+
+def decode(labels, codes):
+    """
+    Categorical of the labels behind `codes`, missing codes as NaN.
+    """
+    import pandas as pd
+
+    codes = np.where(codes == MISSING_CODE, -1, codes).astype(np.int8)
+    return pd.Categorical.from_codes(codes, categories=list(labels))
+
+
+class ColumnarDataCollector:
+    """
+    Drop-in replacement for mesa.DataCollector that writes numeric model
+    reporters into preallocated NumPy columns and takes agent snapshots
+    only when asked to.
+    Integral reporters get int64 columns, turned into float64 ones the first
+    time a reporter returns a non-integral number. Reporters returning
+    anything but a number (such as the Waiting_Times list) are kept in a
+    plain list. Agent snapshots come from the model's `agent_snapshot()`,
+    which returns one array per AGENT_DTYPES column, and are stored with
+    those compact dtypes.
+    Attributes:
+        model_reporters: reporter name -> function of the model.
+        agent_snapshot_every: take an agent snapshot every this many
+            collections; None for no periodic snapshots.
+        agent_snapshot_steps: collections (0 being the initial state) at
+            which to take an agent snapshot in any case.
+        num_collected: number of collections so far.
+        trajectory: optional TrajectoryStore every collection's agent state
+            is appended to.
+        pad_to: when set, model reporter series shorter than this are
+            reported padded with their last value.
+    """
+
+    def __init__(self, model_reporters=None, agent_snapshot_every=None,
+                 agent_snapshot_steps=(), capacity=1024):
+        self.model_reporters = dict(model_reporters or {})
+        self.agent_snapshot_every = agent_snapshot_every
+        self.agent_snapshot_steps = set(agent_snapshot_steps or ())
+        self.num_collected = 0
+        self._capacity = max(1, capacity)
+        self._columns = {}
+        self._objects = {}
+        self._snapshot_steps = []
+        self._snapshots = []
+        self.trajectory = None
+        self.pad_to = None
+
+    def _store(self, name, value):
+        if name not in self._columns and name not in self._objects:
+            if isinstance(value, numbers.Integral):
+                self._columns[name] = np.zeros(self._capacity, dtype=np.int64)
+            elif isinstance(value, numbers.Real):
+                self._columns[name] = np.full(self._capacity, np.nan)
+            else:
+                self._objects[name] = []
+        if name in self._objects:
+            self._objects[name].append(value)
+            return
+        column = self._columns[name]
+        if column.dtype.kind == "i" and not isinstance(value, numbers.Integral):
+            # a reporter that started out integral, e.g. a legitimacy of 1
+            column = column.astype(np.float64)
+            column[self.num_collected:] = np.nan
+            self._columns[name] = column
+        if self.num_collected == len(column):
+            column = np.concatenate([column, np.zeros_like(column)])
+            self._columns[name] = column
+        column[self.num_collected] = value
+
+    def wants_snapshot(self, step):
+        return step in self.agent_snapshot_steps or (
+            self.agent_snapshot_every is not None and step % self.agent_snapshot_every == 0
+        )
+
+    def collect(self, model):
+        """
+        Collect all the data for the given model object.
+        """
+        for name, reporter in self.model_reporters.items():
+            self._store(name, reporter(model))
+        snapshot = None
+        if self.trajectory is not None:
+            snapshot = model.agent_snapshot()
+            self.trajectory.append(snapshot)
+        if self.wants_snapshot(self.num_collected):
+            if snapshot is None:
+                snapshot = model.agent_snapshot()
+            self._snapshot_steps.append(self.num_collected)
+            self._snapshots.append({
+                name: np.asarray(snapshot[name]).astype(dtype, copy=False)
+                for name, dtype in AGENT_DTYPES.items()
+            })
+        self.num_collected += 1
+
+    def close(self):
+        """
+        Close the trajectory, if any; later collections are not recorded in
+        it.
+        """
+        if self.trajectory is not None:
+            self.trajectory.close()
+            self.trajectory = None
+
+    def get_state(self):
+        """
+        Everything collected so far, for model snapshots.
+        """
+        return copy.deepcopy({
+            "num_collected": self.num_collected,
+            "columns": {
+                name: column[:self.num_collected] for name, column in self._columns.items()
+            },
+            "objects": self._objects,
+            "pad_to": self.pad_to,
+            "snapshot_steps": self._snapshot_steps,
+            "snapshots": self._snapshots,
+        })
+
+    def set_state(self, state):
+        """
+        Replace the collected data by a `get_state()`; later collections
+        append to it.
+        """
+        state = copy.deepcopy(state)
+        self.num_collected = state["num_collected"]
+        self._capacity = max(self._capacity, 2 * self.num_collected, 1)
+        self._columns = {}
+        for name, values in state["columns"].items():
+            column = np.zeros(self._capacity, dtype=values.dtype)
+            if column.dtype.kind == "f":
+                column.fill(np.nan)
+            column[:self.num_collected] = values
+            self._columns[name] = column
+        self._objects = state["objects"]
+        self.pad_to = state["pad_to"]
+        self._snapshot_steps = state["snapshot_steps"]
+        self._snapshots = state["snapshots"]
+
+    def recent(self, name, count):
+        """
+        The last `count` values of a numeric reporter.
+        """
+        return self._columns[name][max(0, self.num_collected - count):self.num_collected]
+
+    def _padding(self):
+        if self.pad_to is None or self.num_collected == 0:
+            return 0
+        return max(0, self.pad_to - self.num_collected)
+
+    def _numeric_vars(self):
+        padding = self._padding()
+        model_vars = {}
+        for name, column in self._columns.items():
+            values = column[:self.num_collected]
+            if padding:
+                values = np.concatenate([values, np.repeat(values[-1:], padding)])
+            model_vars[name] = values
+        return model_vars
+
+    @property
+    def model_vars(self):
+        """
+        Reporter name -> collected values, as in mesa.DataCollector.
+        """
+        model_vars = self._numeric_vars()
+        padding = self._padding()
+        for name, values in self._objects.items():
+            model_vars[name] = values + values[-1:] * padding
+        return {name: model_vars[name] for name in self.model_reporters if name in model_vars}
+
+    def get_model_vars_dataframe(self):
+        import pandas as pd
+
+        return pd.DataFrame(self.model_vars)
+
+    def get_agent_vars_dataframe(self):
+        """
+        One row per agent and snapshot, indexed by (Step, AgentID), with
+        breed and condition as categoricals.
+        """
+        import pandas as pd
+
+        frames = []
+        for step, snapshot in zip(self._snapshot_steps, self._snapshots):
+            columns = {}
+            for name, values in snapshot.items():
+                if name == "unique_id":
+                    continue
+                if name in AGENT_CODES:
+                    columns[name] = decode(AGENT_CODES[name], values)
+                else:
+                    columns[name] = values
+            index = pd.MultiIndex.from_arrays(
+                [np.full(len(snapshot["unique_id"]), step), snapshot["unique_id"]],
+                names=["Step", "AgentID"],
+            )
+            frames.append(pd.DataFrame(columns, index=index))
+        if not frames:
+            return pd.DataFrame(
+                columns=[name for name in AGENT_DTYPES if name != "unique_id"],
+                index=pd.MultiIndex.from_arrays([[], []], names=["Step", "AgentID"]),
+            )
+        return pd.concat(frames)
+
+    def agent_arrays(self):
+        """
+        Agent snapshots stacked per column as (snapshots, agents) arrays,
+        plus the collection step of every snapshot.
+        """
+        arrays = {"snapshot_steps": np.array(self._snapshot_steps, dtype=np.int64)}
+        for name, dtype in AGENT_DTYPES.items():
+            if self._snapshots:
+                arrays[name] = np.stack([snapshot[name] for snapshot in self._snapshots])
+            else:
+                arrays[name] = np.empty((0, 0), dtype=dtype)
+        return arrays
+
+    def to_npz(self, path):
+        """
+        Write numeric model reporters and agent snapshots to one .npz file;
+        agent columns are prefixed with "agent_".
+        """
+        arrays = self._numeric_vars()
+        arrays.update({"agent_" + name: values for name, values in self.agent_arrays().items()})
+        np.savez_compressed(path, **arrays)
+
+    def to_parquet(self, model_path, agent_path=None):
+        """
+        Write the model reporters (and the agent snapshots when `agent_path`
+        is given) to Parquet files. Needs a Parquet engine for pandas.
+        """
+        model_vars = self.get_model_vars_dataframe()
+        model_vars[[name for name in model_vars if name in self._columns]].to_parquet(model_path)
+        if agent_path is not None:
+            self.get_agent_vars_dataframe().to_parquet(agent_path)
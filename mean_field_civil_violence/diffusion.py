@@ -0,0 +1,176 @@
+# Whole-grid mean field legitimacy diffusion.
+import numpy as np
+
+from mean_field_civil_violence.space import get_neighborhood_table, toroidal_window_sum
+
+
+def initial_legitimacy(
+        citizens,
+        legitimacy,
+        legitimacy_type="basic",
+        legitimacy_width=0.1,
+        legitimacy_matrix=None,
+        rng=None,
+):
+    """
+    Regime legitimacy field of freshly created citizens, as the models
+    initialize it.
+    Args:
+        citizens: boolean (width, height) mask of the cells holding a citizen.
+        legitimacy: the model's legitimacy.
+        legitimacy_type: "basic", "heterogeneous" or "by_regions".
+        legitimacy_width: half width of the heterogeneous spread.
+        legitimacy_matrix: regional legitimacies for "by_regions", rows
+            along y and columns along x.
+        rng: RandomStream for the heterogeneous draws, taken one per citizen
+            in cell order.
+    Returns:
+        (field, average_legitimacy): the field, zero outside `citizens`,
+        and the legitimacy the citizens measure their stability against.
+    """
+    citizens = np.asarray(citizens, dtype=bool)
+    width, height = citizens.shape
+    field = np.where(citizens, float(legitimacy), 0.0)
+    average_legitimacy = legitimacy
+    if legitimacy_type == "heterogeneous":
+        low = max(0, legitimacy - legitimacy_width)
+        high = min(1, legitimacy + legitimacy_width)
+        field[citizens] = low + (high - low) * rng.uniforms(int(citizens.sum()))
+    elif legitimacy_type == "by_regions" and legitimacy_matrix is not None:
+        legitimacy_matrix = np.asarray(legitimacy_matrix)
+        region_height = height / legitimacy_matrix.shape[0]
+        region_width = width / legitimacy_matrix.shape[1]
+        x, y = np.nonzero(citizens)
+        region_x = (x // region_width).astype(np.int64)
+        region_y = (y // region_height).astype(np.int64)
+        field[citizens] = legitimacy_matrix[region_y, region_x]
+        average_legitimacy = np.mean(legitimacy_matrix)
+    return field, average_legitimacy
+
+
+def stencil_sum(field):
+    """
+    Sum of `field` over the 3x3 toroidal window of every cell, as
+    toroidal_window_sum(field, 1) but from shifted copies rather than
+    running sums, so large grids lose no precision.
+    """
+    field = np.asarray(field, dtype=np.float64)
+    if min(field.shape[-2:]) < 3:
+        return toroidal_window_sum(field, 1)
+    out = field
+    for axis in (-2, -1):
+        out = out + np.roll(out, 1, axis=axis) + np.roll(out, -1, axis=axis)
+    return out
+
+
+def mean_field_step(legitimacy, citizens, legitimacy_impact):
+    """
+    Mean field update of every citizen at once: each moves its regime
+    legitimacy `legitimacy_impact` of the way to the mean over itself and
+    the citizens of its 3x3 window, clamped to [0, 1]. Citizens without a
+    neighbor keep theirs.
+    Args:
+        legitimacy: (..., width, height) regime legitimacy field; only
+            citizen cells are read. Leading axes are a batch.
+        citizens: boolean mask of the same shape, the cells holding a
+            citizen, jailed ones included.
+        legitimacy_impact: scalar or field of the citizens' impact.
+    Returns:
+        The updated field, zero outside `citizens`.
+    """
+    citizens = np.asarray(citizens, dtype=bool)
+    legitimacy = np.where(citizens, legitimacy, 0.0)
+    return mean_field_update(
+        legitimacy, citizens, stencil_sum(citizens), stencil_sum(legitimacy), legitimacy_impact
+    )
+
+
+def mean_field_update(legitimacy, citizens, count, total, legitimacy_impact):
+    """
+    Element-wise part of `mean_field_step`, given the 3x3 window sums
+    `count` of the citizen mask and `total` of the (masked) legitimacy.
+    """
+    mean_legitimacy = total / np.maximum(count, 1)
+    updated = np.clip(legitimacy + legitimacy_impact * (mean_legitimacy - legitimacy), 0, 1)
+    return np.where(citizens & (count > 1), updated, legitimacy)
+
+
+def diffuse(legitimacy, citizens, legitimacy_impact, steps):
+    """
+    Apply `mean_field_step` `steps` times to a fixed population and return
+    the final field; the diffusion alone, without activation, arrests or
+    movement.
+    """
+    for _ in range(steps):
+        legitimacy = mean_field_step(legitimacy, citizens, legitimacy_impact)
+    return legitimacy
+
+
+class LegitimacyField:
+    """
+    Regime legitimacy field of the citizens on a torus, zero elsewhere, with
+    its citizen mask, kept up to date by CivilViolenceGrid as citizens are
+    placed, removed and refreshed. In the random activation a citizen reads
+    her mean field update off the field (`update_at`), the same update
+    `mean_field_step` gives every citizen at once, instead of collecting her
+    neighbors.
+    Args:
+        width, height: grid shape
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self._legitimacy = [0.0] * (width * height)
+        self._citizens = bytearray(width * height)
+        self._table = get_neighborhood_table(width, height, True, 1)
+
+    def set(self, pos, legitimacy):
+        """
+        A citizen of regime legitimacy `legitimacy` stands at `pos`.
+        """
+        x, y = pos
+        index = x * self.height + y
+        self._legitimacy[index] = legitimacy
+        self._citizens[index] = 1
+
+    def clear(self, pos):
+        """
+        No citizen stands at `pos`.
+        """
+        x, y = pos
+        index = x * self.height + y
+        self._legitimacy[index] = 0.0
+        self._citizens[index] = 0
+
+    def update_at(self, pos, legitimacy_impact):
+        """
+        Regime legitimacy of the citizen at `pos` after her mean field
+        update, given her `legitimacy_impact`. Neighbors are summed in
+        neighborhood order and she comes last, as the per-agent update
+        does, so both give the same float.
+        """
+        x, y = pos
+        index = x * self.height + y
+        legitimacy = self._legitimacy[index]
+        field = self._legitimacy
+        citizens = self._citizens
+        count = 0
+        total = 0
+        for cell in self._table.row(index):
+            if citizens[cell]:
+                count += 1
+                total += field[cell]
+        if not count:
+            return legitimacy
+        mean_legitimacy = (total + legitimacy) / (count + 1)
+        return max(0, min(1, legitimacy + legitimacy_impact * (mean_legitimacy - legitimacy)))
+
+    def arrays(self):
+        """
+        (legitimacy, citizens) as (width, height) arrays, for
+        `mean_field_step`.
+        """
+        legitimacy = np.array(self._legitimacy, dtype=np.float64).reshape(self.width, self.height)
+        citizens = np.frombuffer(bytes(self._citizens), dtype=np.uint8).reshape(self.width, self.height)
+        return legitimacy, citizens.astype(bool)
@@ -0,0 +1,170 @@
+# Replicated runs of the civil violence models over a process pool.
+import numbers
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from mean_field_civil_violence.model import EpsteinNetworkCivilViolence
+from mean_field_civil_violence.rng import spawn_seeds
+
+
+class EnsembleResult:
+    """
+    Model reporter series of an ensemble of replicated runs.
+    Attributes:
+        series: reporter name -> (runs, steps + 1) array, one row per
+            successful run in run index order. Runs that stopped early are
+            padded with NaN.
+        run_indices: index of the run behind each row of `series`.
+        seeds: seed of every run, failed ones included.
+        failures: (run index, seed, formatted traceback) of every run that
+            raised.
+    """
+
+    def __init__(self, series, run_indices, seeds, failures):
+        self.series = series
+        self.run_indices = run_indices
+        self.seeds = seeds
+        self.failures = failures
+
+    def __getitem__(self, reporter):
+        return self.series[reporter]
+
+    def mean_and_standard_error(self, reporter):
+        """
+        Mean over runs of a reporter series and its standard error, as the
+        notebooks plot them.
+        """
+        data = self.series[reporter]
+        runs = np.sum(~np.isnan(data), axis=0)
+        return np.nanmean(data, axis=0), np.nanstd(data, axis=0) / np.sqrt(runs)
+
+
+def run_replicate(model_cls, model_params, steps, reporters, seed):
+    """
+    Build one model with `seed`, step it `steps` times (or until it stops
+    running) and return the requested model reporter series; all numeric
+    model reporters when `reporters` is None.
+    """
+    model = model_cls(**model_params, seed=seed)
+    for _ in range(steps):
+        if not model.running:
+            break
+        model.step()
+    model_vars = model.datacollector.model_vars
+    if reporters is None:
+        reporters = [
+            name for name, values in model_vars.items()
+            if all(isinstance(value, numbers.Real) for value in values)
+        ]
+    # series padded by a convergence monitor may run past `steps`
+    return {
+        name: np.asarray(model_vars[name], dtype=np.float64)[:steps + 1] for name in reporters
+    }
+
+
+def _stack(rows, length):
+    data = np.full((len(rows), length), np.nan)
+    for i, row in enumerate(rows):
+        data[i, :len(row)] = row
+    return data
+
+
+def run_ensemble(
+        model_params,
+        num_runs,
+        steps,
+        reporters=("Active_Ratio",),
+        processes=None,
+        seed=None,
+        progress=False,
+        model_cls=EpsteinNetworkCivilViolence,
+        cache=None,
+):
+    """
+    Run `num_runs` replicates of a model configuration over a process pool.
+    Args:
+        model_params: keyword arguments of the model constructor.
+        num_runs: number of replicates.
+        steps: number of steps of every replicate.
+        reporters: model reporters to return; only these are sent back from
+            the workers.
+        processes: worker processes, os.cpu_count() by default; 1 runs
+            everything in this process.
+        seed: ensemble seed the replicate seeds are spawned from.
+        progress: show a tqdm progress bar.
+        model_cls: model class, EpsteinNetworkCivilViolence or any class
+            taking the same parameters and a `seed` keyword.
+        cache: optional RunCache. Replicates found in it are not simulated
+            and the ones simulated are added to it. Only seeded ensembles
+            use it: without a seed the replicates cannot be asked for
+            again, so the cache is neither read nor written.
+    Returns:
+        EnsembleResult. A replicate that raises is recorded in `failures`
+        and the others carry on.
+    """
+    reporters = list(reporters)
+    seeds = spawn_seeds(seed, num_runs)
+    if seed is None:
+        cache = None
+    processes = processes or os.cpu_count()
+    results = {}
+    failures = []
+
+    bar = None
+    if progress:
+        from tqdm import tqdm
+        bar = tqdm(total=num_runs)
+
+    def record(run_index, run):
+        try:
+            series = run()
+            if cache is not None:
+                cache.put(model_cls, model_params, seeds[run_index], steps, series)
+            results[run_index] = {name: series[name] for name in reporters}
+        except Exception:
+            failures.append((run_index, seeds[run_index], traceback.format_exc()))
+        if bar is not None:
+            bar.update()
+
+    pending = []
+    for run_index in range(num_runs):
+        cached = None
+        if cache is not None:
+            cached = cache.get(model_cls, model_params, seeds[run_index], steps, reporters)
+        if cached is None:
+            pending.append(run_index)
+        else:
+            results[run_index] = cached
+            if bar is not None:
+                bar.update()
+
+    # with a cache, keep every numeric reporter so later requests can hit
+    returned = None if cache is not None else reporters
+    if processes == 1:
+        for run_index in pending:
+            record(run_index, lambda: run_replicate(
+                model_cls, model_params, steps, returned, seeds[run_index]
+            ))
+    elif pending:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = {
+                executor.submit(
+                    run_replicate, model_cls, model_params, steps, returned, seeds[run_index]
+                ): run_index
+                for run_index in pending
+            }
+            for future in as_completed(futures):
+                record(futures[future], future.result)
+    if bar is not None:
+        bar.close()
+
+    run_indices = sorted(results)
+    failures.sort()
+    series = {
+        name: _stack([results[i][name] for i in run_indices], steps + 1)
+        for name in reporters
+    }
+    return EnsembleResult(series, run_indices, seeds, failures)
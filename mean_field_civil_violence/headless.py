@@ -0,0 +1,103 @@
+# Headless runs: imports without visualization and notebook dependencies.
+import contextlib
+import importlib.abc
+import importlib.util
+import json
+import subprocess
+import sys
+
+# Modules mesa imports at start up but a headless run only needs, if at all,
+# on first use (data frames, network grids): loaded lazily.
+LAZY_MODULES = ("pandas", "networkx")
+# Optional modules mesa imports for its browser visualization: left out of
+# headless processes.
+SKIPPED_MODULES = ("mesa_viz_tornado",)
+
+# Seconds `python -m mean_field_civil_violence import-time` allows for
+# importing the headless runner, models included.
+IMPORT_BUDGET = 0.3
+
+
+class _DeferringFinder(importlib.abc.MetaPathFinder):
+    """
+    Meta path finder wrapping the loaders of LAZY_MODULES in LazyLoader and
+    failing imports of SKIPPED_MODULES, which mesa treats as not installed.
+    """
+
+    def find_spec(self, name, path, target=None):
+        top = name.partition(".")[0]
+        if top in SKIPPED_MODULES:
+            raise ImportError(f"{name} is not imported by headless runs", name=name)
+        if name not in LAZY_MODULES:
+            return None
+        sys.meta_path.remove(self)
+        try:
+            spec = importlib.util.find_spec(name)
+        finally:
+            sys.meta_path.insert(0, self)
+        if spec is None or spec.loader is None:
+            return spec
+        spec.loader = importlib.util.LazyLoader(spec.loader)
+        return spec
+
+
+@contextlib.contextmanager
+def deferred_imports():
+    """
+    Within the block, LAZY_MODULES load on first attribute access and
+    SKIPPED_MODULES are not imported at all. Modules imported in the block
+    stay so afterwards, so enter it before anything imports mesa.
+    """
+    finder = _DeferringFinder()
+    sys.meta_path.insert(0, finder)
+    try:
+        yield
+    finally:
+        sys.meta_path.remove(finder)
+
+
+def import_runner():
+    """
+    Import the ensemble runner and the models the headless way.
+    """
+    with deferred_imports():
+        import mean_field_civil_violence.ensemble  # noqa: F401
+        import mean_field_civil_violence.vectorized  # noqa: F401
+
+
+def measure_import_time(repeats=5):
+    """
+    Best wall time of `import_runner` in fresh interpreters, in seconds.
+    """
+    code = (
+        "import time\n"
+        "start = time.perf_counter()\n"
+        "from mean_field_civil_violence.headless import import_runner\n"
+        "import_runner()\n"
+        "print(time.perf_counter() - start)\n"
+    )
+    times = []
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        ).stdout
+        times.append(float(output))
+    return min(times)
+
+
+def load_parameters(path):
+    """
+    Run description from a JSON parameter file:
+        {"model": "EpsteinNetworkCivilViolence", "params": {...},
+         "runs": 10, "steps": 500, "seed": 0, "reporters": ["Active_Ratio"]}
+    Only "params" is required. Lists given for legitimacy_matrix become
+    arrays, as the models expect.
+    """
+    with open(path) as f:
+        description = json.load(f)
+    params = dict(description.get("params", {}))
+    if params.get("legitimacy_matrix") is not None:
+        import numpy as np
+        params["legitimacy_matrix"] = np.asarray(params["legitimacy_matrix"])
+    description["params"] = params
+    return description
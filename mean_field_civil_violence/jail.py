@@ -0,0 +1,90 @@
+# Jailed citizens and their release iterations.
+import mesa
+
+
+class JailWheel:
+    """
+    Timing wheel of jailed citizens: a ring of buckets indexed by release
+    iteration, so admitting, releasing and counting prisoners cost nothing
+    per jailed citizen and per step.
+    Prisoners stay in the schedule: in the random activation JailActivation
+    discharges each one at her own turn in the iteration of her release, as
+    the jail sentence countdown did, and the buckets only hold those still
+    due when `release` is called at the end of the step (synchronous
+    activation).
+    Args:
+        horizon: largest number of iterations ahead a release may be
+            scheduled.
+    Attributes:
+        clock: last iteration whose releases were processed.
+    """
+
+    def __init__(self, horizon):
+        # dicts as insertion ordered sets, so a discharge is O(1)
+        self._buckets = [{} for _ in range(horizon + 1)]
+        self._count = 0
+        self.clock = -1
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        """
+        Prisoners in release order.
+        """
+        size = len(self._buckets)
+        for offset in range(1, size + 1):
+            yield from self._buckets[(self.clock + offset) % size]
+
+    def admit(self, agent, release):
+        """
+        Jail `agent` until iteration `release`.
+        """
+        if not self.clock < release <= self.clock + len(self._buckets):
+            raise ValueError(f"Release at {release} is outside the wheel")
+        self._buckets[release % len(self._buckets)][agent] = None
+        agent.release = release
+        self._count += 1
+
+    def discharge(self, agent):
+        """
+        Let `agent` out before the end of the iteration of her release.
+        """
+        del self._buckets[agent.release % len(self._buckets)][agent]
+        agent.release = None
+        self._count -= 1
+
+    def release(self, iteration):
+        """
+        Advance the clock to `iteration` and return the prisoners still due
+        then, in the order they were admitted.
+        """
+        bucket = list(self._buckets[iteration % len(self._buckets)])
+        for agent in bucket:
+            self.discharge(agent)
+        self.clock = iteration
+        return bucket
+
+
+class JailActivation(mesa.time.RandomActivation):
+    """
+    RandomActivation that shuffles every agent, jailed citizens included,
+    so the order and the draws are those of the original model, but only
+    steps the free ones. A prisoner whose release is due is discharged when
+    the loop reaches her place in the order, where the jail sentence
+    countdown used to free her; the others are passed over without a call.
+    Agents without a jail term have a `release` of None.
+    """
+
+    def step(self):
+        self._agents.shuffle(inplace=True)
+        model = self.model
+        iteration = model.iteration
+        for agent in self._agents:
+            release = agent.release
+            if release is None:
+                agent.step()
+            elif release == iteration:
+                model.release_prisoner(agent)
+        self.steps += 1
+        self.time += 1
@@ -0,0 +1,524 @@
+# Compiled per-agent step loop for the asynchronous (random activation) model.
+import math
+import types
+
+import numpy as np
+
+from mean_field_civil_violence.datacollection import ACTIVE, CITIZEN, COP, QUIESCENT
+from mean_field_civil_violence.space import get_neighborhood_table
+from mean_field_civil_violence.vectorized import EMPTY, MAX_TRIES, VectorizedNetworkCivilViolence
+
+try:
+    import numba
+except ImportError:  # the kernels then run as plain Python
+    numba = None
+
+KERNEL_BACKENDS = ("python", "numba")
+
+# Indices of the streams in the `used` counters of `step_agents`.
+SCHEDULE, ACTIVATION, JAIL, MOVEMENT = range(4)
+
+# Rows of the `windows` counts: cops and actives within citizen vision of
+# every cell, and actives within cop vision.
+CITIZEN_COPS, CITIZEN_ACTIVES, COP_ACTIVES = range(3)
+
+# Model arrays `step_agents` works on, in the order of its arguments.
+KERNEL_STATE = (
+    "order",
+    "cell",
+    "occupant",
+    "breed",
+    "hardship",
+    "risk_aversion",
+    "regime_legitimacy",
+    "average_legitimacy",
+    "condition",
+    "release",
+    "stepped_at",
+    "is_stable",
+    "arrest_probability",
+    "grievance",
+    "targets",
+    "windows",
+)
+
+# Kernels compiled together by `compile_kernels`; they call each other by
+# these names.
+KERNEL_FUNCTIONS = (
+    "randrange",
+    "wrap",
+    "neighbor",
+    "add_to_window",
+    "count_windows",
+    "sample_empty_cell",
+    "sample_empty_cell_near",
+    "move_agent",
+    "step_citizen",
+    "step_cop",
+    "step_agents",
+)
+
+
+def randrange(draws, used, stream, n):
+    """
+    RandomStream.randrange on the pre-generated `draws` of `stream`.
+    """
+    value = int(draws[used[stream]] * n)
+    used[stream] += 1
+    return min(value, n - 1)
+
+
+def wrap(value, size):
+    """
+    `value % size` for the coordinates of a torus, which are rarely more
+    than one lap off, without the cost of an integer division.
+    """
+    if value < 0:
+        value += size
+    elif value >= size:
+        value -= size
+    if 0 <= value < size:
+        return value
+    return value % size
+
+
+def neighbor(origin_x, origin_y, k, offsets, width, height):
+    """
+    Flat index of entry `k` of the neighborhood of (origin_x, origin_y) on
+    the torus, `offsets` holding the dx and dy of a NeighborhoodTable.
+    """
+    return wrap(origin_x + offsets[0][k], width) * height + wrap(origin_y + offsets[1][k], height)
+
+
+def add_to_window(window, center, radius, width, height, delta):
+    """
+    Add `delta` to the entry of `window` of every cell within `radius` of
+    `center`, `center` included.
+    """
+    center_x = center // height
+    center_y = center % height
+    for dx in range(-radius, radius + 1):
+        column = wrap(center_x + dx, width) * height
+        for dy in range(-radius, radius + 1):
+            window[column + wrap(center_y + dy, height)] += delta
+
+
+def count_windows(windows, params, width, height, cell, breed, condition, release):
+    """
+    Recount the `windows` of the cops and free actives: each agent adds one
+    to the cells within the vision radius around her.
+    """
+    for row in range(3):
+        for index in range(width * height):
+            windows[row][index] = 0
+    citizen_vision = int(params[10])
+    cop_vision = int(params[8])
+    for agent in range(len(cell)):
+        if breed[agent] == COP:
+            add_to_window(windows[CITIZEN_COPS], cell[agent], citizen_vision, width, height, 1)
+        elif condition[agent] == ACTIVE and release[agent] < 0:
+            add_to_window(windows[CITIZEN_ACTIVES], cell[agent], citizen_vision, width, height, 1)
+            add_to_window(windows[COP_ACTIVES], cell[agent], cop_vision, width, height, 1)
+
+
+def sample_empty_cell(origin, agent, offsets, width, height, occupant, draws, used):
+    """
+    CivilViolenceGrid.sample_empty_cell over the neighborhood `offsets`,
+    the cell `agent` stands on counting as empty unless it is `origin`.
+    """
+    n = len(offsets[0])
+    if n == 0:
+        return EMPTY
+    origin_x = origin // height
+    origin_y = origin % height
+    for _ in range(MAX_TRIES):
+        cell = neighbor(origin_x, origin_y, randrange(draws, used, MOVEMENT, n), offsets, width, height)
+        if cell != origin and (occupant[cell] == EMPTY or occupant[cell] == agent):
+            return cell
+    count = 0
+    for k in range(n):
+        cell = neighbor(origin_x, origin_y, k, offsets, width, height)
+        if cell != origin and (occupant[cell] == EMPTY or occupant[cell] == agent):
+            count += 1
+    if count == 0:
+        return EMPTY
+    pick = randrange(draws, used, MOVEMENT, count)
+    for k in range(n):
+        cell = neighbor(origin_x, origin_y, k, offsets, width, height)
+        if cell != origin and (occupant[cell] == EMPTY or occupant[cell] == agent):
+            if pick == 0:
+                return cell
+            pick -= 1
+    return EMPTY
+
+
+def sample_empty_cell_near(target, origin, radius, next_offsets, occupant, width, height, draws, used):
+    """
+    CivilViolenceGrid.sample_empty_cell_near over the neighborhood
+    `next_offsets` of `target`.
+    """
+    n = len(next_offsets[0])
+    origin_x = origin // height
+    origin_y = origin % height
+    target_x = target // height
+    target_y = target % height
+    for _ in range(n):
+        cell = neighbor(target_x, target_y, randrange(draws, used, MOVEMENT, n), next_offsets, width, height)
+        if occupant[cell] == EMPTY:
+            dx = abs(cell // height - origin_x)
+            dy = abs(cell % height - origin_y)
+            if min(dx, width - dx) <= radius and min(dy, height - dy) <= radius:
+                return cell
+    count = 0
+    for k in range(n):
+        cell = neighbor(target_x, target_y, k, next_offsets, width, height)
+        if occupant[cell] == EMPTY:
+            dx = abs(cell // height - origin_x)
+            dy = abs(cell % height - origin_y)
+            if min(dx, width - dx) <= radius and min(dy, height - dy) <= radius:
+                count += 1
+    if count == 0:
+        return EMPTY
+    pick = randrange(draws, used, MOVEMENT, count)
+    for k in range(n):
+        cell = neighbor(target_x, target_y, k, next_offsets, width, height)
+        if occupant[cell] == EMPTY:
+            dx = abs(cell // height - origin_x)
+            dy = abs(cell % height - origin_y)
+            if min(dx, width - dx) <= radius and min(dy, height - dy) <= radius:
+                if pick == 0:
+                    return cell
+                pick -= 1
+    return EMPTY
+
+
+def move_agent(agent, target, cell, occupant):
+    occupant[cell[agent]] = EMPTY
+    occupant[target] = agent
+    cell[agent] = target
+
+
+def step_citizen(
+        agent, iteration, params, width, height, cell, occupant, breed, hardship, risk_aversion,
+        regime_legitimacy, average_legitimacy, condition, release, stepped_at, is_stable,
+        arrest_probability, grievance, windows, windowed, citizen_offsets, next_offsets,
+        activation_draws, movement_draws, used,
+):
+    """
+    Inhabitant.step of citizen `agent`. With `windowed`, the cops and
+    actives in vision are read off `windows`, which she keeps up to date.
+    """
+    stepped_at[agent] = iteration
+    origin = cell[agent]
+    origin_x = origin // height
+    origin_y = origin % height
+    legitimacy = regime_legitimacy[agent]
+    is_stable[agent] = abs(legitimacy - average_legitimacy[agent]) < params[7]
+
+    was_active = condition[agent] == ACTIVE
+    cops_in_vision = 0
+    actives_in_vision = 1.0  # citizen counts herself
+    if windowed:
+        cops_in_vision = windows[CITIZEN_COPS][origin]
+        # the window holds her own cell too
+        actives_in_vision += windows[CITIZEN_ACTIVES][origin] - was_active
+    else:
+        dx, dy = citizen_offsets[0], citizen_offsets[1]
+        for k in range(len(dx)):
+            other = occupant[wrap(origin_x + dx[k], width) * height + wrap(origin_y + dy[k], height)]
+            if other == EMPTY:
+                continue
+            if breed[other] == COP:
+                cops_in_vision += 1
+            elif condition[other] == ACTIVE and release[other] < 0:
+                actives_in_vision += 1
+    probability = 1 - math.exp(-1 * params[0] * (cops_in_vision / actives_in_vision))
+    arrest_probability[agent] = probability
+
+    if params[6]:
+        total_legitimacy = 0.0
+        neighbors = 0
+        dx, dy = next_offsets[0], next_offsets[1]
+        for k in range(len(dx)):
+            other = occupant[wrap(origin_x + dx[k], width) * height + wrap(origin_y + dy[k], height)]
+            if other != EMPTY and breed[other] == CITIZEN:
+                total_legitimacy += regime_legitimacy[other]
+                neighbors += 1
+        if neighbors:
+            total_legitimacy += legitimacy
+            mean_legitimacy = total_legitimacy / (neighbors + 1)
+            legitimacy = legitimacy + params[2] * (mean_legitimacy - legitimacy)
+            if legitimacy > 1.0:
+                legitimacy = 1.0
+            if legitimacy < 0.0:
+                legitimacy = 0.0
+
+    agent_grievance = hardship[agent] * (1 - legitimacy)
+    jail_draw = float(randrange(activation_draws, used, ACTIVATION, int(params[4]) + 1))
+    net_risk = risk_aversion[agent] * probability * jail_draw ** params[1]
+    regime_legitimacy[agent] = legitimacy
+    grievance[agent] = agent_grievance
+    if agent_grievance - net_risk > params[3]:
+        condition[agent] = ACTIVE
+    else:
+        condition[agent] = QUIESCENT
+    is_active = condition[agent] == ACTIVE
+    if windowed and is_active != was_active:
+        delta = 1 if is_active else -1
+        add_to_window(windows[CITIZEN_ACTIVES], origin, int(params[10]), width, height, delta)
+        add_to_window(windows[COP_ACTIVES], origin, int(params[8]), width, height, delta)
+
+    if params[5]:
+        # the original model moves twice, both times to a cell that was
+        # empty within vision of origin before the first move
+        for _ in range(2):
+            target = sample_empty_cell(origin, agent, citizen_offsets, width, height, occupant, movement_draws, used)
+            if target != EMPTY:
+                if windowed and is_active and target != cell[agent]:
+                    add_to_window(windows[CITIZEN_ACTIVES], cell[agent], int(params[10]), width, height, -1)
+                    add_to_window(windows[COP_ACTIVES], cell[agent], int(params[8]), width, height, -1)
+                    add_to_window(windows[CITIZEN_ACTIVES], target, int(params[10]), width, height, 1)
+                    add_to_window(windows[COP_ACTIVES], target, int(params[8]), width, height, 1)
+                move_agent(agent, target, cell, occupant)
+
+
+def step_cop(
+        agent, iteration, params, width, height, cell, occupant, breed, condition,
+        release, stepped_at, arrest_probability, windows, windowed, cop_offsets, next_offsets, targets,
+        jail_draws, movement_draws, used,
+):
+    """
+    Police.step of cop `agent`: arrest a random active citizen in vision,
+    or move when there is none. With `windowed`, vision is only scanned
+    when `windows` counts actives in it, and the cop keeps them up to date.
+    """
+    origin = cell[agent]
+    found = 0
+    origin_x = origin // height
+    origin_y = origin % height
+    if not windowed or windows[COP_ACTIVES][origin] > 0:
+        dx, dy = cop_offsets[0], cop_offsets[1]
+        for k in range(len(dx)):
+            other = occupant[wrap(origin_x + dx[k], width) * height + wrap(origin_y + dy[k], height)]
+            if other != EMPTY and breed[other] == CITIZEN and condition[other] == ACTIVE and release[other] < 0:
+                targets[found] = other
+                found += 1
+    if found:
+        arrestee = targets[randrange(jail_draws, used, JAIL, found)]
+        probability = jail_draws[used[JAIL]]
+        used[JAIL] += 1
+        if probability < arrest_probability[arrestee]:
+            sentence = randrange(jail_draws, used, JAIL, int(params[4]) + 1)
+            condition[arrestee] = QUIESCENT
+            if windowed:
+                add_to_window(windows[CITIZEN_ACTIVES], cell[arrestee], int(params[10]), width, height, -1)
+                add_to_window(windows[COP_ACTIVES], cell[arrestee], int(params[8]), width, height, -1)
+            if sentence:
+                # a citizen yet to act this step serves the first
+                # iteration of her sentence at her turn
+                served = 0 if stepped_at[arrestee] == iteration else 1
+                release[arrestee] = iteration + sentence - served
+        # the original model draws a cell next to the arrestee but stays put
+        if sample_empty_cell_near(
+                cell[arrestee], origin, int(params[8]), next_offsets, occupant, width, height, movement_draws, used
+        ) == EMPTY:
+            sample_empty_cell(origin, agent, cop_offsets, width, height, occupant, movement_draws, used)
+    elif params[5]:
+        target = sample_empty_cell(origin, agent, cop_offsets, width, height, occupant, movement_draws, used)
+        if target != EMPTY:
+            if windowed:
+                add_to_window(windows[CITIZEN_COPS], origin, int(params[10]), width, height, -1)
+                add_to_window(windows[CITIZEN_COPS], target, int(params[10]), width, height, 1)
+            move_agent(agent, target, cell, occupant)
+
+
+def step_agents(
+        iteration, params, width, height, order, cell, occupant, breed,
+        hardship, risk_aversion, regime_legitimacy, average_legitimacy, condition, release,
+        stepped_at, is_stable, arrest_probability, grievance, targets, windows, citizen_offsets,
+        cop_offsets, next_offsets, schedule_draws, activation_draws, jail_draws, movement_draws, used,
+):
+    """
+    One step of JailActivation over the agents, on array state. Mirrors
+    EpsteinNetworkCivilViolence draw for draw. `order` is the schedule,
+    jailed citizens included, which keeps the shuffled order from step to
+    step. When the vision windows do not wrap onto themselves, the cops and
+    actives in vision are counted into `windows` once and then updated as
+    agents change, instead of being scanned by every agent.
+    """
+    vision = max(int(params[8]), int(params[10]))
+    windowed = 2 * vision + 1 <= width and 2 * vision + 1 <= height
+    if windowed:
+        count_windows(windows, params, width, height, cell, breed, condition, release)
+
+    # AgentSet.shuffle(inplace=True): Fisher-Yates with the schedule stream
+    for i in range(len(order) - 1, 0, -1):
+        j = randrange(schedule_draws, used, SCHEDULE, i + 1)
+        swap = order[i]
+        order[i] = order[j]
+        order[j] = swap
+
+    for i in range(len(order)):
+        agent = order[i]
+        if release[agent] >= 0:
+            # JailActivation: freed at her turn in the iteration of her release
+            if release[agent] == iteration:
+                release[agent] = EMPTY
+                legitimacy = regime_legitimacy[agent] * params[9]
+                if legitimacy > 1.0:
+                    legitimacy = 1.0
+                if legitimacy < 0.0:
+                    legitimacy = 0.0
+                regime_legitimacy[agent] = legitimacy
+        elif breed[agent] == CITIZEN:
+            step_citizen(
+                agent, iteration, params, width, height, cell, occupant, breed, hardship, risk_aversion,
+                regime_legitimacy, average_legitimacy, condition, release, stepped_at, is_stable,
+                arrest_probability, grievance, windows, windowed, citizen_offsets, next_offsets,
+                activation_draws, movement_draws, used,
+            )
+        else:
+            step_cop(
+                agent, iteration, params, width, height, cell, occupant, breed, condition,
+                release, stepped_at, arrest_probability, windows, windowed, cop_offsets, next_offsets, targets,
+                jail_draws, movement_draws, used,
+            )
+
+
+def compile_kernels():
+    """
+    The kernels compiled with Numba, calling each other's compiled versions;
+    compilation happens on the first call. They never allocate, so they are
+    compiled without Numba's reference counting, which would otherwise
+    count every array argument in and out of every per-agent call.
+    """
+    namespace = dict(globals())
+    for name in KERNEL_FUNCTIONS:
+        function = globals()[name]
+        clone = types.FunctionType(function.__code__, namespace, name, function.__defaults__)
+        namespace[name] = numba.njit(clone, cache=True, _nrt=False)
+    return namespace
+
+
+def get_kernel(backend):
+    """
+    `step_agents` for `backend`: "numba", "python", or "auto" for Numba
+    when it is installed.
+    """
+    if backend == "auto":
+        backend = "numba" if numba is not None else "python"
+    if backend not in KERNEL_BACKENDS:
+        raise ValueError(f"Unknown kernel backend: {backend!r}")
+    if backend == "python":
+        return step_agents
+    if numba is None:
+        raise ImportError("The numba kernel backend needs numba installed")
+    global _compiled
+    if _compiled is None:
+        _compiled = compile_kernels()
+    return _compiled["step_agents"]
+
+
+_compiled = None
+
+
+class KernelNetworkCivilViolence(VectorizedNetworkCivilViolence):
+    """
+    EpsteinNetworkCivilViolence on array state, stepped by a kernel that
+    loops over the agents one at a time in random order, so the asynchronous
+    semantics are kept: every agent sees the changes of those stepped before
+    it. The kernel takes its random numbers from blocks of the model's
+    random streams and consumes them exactly as the agents do, so for the
+    same seed a run reproduces EpsteinNetworkCivilViolence (with the default
+    random activation) draw for draw, whichever backend steps it.
+    Reporters and parameters are those of VectorizedNetworkCivilViolence.
+    Attributes:
+        backend: "numba" compiles the kernel (on the first step of the
+            process), "python" runs the same code uncompiled, "auto" picks
+            Numba when it is installed.
+    """
+
+    def __init__(self, *args, backend="auto", **kwargs):
+        self.kernel = get_kernel(backend)
+        self.backend = "python" if self.kernel is step_agents else "numba"
+        super().__init__(*args, **kwargs)
+
+    def populate(self, legitimacy_type, legitimacy_width, legitimacy_matrix):
+        """
+        Place the initial agents as VectorizedNetworkCivilViolence does and
+        add the state of the kernel.
+        """
+        super().populate(legitimacy_type, legitimacy_width, legitimacy_matrix)
+        num_agents = len(self.cell)
+        citizens = self.breed == CITIZEN
+        self.grievance = np.where(citizens, self.hardship * (1 - self.regime_legitimacy), 0.0)
+        self.stepped_at = np.full(num_agents, EMPTY, dtype=np.int64)
+        self.order = np.arange(num_agents, dtype=np.int64)
+        self.targets = np.zeros(num_agents, dtype=np.int64)
+        self.windows = np.zeros((3, self.width * self.height), dtype=np.int64)
+        # (2, size) dx and dy rows of the citizen, cop and next neighborhoods
+        self.offsets = tuple(
+            np.stack([table.dx, table.dy])
+            for table in (
+                get_neighborhood_table(self.width, self.height, True, radius)
+                for radius in (self.citizen_vision, self.cop_vision, 1)
+            )
+        )
+        self.python_offsets = tuple(offsets.tolist() for offsets in self.offsets)
+        self.params = np.array([
+            self.arrest_prob_constant,
+            self.alpha,
+            self.legitimacy_impact,
+            self.active_threshold,
+            self.max_jail_term,
+            float(bool(self.movement)),
+            float(self.use_mean_field),
+            self.legitimacy_stability_threshold,
+            self.cop_vision,
+            self.jail_factor,
+            self.citizen_vision,
+        ], dtype=np.float64)
+
+    def advance_agents(self):
+        """
+        Run the kernel for one step on blocks of the random streams, then
+        consume from each stream as many draws as the kernel used.
+        """
+        streams = self.streams
+        num_citizens = self.total_citizen
+        num_cops = len(self.order) - num_citizens
+        # upper bounds of the draws one step can take from each stream
+        bounds = (
+            max(len(self.order) - 1, 0),
+            num_citizens,
+            3 * num_cops,
+            2 * (MAX_TRIES + 1) * num_citizens
+            + (self.offsets[2].shape[1] + 1 + 2 * (MAX_TRIES + 1)) * num_cops,
+        )
+        draws = [
+            streams.schedule.peek(bounds[SCHEDULE]),
+            streams.activation.peek(bounds[ACTIVATION]),
+            streams.jail.peek(bounds[JAIL]),
+            streams.movement.peek(bounds[MOVEMENT]),
+        ]
+        used = np.zeros(4, dtype=np.int64)
+        state = [getattr(self, name) for name in KERNEL_STATE]
+        if self.backend == "python":
+            # plain Python indexes lists much faster than arrays
+            arrays, state = state, [array.tolist() for array in state]
+            offsets = self.python_offsets
+            draws = [block.tolist() for block in draws]
+            params, used = self.params.tolist(), used.tolist()
+        else:
+            offsets, params = self.offsets, self.params
+        self.kernel(self.iteration, params, self.width, self.height, *state, *offsets, *draws, used)
+        if self.backend == "python":
+            for array, values in zip(arrays, state):
+                array[:] = values
+        streams.schedule.skip(int(used[SCHEDULE]))
+        streams.activation.skip(int(used[ACTIVATION]))
+        streams.jail.skip(int(used[JAIL]))
+        streams.movement.skip(int(used[MOVEMENT]))
+        jailed = self.release >= 0
+        self.jail_sentence[:] = 0
+        self.jail_sentence[jailed] = self.release[jailed] - self.iteration
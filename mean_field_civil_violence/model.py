@@ -1,13 +1,28 @@
-import nest_asyncio
-
-nest_asyncio.apply()
 # add new features and mechanisms to collect data for plot
-import mesa
+import copy
+import sys
+
 import numpy as np
 
 from epstein_civil_violence.model import EpsteinCivilViolence
 from mean_field_civil_violence.agent import Inhabitant
 from mean_field_civil_violence.agent import Police
+from mean_field_civil_violence.checkpoint import GRID_PARAMETERS, ModelSnapshot
+from mean_field_civil_violence.convergence import LEGITIMACY_DROP_ITERATION, ConvergenceMonitor, update_running
+from mean_field_civil_violence.datacollection import ACTIVE, CITIZEN, COP, MISSING_CODE, QUIESCENT, ColumnarDataCollector
+from mean_field_civil_violence.diffusion import LegitimacyField, mean_field_step
+from mean_field_civil_violence.jail import JailActivation, JailWheel
+from mean_field_civil_violence.profiling import PhaseProfiler
+from mean_field_civil_violence.rng import RandomStreams
+from mean_field_civil_violence.space import CivilViolenceGrid
+from mean_field_civil_violence.trajectory import TrajectoryStore
+
+if "ipykernel" in sys.modules:
+    # the notebooks run mesa's visualization inside the kernel's event loop;
+    # headless runs leave the event loop alone
+    import nest_asyncio
+
+    nest_asyncio.apply()
 
 
 class EpsteinNetworkCivilViolence(EpsteinCivilViolence):
@@ -37,6 +52,32 @@ class EpsteinNetworkCivilViolence(EpsteinCivilViolence):
             max.
         alpha: Deterrent effect.
         rumor_effect: Network rumor effect posed by active agents.
+        legitimacy_drop: legitimacy lost at LEGITIMACY_DROP_ITERATION when
+            legitimacy_mode is 'drop'.
+        neighborhood_counts: how citizens count cops and actives in vision;
+            None scans the neighbors, "summed_area" reads column prefix sums
+            and "incremental" window counts, both of which the grid keeps
+            up to date as agents change; all three give the same run.
+        seed: seed of the model's random streams (see RandomStreams); every
+            random draw of the model comes from them.
+        agent_snapshot_every: record agent level data every this many steps;
+            None (the default) records none.
+        agent_snapshot_steps: steps at which agent level data is recorded in
+            any case.
+        trajectory_path: directory of a TrajectoryStore the state of every
+            agent is written to at every step; None writes none.
+        convergence: keyword arguments of a ConvergenceMonitor (e.g.
+            {"window": 50, "pad": True}) to stop the run once it settles;
+            None runs to max_iters. Why the run stopped is kept in
+            `stop_reason`.
+        activation: "random" steps the agents one at a time in random
+            order, each seeing the changes of those before it;
+            "synchronous" has every citizen decide from the state at the
+            start of the step before any of them changes, then lets the
+            cops arrest and everyone move (see `step_synchronous`).
+        profile: None runs uninstrumented; "time" times the phases of every
+            step in a PhaseProfiler kept in `profiler`, "allocations" also
+            counts the allocations they leave behind.
     """
 
     def __init__(
@@ -63,9 +104,25 @@ class EpsteinNetworkCivilViolence(EpsteinCivilViolence):
             use_mean_field=True,
             legitimacy_width=0.1,
             cop_density_mode='constant',  # Parameter to select the change mode of cop density (constant, gradual)
-            legitimacy_mode='constant'  # Parameter to select the change mode of legitimacy (constant, gradual, drop)
+            legitimacy_mode='constant',  # Parameter to select the change mode of legitimacy (constant, gradual, drop)
+            legitimacy_drop=0.3,
+            neighborhood_counts=None,  # None, "summed_area" or "incremental"
+            seed=None,
+            agent_snapshot_every=None,
+            agent_snapshot_steps=(),
+            trajectory_path=None,
+            convergence=None,
+            activation="random",  # "random" or "synchronous"
+            profile=None  # None, "time" or "allocations"
 
     ):
+        # constructor arguments, for snapshots
+        self.parameters = {
+            name: value for name, value in locals().items()
+            if name not in ("self", "__class__")
+        }
+        # release iterations of the jailed citizens
+        self.jail = JailWheel(max_jail_term + 1)
         super().__init__(
             width,
             height,
@@ -81,14 +138,31 @@ class EpsteinNetworkCivilViolence(EpsteinCivilViolence):
             max_iters,
         )
         self.iteration = 0
-        self.schedule = mesa.time.RandomActivation(self)
+        self.streams = RandomStreams(seed)
+        # the schedule shuffles with the model's random
+        self.random = self.streams.schedule
+        self.schedule = JailActivation(self)
         # self.grid = mesa.space.MultiGrid(width, height, torus=True)
-        self.grid = mesa.space.SingleGrid(width, height, torus=True)
+        if neighborhood_counts == "incremental":
+            vision_radii = (citizen_vision, cop_vision)
+        else:
+            vision_radii = ()
+        self.grid = CivilViolenceGrid(
+            width, height, torus=True, vision_radii=vision_radii, summed_area=neighborhood_counts == "summed_area",
+            mean_field=LegitimacyField(width, height) if use_mean_field else None,
+        )
         self.alpha = alpha
         self.jail_factor = jail_factor
         self.legitimacy_impact = legitimacy_impact
         self.cop_density_mode = cop_density_mode  # Store the cop density change mode
         self.legitimacy_mode = legitimacy_mode  # Store the legitimacy change mode
+        self.legitimacy_drop = legitimacy_drop
+        self.convergence = ConvergenceMonitor(**convergence) if convergence is not None else None
+        if activation not in ("random", "synchronous"):
+            raise ValueError(f"Unknown activation: {activation!r}")
+        self.activation = activation
+        if profile not in (None, "time", "allocations"):
+            raise ValueError(f"Unknown profile: {profile!r}")
         self.active_outburst = False  # Indicates if an outburst is currently happening
         self.last_outburst_ended = 0  # Time the last outburst ended
         self.waiting_times = []  # List to store waiting times
@@ -96,33 +170,38 @@ class EpsteinNetworkCivilViolence(EpsteinCivilViolence):
         self.current_outburst_size = 0  # Track the size of the current outburst
         self.total_citizen = 0
 
+        if neighborhood_counts is None:
+            self.neighborhood_counts = None
+        elif neighborhood_counts == "summed_area":
+            self.neighborhood_counts = self.grid.summed_area
+        elif neighborhood_counts == "incremental":
+            self.neighborhood_counts = self.grid
+        else:
+            raise ValueError(f"Unknown neighborhood_counts: {neighborhood_counts!r}")
+
         if use_mean_field == 1:
             use_mean_field = True
         if use_mean_field == 0:
             use_mean_field = False
+        self.use_mean_field = use_mean_field
 
         model_reporters = {
-            "Quiescent": lambda m: self.count_type_citizens(m, "Quiescent"),
-            "Active": lambda m: self.count_type_citizens(m, "Active"),
-            "Jailed": self.count_jailed,
-            "Cops": self.count_cops,
+            "Quiescent": lambda m: self.tally["Quiescent"],
+            "Active": lambda m: self.tally["Active"],
+            "Jailed": lambda m: self.tally["Jailed"],
+            "Cops": lambda m: self.tally["Cops"],
             "Waiting_Times": lambda m: self.waiting_times,
             "Legitimacy": lambda m: self.legitimacy,
             "Cop_Density": lambda m: self.cop_density,
-            "Stable Agents": lambda m: self.count_stable_agents(),
-            "Active_Ratio": lambda m: self.count_type_citizens(m, "Active") / self.total_citizen
+            "Stable Agents": lambda m: self.tally["Stable Agents"],
+            "Active_Ratio": lambda m: self.tally["Active"] / self.total_citizen,
+            "Mean_Legitimacy": lambda m: self.tally["Mean_Legitimacy"],
         }
-        agent_reporters = {
-            "x": lambda a: a.pos[0],
-            "y": lambda a: a.pos[1],
-            "breed": lambda a: a.breed,
-            "jail_sentence": lambda a: getattr(a, "jail_sentence", None),
-            "condition": lambda a: getattr(a, "condition", None),
-            "arrest_probability": lambda a: getattr(a, "arrest_probability", None),
-            "regime_legitimacy": lambda a: getattr(a, "regime_legitimacy", None),
-        }
-        self.datacollector = mesa.DataCollector(
-            model_reporters=model_reporters, agent_reporters=agent_reporters
+        self.datacollector = ColumnarDataCollector(
+            model_reporters=model_reporters,
+            agent_snapshot_every=agent_snapshot_every,
+            agent_snapshot_steps=agent_snapshot_steps,
+            capacity=max_iters + 2,
         )
         unique_id = 0
         if self.cop_density + self.citizen_density > 1:
@@ -133,20 +212,21 @@ class EpsteinNetworkCivilViolence(EpsteinCivilViolence):
             region_height = height / legitimacy_matrix.shape[0]
             region_width = width / legitimacy_matrix.shape[1]
 
+        init = self.streams.initialization
         for contents, (x, y) in self.grid.coord_iter():
-            if self.random.random() < self.cop_density:
+            if init.random() < self.cop_density:
                 cop = Police(unique_id, self, (x, y), vision=self.cop_vision)
                 unique_id += 1
                 self.grid[x][y] = cop
                 self.schedule.add(cop)
-            elif self.random.random() < (self.cop_density + self.citizen_density):
+            elif init.random() < (self.cop_density + self.citizen_density):
                 # Initialize legitimacy
                 regime_legitimacy = self.legitimacy
                 average_legitimacy = self.legitimacy
 
                 if legitimacy_type == "heterogeneous":
-                    regime_legitimacy = np.random.uniform(max(0, regime_legitimacy - legitimacy_width),
-                                                          min(1, regime_legitimacy + legitimacy_width))
+                    regime_legitimacy = init.uniform(max(0, regime_legitimacy - legitimacy_width),
+                                                     min(1, regime_legitimacy + legitimacy_width))
                 elif legitimacy_type == "by_regions" and legitimacy_matrix is not None:
                     region_x = int(x // region_width)
                     region_y = int(y // region_height)
@@ -157,9 +237,9 @@ class EpsteinNetworkCivilViolence(EpsteinCivilViolence):
                     unique_id,
                     self,
                     (x, y),
-                    hardship=self.random.random(),
+                    hardship=init.random(),
                     regime_legitimacy=regime_legitimacy,
-                    risk_aversion=self.random.random(),
+                    risk_aversion=init.random(),
                     threshold=self.active_threshold,
                     vision=self.citizen_vision,
                     alpha=self.alpha,
@@ -174,13 +254,26 @@ class EpsteinNetworkCivilViolence(EpsteinCivilViolence):
                 self.schedule.add(citizen)
                 self.total_citizen += 1
 
+        self.grid.rebuild_counts()
+        if trajectory_path is not None:
+            self.datacollector.trajectory = TrajectoryStore.create(
+                trajectory_path, self.agent_snapshot()["unique_id"], capacity=max_iters + 2
+            )
         self.running = True
+        self.stop_reason = None
+        # set while the citizens read their mean field update off it
+        self.legitimacy_field = None
+        self.update_tally()
         self.datacollector.collect(self)
+        self.profiler = None
+        if profile is not None:
+            PhaseProfiler(allocations=profile == "allocations").instrument(self)
 
     def step(self):
-        active_count = self.count_type_citizens(self, "Active")
-        if self.iteration == 300 and self.legitimacy_mode == 'drop':
-            self.legitimacy = max(0, self.legitimacy - 0.3)
+        # state has not changed since the tally taken at the end of the last step
+        active_count = self.tally["Active"]
+        if self.iteration == LEGITIMACY_DROP_ITERATION and self.legitimacy_mode == 'drop':
+            self.legitimacy = max(0, self.legitimacy - self.legitimacy_drop)
         elif self.legitimacy_mode == 'gradual':
             self.legitimacy = max(0, self.legitimacy - 0.001)
         if self.cop_density_mode == 'gradual':
@@ -202,12 +295,342 @@ class EpsteinNetworkCivilViolence(EpsteinCivilViolence):
                 self.outburst_sizes.append(self.current_outburst_size)
                 self.current_outburst_size = 0
 
-        self.schedule.step()
+        if self.activation == "synchronous":
+            self.step_synchronous()
+        else:
+            self.schedule.step()
+        self.release_prisoners()
+        self.update_tally()
         self.datacollector.collect(self)
         self.iteration += 1
-        if self.iteration > self.max_iters:
-            self.running = False
+        update_running(self)
+
+    def step_synchronous(self):
+        """
+        Step every agent at once, in phases that each go through the agents
+        in unique_id order:
+            1. every free citizen decides her condition from the state at the
+               start of the step, reading her new legitimacy off a mean
+               field update of the whole grid (`mean_field_legitimacy`),
+            2. all of them take on their decisions together,
+            3. the cops arrest one after the other, so no two of them go
+               for the same citizen,
+            4. the citizens still free and the cops that arrested no one
+               move (citizens twice, as in the random activation).
+        """
+        agents = sorted(self.schedule.agents, key=lambda agent: agent.unique_id)
+        citizens = [agent for agent in agents if agent.breed_code == CITIZEN and agent.release is None]
+        cops = [agent for agent in agents if agent.breed_code == COP]
+
+        if self.use_mean_field:
+            self.legitimacy_field = self.mean_field_legitimacy()
+        decisions = [citizen.decide() for citizen in citizens]
+        self.legitimacy_field = None
+        for citizen, decision in zip(citizens, decisions):
+            citizen.stepped_at = self.iteration
+            citizen.commit(*decision)
+
+        idle_cops = [cop for cop in cops if not cop.pursue()]
+
+        if self.movement:
+            free = [citizen for citizen in citizens if citizen.release is None]
+            origins = {citizen: citizen.pos for citizen in free}
+            self.move_synchronously(free + idle_cops, origins)
+            self.move_synchronously(free, origins)
+
+        self.schedule.steps += 1
+        self.schedule.time += 1
+
+    def mean_field_legitimacy(self):
+        """
+        Regime legitimacy field after one mean field update of every
+        citizen at once (see diffusion.mean_field_step).
+        """
+        legitimacy, citizens = self.grid.mean_field.arrays()
+        return mean_field_step(legitimacy, citizens, self.legitimacy_impact)
+
+    def move_synchronously(self, movers, origins=None):
+        """
+        Move `movers` at once: each picks an empty cell within vision of
+        its origin (`origins`, by default where it stands) as the grid is
+        before any of them moves, and of several agents picking the same
+        cell a random one gets it while the others stay put.
+        """
+        movement = self.streams.movement
+        claims = {}
+        for agent in movers:
+            origin = agent.pos if origins is None else origins.get(agent, agent.pos)
+            target = self.grid.sample_empty_cell(origin, agent.vision, movement)
+            if target is not None:
+                claims.setdefault(target, []).append(agent)
+        for target, claimants in claims.items():
+            winner = claimants[0] if len(claimants) == 1 else movement.choice(claimants)
+            self.grid.move_agent(winner, target)
+
+    def population(self):
+        """
+        Every agent, jailed citizens included, in schedule order.
+        """
+        return list(self.schedule.agents)
+
+    def arrest(self, citizen, sentence):
+        """
+        Make `citizen` quiescent and jail her for `sentence` iterations.
+        """
+        citizen.condition_code = QUIESCENT
+        if sentence:
+            # a citizen yet to act this step serves the first
+            # iteration of her sentence at her turn
+            served = 0 if citizen.stepped_at == self.iteration else 1
+            self.imprison(citizen, self.iteration + sentence - served)
+        self.grid.refresh(citizen)
+
+    def imprison(self, citizen, release):
+        """
+        Jail `citizen` until iteration `release`.
+        """
+        self.jail.admit(citizen, release)
+
+    def release_prisoner(self, citizen):
+        """
+        Free `citizen` at her turn in the iteration of her release.
+        """
+        self.jail.discharge(citizen)
+        citizen.update_regime_legitimacy_leave_jail()
+        self.grid.refresh(citizen)
+
+    def release_prisoners(self):
+        """
+        Free the citizens whose sentence ends this iteration and who were
+        not freed at their turn, i.e. all of them in the synchronous
+        activation.
+        """
+        for citizen in self.jail.release(self.iteration):
+            citizen.update_regime_legitimacy_leave_jail()
+            self.grid.refresh(citizen)
+
+    @staticmethod
+    def count_jailed(model):
+        """
+        Helper method to count jailed agents.
+        """
+        return len(model.jail)
+
+    # citizen attributes a snapshot stores per agent; the others follow the
+    # model parameters
+    CITIZEN_STATE = (
+        "condition_code",
+        "hardship",
+        "regime_legitimacy",
+        "risk_aversion",
+        "jail_sentence",
+        "grievance",
+        "arrest_probability",
+        "incitation_num",
+        "cops_in_vision",
+        "actives_in_vision",
+        "ideology_not_change",
+        "average_legitimacy",
+        "is_stable",
+    )
+
+    def snapshot(self):
+        """
+        Capture the complete state of the model: agents, random streams,
+        outburst counters, iteration and the data collected so far.
+        Returns:
+            ModelSnapshot, from which `restore` and `fork` resume the run.
+        """
+        agents = self.population()
+        citizens = [agent for agent in agents if agent.breed_code == CITIZEN]
+        columns = {
+            "unique_id": np.array([agent.unique_id for agent in agents]),
+            "x": np.array([agent.pos[0] for agent in agents]),
+            "y": np.array([agent.pos[1] for agent in agents]),
+            "breed_code": np.array([agent.breed_code for agent in agents], dtype=np.uint8),
+        }
+        for name in self.CITIZEN_STATE:
+            columns[name] = np.array(
+                [getattr(citizen, name) for citizen in citizens],
+                dtype=np.float64 if name == "arrest_probability" else None,
+            )
+        state = {
+            name: copy.deepcopy(getattr(self, name)) for name in (
+                "iteration",
+                "legitimacy",
+                "cop_density",
+                "active_outburst",
+                "last_outburst_ended",
+                "waiting_times",
+                "outburst_sizes",
+                "current_outburst_size",
+                "total_citizen",
+                "running",
+                "stop_reason",
+                "tally",
+                "_steps",
+                "_time",
+            )
+        }
+        state["jail_clock"] = self.jail.clock
+        state["schedule_steps"] = self.schedule.steps
+        state["schedule_time"] = self.schedule.time
+        # a restored model must not write over this run's trajectory
+        parameters = {**self.parameters, "trajectory_path": None}
+        return ModelSnapshot(
+            parameters, state, columns, self.streams.get_state(), self.datacollector.get_state()
+        )
+
+    @classmethod
+    def restore(cls, snapshot, **overrides):
+        """
+        Rebuild a model from a snapshot, optionally with other parameters.
+        Parameters that act during the run (alpha, jail_factor,
+        legitimacy_impact, legitimacy_mode, legitimacy_drop, cop_density_mode,
+        visions, movement, max_iters, ...) take their new value; the ones that
+        only shape the initial state (densities, legitimacy, legitimacy_type,
+        ...) have no effect. Passing a `seed` reseeds the random streams
+        instead of resuming them. A new trajectory_path records the run from
+        the restored step on.
+        Returns:
+            the restored model, ready to step.
+        """
+        parameters = {**snapshot.parameters, **overrides}
+        for name in GRID_PARAMETERS:
+            if parameters[name] != snapshot.parameters[name]:
+                raise ValueError(f"Cannot restore a snapshot with a different {name}")
+        model = cls(**parameters)
+        model.load_snapshot(snapshot, restore_streams="seed" not in overrides)
+        return model
+
+    @classmethod
+    def fork(cls, snapshot, branches):
+        """
+        One restored model per dict of parameter overrides in `branches`,
+        e.g. [{"legitimacy_drop": 0.1}, {"legitimacy_drop": 0.5}]. Unless
+        they override the seed, branches resume the same random streams.
+        """
+        return [cls.restore(snapshot, **overrides) for overrides in branches]
+
+    def load_snapshot(self, snapshot, restore_streams=True):
+        """
+        Replace the agents and state of this model by those of `snapshot`.
+        """
+        for agent in self.population():
+            self.grid.remove_agent(agent)
+            self.schedule.remove(agent)
+            agent.remove()
+        self.jail = JailWheel(self.max_jail_term + 1)
+        self.jail.clock = snapshot.state["jail_clock"]
+
+        columns = snapshot.agents
+        citizen_rows = iter(range(len(columns["hardship"])))
+        for row, unique_id in enumerate(columns["unique_id"].tolist()):
+            x, y = int(columns["x"][row]), int(columns["y"][row])
+            if columns["breed_code"][row] == COP:
+                agent = Police(unique_id, self, (x, y), vision=self.cop_vision)
+            else:
+                citizen = next(citizen_rows)
+                agent = Inhabitant(
+                    unique_id,
+                    self,
+                    (x, y),
+                    hardship=float(columns["hardship"][citizen]),
+                    regime_legitimacy=float(columns["regime_legitimacy"][citizen]),
+                    risk_aversion=float(columns["risk_aversion"][citizen]),
+                    threshold=self.active_threshold,
+                    vision=self.citizen_vision,
+                    alpha=self.alpha,
+                    jail_factor=self.jail_factor,
+                    legitimacy_impact=self.legitimacy_impact,
+                    use_mean_field=self.use_mean_field,
+                    average_legitimacy=float(columns["average_legitimacy"][citizen]),
+                )
+                for name in self.CITIZEN_STATE:
+                    if name != "jail_sentence":
+                        setattr(agent, name, columns[name][citizen].item())
+                if np.isnan(agent.arrest_probability):
+                    agent.arrest_probability = None
+            self.grid[x][y] = agent
+            self.schedule.add(agent)
+            if agent.breed_code == CITIZEN and columns["jail_sentence"][citizen]:
+                agent.jail_sentence = int(columns["jail_sentence"][citizen])
+        self.grid.rebuild_counts()
+        if self.profiler is not None:
+            self.profiler.instrument_agents(self.population())
+
+        state = dict(snapshot.state)
+        del state["jail_clock"]
+        self.schedule.steps = state.pop("schedule_steps")
+        self.schedule.time = state.pop("schedule_time")
+        for name, value in state.items():
+            setattr(self, name, copy.deepcopy(value))
+        if restore_streams:
+            self.streams.set_state(snapshot.streams)
+        self.datacollector.set_state(snapshot.data)
+        if self.datacollector.trajectory is not None:
+            trajectory = self.datacollector.trajectory
+            trajectory.close()
+            self.datacollector.trajectory = TrajectoryStore.create(
+                trajectory.path, self.agent_snapshot()["unique_id"], capacity=self.max_iters + 2
+            )
+            self.datacollector.trajectory.append(self.agent_snapshot())
+
+    def update_tally(self):
+        """
+        Count quiescent, active and jailed citizens, cops and stable agents,
+        and average the citizens' regime legitimacy, in a single pass over
+        the agents; the jail counts the jailed. Reporters, the outburst logic
+        and the convergence monitor read these instead of scanning the
+        agents again.
+        """
+        quiescent = active = cops = stable = 0
+        legitimacy = 0.0
+        for agent in self.schedule.agents:
+            if agent.breed_code == COP:
+                cops += 1
+                continue
+            if agent.release is None:
+                if agent.condition_code == ACTIVE:
+                    active += 1
+                elif agent.condition_code == QUIESCENT:
+                    quiescent += 1
+            if agent.is_stable:
+                stable += 1
+            legitimacy += agent.regime_legitimacy
+        self.tally = {
+            "Quiescent": quiescent,
+            "Active": active,
+            "Jailed": len(self.jail),
+            "Cops": cops,
+            "Stable Agents": stable,
+            "Mean_Legitimacy": legitimacy / self.total_citizen if self.total_citizen else np.nan,
+        }
 
     def count_stable_agents(self):
-        stable_agents = [agent for agent in self.schedule.agents if isinstance(agent, Inhabitant) and agent.is_stable]
-        return len(stable_agents)
\ No newline at end of file
+        """
+        Stable agents as of the last tally.
+        """
+        return self.tally["Stable Agents"]
+
+    def agent_snapshot(self):
+        """
+        Agent level state as one array per column, for the data collector.
+        """
+        agents = self.population()
+        return {
+            "unique_id": np.array([agent.unique_id for agent in agents]),
+            "x": np.array([agent.pos[0] for agent in agents]),
+            "y": np.array([agent.pos[1] for agent in agents]),
+            "breed": np.array([agent.breed_code for agent in agents], dtype=np.uint8),
+            "jail_sentence": np.array([getattr(agent, "jail_sentence", 0) for agent in agents]),
+            "condition": np.array(
+                [getattr(agent, "condition_code", MISSING_CODE) for agent in agents], dtype=np.uint8
+            ),
+            "arrest_probability": np.array(
+                [getattr(agent, "arrest_probability", None) for agent in agents], dtype=np.float64
+            ),
+            "regime_legitimacy": np.array(
+                [getattr(agent, "regime_legitimacy", None) for agent in agents], dtype=np.float64
+            ),
+        }
@@ -0,0 +1,160 @@
+# Per-phase timing of the network civil violence model step.
+import json
+import time
+import tracemalloc
+
+from mean_field_civil_violence.agent import Inhabitant, Police
+
+# Methods timed on the model, its schedule, grid and data collector, as
+# (owner attribute or None for the model, method name).
+MODEL_PHASES = (
+    (None, "step"),
+    (None, "step_synchronous"),
+    (None, "mean_field_legitimacy"),
+    (None, "move_synchronously"),
+    (None, "arrest"),
+    (None, "release_prisoner"),
+    (None, "release_prisoners"),
+    (None, "update_tally"),
+    ("schedule", "step"),
+    ("datacollector", "collect"),
+    ("grid", "move_agent"),
+    ("grid", "sample_empty_cell"),
+    ("grid", "sample_empty_cell_near"),
+    ("grid", "refresh"),
+)
+
+# Agent methods timed, per agent class.
+AGENT_PHASES = {
+    Inhabitant: (
+        "step",
+        "decide",
+        "update_neighbors",
+        "update_estimated_arrest_probability",
+        "update_next_neighbors",
+        "mean_field_legitimacy",
+        "commit",
+        "move",
+    ),
+    Police: ("step", "pursue", "update_neighbors"),
+}
+
+_profiled_classes = {}
+
+
+def _profiled_method(name, method):
+    def profiled(agent, *args, **kwargs):
+        return agent.model.profiler.call(name, method, agent, *args, **kwargs)
+    profiled.__name__ = method.__name__
+    profiled.__doc__ = method.__doc__
+    return profiled
+
+
+def profiled_class(cls):
+    """
+    Subclass of an agent class whose AGENT_PHASES methods report to their
+    model's profiler. It adds no state, so agents switch to it and back by
+    assigning __class__, and unprofiled agents pay nothing.
+    """
+    if cls not in _profiled_classes:
+        namespace = {"__slots__": (), "__module__": cls.__module__}
+        for name in AGENT_PHASES[cls]:
+            namespace[name] = _profiled_method(f"{cls.__name__}.{name}", getattr(cls, name))
+        _profiled_classes[cls] = type(cls.__name__, (cls,), namespace)
+    return _profiled_classes[cls]
+
+
+class PhaseProfiler:
+    """
+    Wall time and call counts of the phases of a model step, and with
+    `allocations` the bytes each phase leaves allocated (net of what it
+    frees, as traced by tracemalloc). Phases nest (Inhabitant.step contains
+    Inhabitant.decide, which contains Inhabitant.update_neighbors, ...), so
+    their times are inclusive.
+    Only instrumented objects are timed: `instrument` wraps the methods of
+    one model and switches its agents to profiled classes, so models
+    without a profiler run exactly the unprofiled code.
+    Args:
+        allocations: also trace allocations with tracemalloc, which slows
+            every allocation down.
+    """
+
+    def __init__(self, allocations=False):
+        self.allocations = allocations
+        self.calls = {}
+        self.seconds = {}
+        self.bytes = {}
+
+    def call(self, name, function, *args, **kwargs):
+        """
+        Call `function` and record it under phase `name`.
+        """
+        if self.allocations:
+            size = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self.seconds[name] = self.seconds.get(name, 0.0) + elapsed
+            if self.allocations:
+                self.bytes[name] = self.bytes.get(name, 0) + tracemalloc.get_traced_memory()[0] - size
+
+    def wrap(self, name, function):
+        def profiled(*args, **kwargs):
+            return self.call(name, function, *args, **kwargs)
+        return profiled
+
+    def instrument(self, model):
+        """
+        Time the MODEL_PHASES of `model` and the AGENT_PHASES of its agents.
+        """
+        model.profiler = self
+        for owner_name, method_name in MODEL_PHASES:
+            owner = model if owner_name is None else getattr(model, owner_name)
+            method = getattr(owner, method_name, None)
+            if method is None or getattr(method, "profiled", False):
+                continue
+            name = method_name if owner_name is None else f"{owner_name}.{method_name}"
+            profiled = self.wrap(name, method)
+            profiled.profiled = True
+            setattr(owner, method_name, profiled)
+        self.instrument_agents(model.population())
+        if self.allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def instrument_agents(self, agents):
+        for agent in agents:
+            if type(agent) in AGENT_PHASES:
+                agent.__class__ = profiled_class(type(agent))
+
+    def reset(self):
+        self.calls.clear()
+        self.seconds.clear()
+        self.bytes.clear()
+
+    def report(self):
+        """
+        One dict per phase, slowest first: phase, calls, seconds,
+        seconds_per_call and, with allocations, net_bytes.
+        """
+        rows = []
+        for name in sorted(self.seconds, key=self.seconds.get, reverse=True):
+            row = {
+                "phase": name,
+                "calls": self.calls[name],
+                "seconds": self.seconds[name],
+                "seconds_per_call": self.seconds[name] / self.calls[name],
+            }
+            if self.allocations:
+                row["net_bytes"] = self.bytes[name]
+            rows.append(row)
+        return rows
+
+    def save(self, path):
+        """
+        Write `report` to a JSON file, e.g. next to the run's data.
+        """
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=1)
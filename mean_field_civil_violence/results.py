@@ -0,0 +1,268 @@
+# Single-file columnar store of replicated run results.
+import json
+import os
+import struct
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+MAGIC = b"CVRESULT"
+# magic, format version and header length
+PREAMBLE = struct.Struct("<8sIQ")
+VERSION = 1
+# records start at a multiple of this many bytes
+ALIGNMENT = 64
+
+
+def _lock(f):
+    """
+    Exclusive lock of the open store file `f`: flock where there is one,
+    else a lock on the first byte with msvcrt, else none (a single writer
+    is then safe, concurrent ones are not).
+    """
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX)
+    elif msvcrt is not None:
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # LK_LOCK gives up after ten seconds
+                continue
+
+
+def _unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_UN)
+    elif msvcrt is not None:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class ResultStore:
+    """
+    Replicated runs appended to one binary file as fixed size records, one
+    per run: the condition parameters of the run in typed columns, its run
+    index and seed, and one float column of steps + 1 values per reporter.
+    A JSON header fixes the record layout, the reporters, the number of
+    steps and the parameters shared by every run.
+    Appends take an exclusive lock (see _lock) and write and fsync whole
+    records at once; a reader ignores a torn record at the end of the file
+    and the next append cuts it off, so a crash never leaves a run half
+    stored. Readers memory-map the records, so loading a condition x run x
+    step cube reads no text and copies at most the requested reporter.
+    Attributes:
+        path: store file
+        reporters: reporter series stored per run
+        steps: steps per run; series have steps + 1 values, shorter ones
+            are padded with NaN
+        condition_columns: name -> dtype of the condition parameters
+        params: parameters shared by every run
+        dtype: record dtype
+    """
+
+    def __init__(self, path, header):
+        self.path = path
+        self.reporters = header["reporters"]
+        self.steps = header["steps"]
+        self.condition_columns = {name: np.dtype(dtype) for name, dtype in header["condition_columns"]}
+        self.params = header["params"]
+        self.series_dtype = np.dtype(header["series_dtype"])
+        self.dtype = np.dtype(
+            [(name, dtype) for name, dtype in self.condition_columns.items()]
+            + [("run_index", np.uint32), ("seed", np.uint64)]
+            + [(name, self.series_dtype, (self.steps + 1,)) for name in self.reporters]
+        )
+        self.offset = header["offset"]
+
+    @classmethod
+    def create(cls, path, reporters, steps, condition_columns, params=None, series_dtype=np.float64):
+        """
+        New, empty store. Fails if `path` exists.
+        Args:
+            reporters: names of the reporter series stored per run.
+            steps: steps per run.
+            condition_columns: name -> dtype of the parameters that vary
+                between conditions, e.g. {"legitimacy_type": "U16",
+                "alpha": np.float64}.
+            params: JSON-serializable parameters shared by every run.
+            series_dtype: dtype of the reporter series.
+        """
+        header = {
+            "reporters": list(reporters),
+            "steps": int(steps),
+            "condition_columns": [
+                [name, np.dtype(dtype).str] for name, dtype in condition_columns.items()
+            ],
+            "params": params or {},
+            "series_dtype": np.dtype(series_dtype).str,
+        }
+        encoded = json.dumps(header).encode()
+        offset = -(-(PREAMBLE.size + len(encoded)) // ALIGNMENT) * ALIGNMENT
+        header["offset"] = offset
+        with open(path, "xb") as f:
+            f.write(PREAMBLE.pack(MAGIC, VERSION, len(encoded)))
+            f.write(encoded)
+            f.write(b"\0" * (offset - PREAMBLE.size - len(encoded)))
+        return cls(path, header)
+
+    @classmethod
+    def open(cls, path):
+        with open(path, "rb") as f:
+            magic, version, length = PREAMBLE.unpack(f.read(PREAMBLE.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a result store")
+            encoded = f.read(length)
+        header = json.loads(encoded)
+        header["offset"] = -(-(PREAMBLE.size + length) // ALIGNMENT) * ALIGNMENT
+        return cls(path, header)
+
+    def __len__(self):
+        """
+        Runs stored; a torn record at the end does not count.
+        """
+        return max(0, os.path.getsize(self.path) - self.offset) // self.dtype.itemsize
+
+    def record(self, condition, seed, series, run_index):
+        """
+        One record as bytes.
+        """
+        record = np.zeros((), dtype=self.dtype)
+        for name in self.condition_columns:
+            record[name] = condition[name]
+        record["run_index"] = run_index
+        record["seed"] = seed
+        for name in self.reporters:
+            values = np.asarray(series[name], dtype=self.series_dtype)[:self.steps + 1]
+            column = np.full(self.steps + 1, np.nan, dtype=self.series_dtype)
+            column[:len(values)] = values
+            record[name] = column
+        return record.tobytes()
+
+    def append(self, condition, seed, series, run_index=None):
+        """
+        Append one run.
+        Args:
+            condition: value of every condition column.
+            seed: the run's seed.
+            series: reporter name -> series, for every stored reporter.
+            run_index: index of the run within its condition; by default
+                the number of runs of the condition stored so far.
+        """
+        self.append_many(condition, [seed], [series], None if run_index is None else [run_index])
+
+    def append_many(self, condition, seeds, series, run_indices=None):
+        """
+        Append runs of one condition in a single write, seeds[i] with the
+        series series[i] (reporter name -> series).
+        """
+        with open(self.path, "r+b") as f:
+            _lock(f)
+            try:
+                count = max(0, os.fstat(f.fileno()).st_size - self.offset) // self.dtype.itemsize
+                end = self.offset + count * self.dtype.itemsize
+                # cut off the record a crashed append may have left
+                f.truncate(end)
+                if run_indices is None:
+                    first = int(np.count_nonzero(self._matches(self._map(f.name, count), condition)))
+                    run_indices = range(first, first + len(seeds))
+                data = b"".join(
+                    self.record(condition, seed, runs, run_index)
+                    for seed, runs, run_index in zip(seeds, series, run_indices)
+                )
+                f.seek(end)
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                _unlock(f)
+
+    def append_ensemble(self, condition, result):
+        """
+        Append the runs of an EnsembleResult (see ensemble.run_ensemble),
+        which must hold every stored reporter.
+        """
+        seeds = [result.seeds[run_index] for run_index in result.run_indices]
+        series = [
+            {name: result.series[name][row] for name in self.reporters}
+            for row in range(len(result.run_indices))
+        ]
+        self.append_many(condition, seeds, series, result.run_indices)
+
+    def _map(self, path, count):
+        if count == 0:
+            return np.zeros(0, dtype=self.dtype)
+        return np.memmap(path, dtype=self.dtype, mode="r", offset=self.offset, shape=(count,))
+
+    def _matches(self, records, condition):
+        mask = np.ones(len(records), dtype=bool)
+        for name in self.condition_columns:
+            mask &= records[name] == condition[name]
+        return mask
+
+    @property
+    def records(self):
+        """
+        Memory-mapped structured array of every stored run.
+        """
+        return self._map(self.path, len(self))
+
+    def conditions(self):
+        """
+        Distinct conditions, as dicts, in the order they were first stored.
+        """
+        records = self.records
+        names = list(self.condition_columns)
+        keys = zip(*(records[name].tolist() for name in names)) if names else ((),) * len(records)
+        return [dict(zip(names, key)) for key in dict.fromkeys(keys)]
+
+    def runs(self, condition):
+        """
+        Records of one condition, in run index order.
+        """
+        records = self.records
+        rows = np.flatnonzero(self._matches(records, condition))
+        rows = rows[np.argsort(records["run_index"][rows], kind="stable")]
+        return records[rows]
+
+    def cube(self, reporter, conditions=None, num_runs=None):
+        """
+        A reporter as a (condition, run, step) array.
+        Args:
+            reporter: stored reporter name.
+            conditions: conditions (dicts) to load, all by default.
+            num_runs: runs per condition, the most any condition has by
+                default; conditions with fewer runs are padded with NaN.
+        Returns:
+            (conditions, cube)
+        """
+        records = self.records
+        if conditions is None:
+            conditions = self.conditions()
+        rows = []
+        for condition in conditions:
+            matching = np.flatnonzero(self._matches(records, condition))
+            rows.append(matching[np.argsort(records["run_index"][matching], kind="stable")])
+        if num_runs is None:
+            num_runs = max((len(matching) for matching in rows), default=0)
+        index = np.full((len(conditions), num_runs), -1, dtype=np.int64)
+        for i, matching in enumerate(rows):
+            matching = matching[:num_runs]
+            index[i, :len(matching)] = matching
+        # one gather from the mapped column
+        if len(records):
+            cube = np.asarray(records[reporter])[np.maximum(index, 0)]
+        else:
+            cube = np.zeros(index.shape + (self.steps + 1,), dtype=self.series_dtype)
+        cube[index < 0] = np.nan
+        return conditions, cube
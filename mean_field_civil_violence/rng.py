@@ -0,0 +1,245 @@
+# Reproducible random number streams for the civil violence models.
+import numpy as np
+
+# Every model draws its random numbers for each of these purposes from a
+# separate stream, so changing how one of them is consumed leaves the
+# others untouched.
+PURPOSES = ("initialization", "schedule", "activation", "jail", "movement")
+
+BLOCK_SIZE = 4096
+
+# `peek` generates this many times the draws asked for and serves later
+# peeks from them.
+PEEK_AHEAD = 4
+
+
+def spawn_seeds(seed, num_runs):
+    """
+    Independent integer seeds for `num_runs` replicates derived from one
+    ensemble seed.
+    """
+    children = np.random.SeedSequence(seed).spawn(num_runs)
+    return [int(child.generate_state(1, dtype=np.uint32)[0]) for child in children]
+
+
+class RandomStream:
+    """
+    A counter-based (Philox) stream of uniform doubles, generated in blocks.
+    The n-th draw of a stream is the same whether it is taken one at a time
+    through the random.Random-like methods (random, randrange, randint,
+    choice, shuffle, uniform) or as part of an array from `uniforms` and
+    `integers`, so scalar and batched code consuming a stream in the same
+    order see the same numbers.
+    Args:
+        seed_sequence: np.random.SeedSequence keying the stream
+        block_size: draws generated at a time for the scalar methods
+    """
+
+    def __init__(self, seed_sequence, block_size=BLOCK_SIZE):
+        self.generator = np.random.Generator(np.random.Philox(seed_sequence))
+        self.block_size = block_size
+        self._buffer = []
+        self._next = 0
+        # generator state the current buffer was drawn from
+        self._block_state = None
+        # draws taken from the generator, and the draws `peek` generated
+        # ahead with the position of the first of them
+        self._generated = 0
+        self._lookahead = None
+        self._lookahead_start = 0
+
+    def random(self):
+        if self._next == len(self._buffer):
+            self._block_state = self.generator.bit_generator.state
+            self._buffer = self.generator.random(self.block_size).tolist()
+            self._generated += self.block_size
+            self._next = 0
+        value = self._buffer[self._next]
+        self._next += 1
+        return value
+
+    def randrange(self, n):
+        # rounding can take u * n up to n for u just below one
+        return min(int(self.random() * n), n - 1)
+
+    def randint(self, a, b):
+        return a + self.randrange(b - a + 1)
+
+    def choice(self, seq):
+        return seq[self.randrange(len(seq))]
+
+    def uniform(self, a, b):
+        return a + (b - a) * self.random()
+
+    def shuffle(self, x):
+        """
+        Shuffle the list `x` in place (Fisher-Yates, as random.shuffle).
+        """
+        for i in range(len(x) - 1, 0, -1):
+            j = self.randrange(i + 1)
+            x[i], x[j] = x[j], x[i]
+
+    def uniforms(self, size):
+        """
+        The next `size` draws as an array.
+        """
+        buffered = self._buffer[self._next:self._next + size]
+        self._next += len(buffered)
+        if len(buffered) == size:
+            return np.array(buffered, dtype=np.float64)
+        self._generated += size - len(buffered)
+        return np.concatenate([
+            np.array(buffered, dtype=np.float64),
+            self.generator.random(size - len(buffered)),
+        ])
+
+    def peek(self, size):
+        """
+        The next `size` draws as a read-only array, without consuming them;
+        code that cannot tell in advance how many draws it needs takes them
+        from here and then `skip`s the ones it used. Draws are generated
+        PEEK_AHEAD times as far ahead as asked, so a peek after a skip is
+        usually a slice of the previous one.
+        """
+        position = self._generated - (len(self._buffer) - self._next)
+        if self._lookahead is not None:
+            start = position - self._lookahead_start
+            if 0 <= start and start + size <= len(self._lookahead):
+                return self._lookahead[start:start + size]
+        buffered = self._buffer[self._next:]
+        generator = np.random.Generator(np.random.Philox())
+        generator.bit_generator.state = self.generator.bit_generator.state
+        lookahead = np.concatenate([
+            np.array(buffered, dtype=np.float64),
+            generator.random(max(PEEK_AHEAD * size - len(buffered), 0)),
+        ])
+        lookahead.flags.writeable = False
+        self._lookahead = lookahead
+        self._lookahead_start = position
+        return lookahead[:size]
+
+    def skip(self, count):
+        """
+        Consume the next `count` draws.
+        """
+        if count:
+            self.uniforms(count)
+
+    def integers(self, low, high, size):
+        """
+        `size` integers drawn uniformly from [low, high).
+        """
+        span = high - low
+        draws = (self.uniforms(size) * span).astype(np.int64)
+        return low + np.minimum(draws, span - 1)
+
+    def permutation(self, n):
+        return np.argsort(self.uniforms(n), kind="stable")
+
+    def get_state(self):
+        """
+        Position in the stream: the generator state of the current block and
+        how far into it the stream is, rather than the buffered draws.
+        """
+        if self._next < len(self._buffer):
+            return {"bit_generator": self._block_state, "offset": self._next}
+        return {"bit_generator": self.generator.bit_generator.state, "offset": None}
+
+    def set_state(self, state):
+        """
+        Resume from a `get_state()`; the stream then continues exactly where
+        it was.
+        """
+        self.generator.bit_generator.state = state["bit_generator"]
+        self._buffer = []
+        self._next = 0
+        self._generated = 0
+        self._lookahead = None
+        if state["offset"] is not None:
+            self._block_state = state["bit_generator"]
+            self._buffer = self.generator.random(self.block_size).tolist()
+            self._generated = self.block_size
+            self._next = state["offset"]
+
+
+class RandomStreams:
+    """
+    The random streams of one model run, one RandomStream per purpose in
+    PURPOSES, all derived from the run's seed. Replicates get their seeds
+    from spawn_seeds.
+    Attributes:
+        seed_sequence: root np.random.SeedSequence of the run; its entropy
+            reproduces an unseeded run.
+        initialization, schedule, activation, jail, movement: the streams.
+    """
+
+    def __init__(self, seed=None, block_size=BLOCK_SIZE):
+        self.seed_sequence = np.random.SeedSequence(seed)
+        for key, purpose in enumerate(PURPOSES):
+            stream_seed = np.random.SeedSequence(
+                self.seed_sequence.entropy,
+                spawn_key=self.seed_sequence.spawn_key + (key,),
+            )
+            setattr(self, purpose, RandomStream(stream_seed, block_size))
+
+    def get_state(self):
+        return {purpose: getattr(self, purpose).get_state() for purpose in PURPOSES}
+
+    def set_state(self, state):
+        for purpose in PURPOSES:
+            getattr(self, purpose).set_state(state[purpose])
+
+    def __getitem__(self, purpose):
+        if purpose not in PURPOSES:
+            raise KeyError(purpose)
+        return getattr(self, purpose)
+
+
+class CellStream:
+    """
+    Random numbers keyed by grid cell instead of by draw order: draw `draw`
+    of iteration `iteration` at flat cell `i` is the i-th double of a Philox
+    stream keyed by (seed, purpose, iteration, draw). Any range of cells
+    can be generated on its own, so code splitting the grid into tiles sees
+    the same numbers however it is split.
+    Args:
+        seed_sequence: root np.random.SeedSequence of the run
+        key: index of the stream's purpose in PURPOSES
+    """
+
+    def __init__(self, seed_sequence, key):
+        self.seed_sequence = seed_sequence
+        self.key = key
+
+    def uniforms(self, iteration, draw, start, stop):
+        """
+        Draw `draw` of `iteration` at the flat cells [start, stop).
+        """
+        key = np.random.SeedSequence(
+            self.seed_sequence.entropy,
+            spawn_key=self.seed_sequence.spawn_key + (self.key, iteration, draw),
+        ).generate_state(2, dtype=np.uint64)
+        # Philox yields four doubles per counter value
+        counter = np.array([start // 4, 0, 0, 0], dtype=np.uint64)
+        generator = np.random.Generator(np.random.Philox(counter=counter, key=key))
+        return generator.random(stop - start + start % 4)[start % 4:]
+
+    def integers(self, low, high, iteration, draw, start, stop):
+        """
+        Integers in [low, high) from `uniforms`.
+        """
+        span = high - low
+        draws = (self.uniforms(iteration, draw, start, stop) * span).astype(np.int64)
+        return low + np.minimum(draws, span - 1)
+
+
+class CellStreams:
+    """
+    The cell keyed streams of one run, one CellStream per purpose in
+    PURPOSES, derived from the run's seed like RandomStreams.
+    """
+
+    def __init__(self, seed=None):
+        self.seed_sequence = np.random.SeedSequence(seed)
+        for key, purpose in enumerate(PURPOSES):
+            setattr(self, purpose, CellStream(self.seed_sequence, key))
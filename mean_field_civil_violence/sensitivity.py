@@ -0,0 +1,214 @@
+# PAWN global sensitivity analysis of the network civil violence model.
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from mean_field_civil_violence.model import EpsteinNetworkCivilViolence
+from mean_field_civil_violence.rng import spawn_seeds
+
+
+def mean_outburst_size(model):
+    if model.outburst_sizes:
+        return np.mean(model.outburst_sizes)
+    return 0
+
+
+def sd_outburst_size(model):
+    if model.outburst_sizes:
+        return np.std(model.outburst_sizes)
+    return 0
+
+
+DEFAULT_OUTPUTS = {
+    "Mean_Outburst_Size": mean_outburst_size,
+    "SD_Outburst_Size": sd_outburst_size,
+}
+
+# Model parameters that only make sense as integers.
+INTEGER_PARAMETERS = ("citizen_vision", "cop_vision", "max_jail_term", "width", "height")
+
+
+class SensitivityResult:
+    """
+    Outputs of a sampled parameter sweep and their PAWN indices.
+    Attributes:
+        problem: SALib problem definition.
+        samples: (N, num_vars) parameter matrix, integer parameters already
+            cast, exactly as the model saw it.
+        outputs: output name -> (N,) array; NaN where a sample failed.
+        indices: output name -> SALib PAWN result, computed on the samples
+            that succeeded.
+    """
+
+    def __init__(self, problem, samples, outputs, indices):
+        self.problem = problem
+        self.samples = samples
+        self.outputs = outputs
+        self.indices = indices
+
+
+def cast_samples(problem, samples, integer_params=INTEGER_PARAMETERS):
+    """
+    Truncate the columns of integer parameters to integers, as int() does.
+    The cast matrix is used both to build the models and to compute the
+    indices, so the analysis sees the values the model actually ran with.
+    """
+    samples = np.array(samples, dtype=np.float64)
+    for column, name in enumerate(problem["names"]):
+        if name in integer_params:
+            samples[:, column] = np.trunc(samples[:, column])
+    return samples
+
+
+def sample_parameters(problem, parameters, integer_params=INTEGER_PARAMETERS):
+    """
+    Model keyword arguments of one row of the sample matrix.
+    """
+    params = {}
+    for name, value in zip(problem["names"], parameters):
+        params[name] = int(value) if name in integer_params else float(value)
+    return params
+
+
+def evaluate_sample(model_cls, model_params, steps, outputs, seed):
+    """
+    Build and run one model and return its outputs, in `outputs` order.
+    """
+    model = model_cls(**model_params, seed=seed)
+    for _ in range(steps):
+        if not model.running:
+            break
+        model.step()
+    return [float(extract(model)) for extract in outputs.values()]
+
+
+def _load_checkpoint(path, samples, outputs):
+    """
+    (samples, seeds, values, done) saved in the checkpoint `path`, or None
+    when there is none yet. `samples` None accepts the checkpoint's sample.
+    """
+    if path is None or not os.path.exists(path):
+        return None
+    with np.load(path) as checkpoint:
+        if (samples is not None and not np.array_equal(checkpoint["samples"], samples)) or list(
+                checkpoint["outputs"]) != list(outputs):
+            raise ValueError(
+                f"Checkpoint {path} was written for a different sample or outputs"
+            )
+        return (
+            checkpoint["samples"].copy(),
+            [int(seed) for seed in checkpoint["seeds"]],
+            checkpoint["values"].copy(),
+            checkpoint["done"].copy(),
+        )
+
+
+def _save_checkpoint(path, samples, seeds, outputs, values, done):
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        np.savez(
+            f,
+            samples=samples,
+            seeds=np.array(seeds, dtype=np.uint32),
+            outputs=np.array(list(outputs)),
+            values=values,
+            done=done,
+        )
+    os.replace(temporary, path)
+
+
+def run_pawn_analysis(
+        problem,
+        model_params,
+        steps,
+        samples=None,
+        num_samples=None,
+        outputs=None,
+        integer_params=INTEGER_PARAMETERS,
+        batch_size=None,
+        processes=None,
+        seed=None,
+        checkpoint=None,
+        S=10,
+        model_cls=EpsteinNetworkCivilViolence,
+):
+    """
+    Evaluate a sample of the parameter space in parallel and compute the
+    PAWN sensitivity indices of every output.
+    Args:
+        problem: SALib problem definition; its names are model parameters.
+        model_params: fixed keyword arguments of the model constructor.
+        steps: steps every model is run for.
+        samples: (N, num_vars) sample matrix. When None, a Latin hypercube
+            sample of `num_samples` rows is drawn with SALib.
+        num_samples: size of the Latin hypercube sample.
+        outputs: output name -> function of the finished model; mean and
+            sd of outburst size by default. Functions must be picklable.
+        integer_params: parameters cast to int before use.
+        batch_size: samples evaluated between two checkpoints; four per
+            worker process by default.
+        processes: worker processes, os.cpu_count() by default.
+        seed: seed of the Latin hypercube sample and of the model seeds.
+        checkpoint: .npz file holding the sample, the model seeds and the
+            results so far. An interrupted analysis started again with the
+            same checkpoint resumes its sample, even one drawn without a
+            seed, and evaluates the samples that are not done yet,
+            including those that failed.
+        S: number of slides of the PAWN analysis.
+        model_cls: model class to evaluate.
+    Returns:
+        SensitivityResult.
+    """
+    from SALib.analyze import pawn
+
+    outputs = dict(outputs or DEFAULT_OUTPUTS)
+    if samples is not None:
+        samples = cast_samples(problem, samples, integer_params)
+    state = _load_checkpoint(checkpoint, samples, outputs)
+    if state is not None:
+        samples, seeds, values, done = state
+    else:
+        if samples is None:
+            from SALib.sample import latin
+
+            samples = cast_samples(problem, latin.sample(problem, num_samples, seed=seed), integer_params)
+        seeds = spawn_seeds(seed, len(samples))
+        values = np.full((len(samples), len(outputs)), np.nan)
+        done = np.zeros(len(samples), dtype=bool)
+    processes = processes or os.cpu_count()
+    batch_size = batch_size or 4 * processes
+
+    pending = np.flatnonzero(~done)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            futures = {
+                row: executor.submit(
+                    evaluate_sample,
+                    model_cls,
+                    {**model_params, **sample_parameters(problem, samples[row], integer_params)},
+                    steps,
+                    outputs,
+                    seeds[row],
+                )
+                for row in batch
+            }
+            for row, future in futures.items():
+                try:
+                    values[row] = future.result()
+                    done[row] = True
+                except Exception:
+                    # left pending, so that a resumed analysis retries it
+                    values[row] = np.nan
+            if checkpoint is not None:
+                _save_checkpoint(checkpoint, samples, seeds, outputs, values, done)
+
+    indices = {}
+    for column, name in enumerate(outputs):
+        valid = ~np.isnan(values[:, column])
+        indices[name] = pawn.analyze(
+            problem, samples[valid], values[valid, column], S=S, seed=seed
+        )
+    result_outputs = {name: values[:, column] for column, name in enumerate(outputs)}
+    return SensitivityResult(problem, samples, result_outputs, indices)
@@ -0,0 +1,557 @@
+# Spatial helpers shared by the agent based and the array-backed models.
+import collections
+import functools
+
+import numpy as np
+from mesa.space import SingleGrid
+
+from mean_field_civil_violence.datacollection import ACTIVE, COP
+
+
+def toroidal_window_sum(field, radius, axes=(-2, -1)):
+    """
+    Sum a field over the Moore neighborhood of radius `radius` (center
+    included) of every cell on a torus.
+    The two trailing axes of `field` are the grid axes (x, y); any leading
+    axes are treated as a batch. Windows wider than the grid count every
+    cell once, as mesa's deduplicated neighborhoods do. `axes` restricts
+    the sum to some of the grid axes.
+    """
+    out = np.asarray(field)
+    for axis in axes:
+        n = out.shape[axis]
+        size = 2 * radius + 1
+        if size >= n:
+            out = np.broadcast_to(out.sum(axis=axis, keepdims=True), out.shape)
+            continue
+        head = np.take(out, range(n - radius, n), axis=axis)
+        tail = np.take(out, range(radius), axis=axis)
+        padded = np.concatenate([head, out, tail], axis=axis)
+        zero_shape = list(padded.shape)
+        zero_shape[axis] = 1
+        cumulative = np.concatenate(
+            [np.zeros(zero_shape, dtype=padded.dtype), np.cumsum(padded, axis=axis)],
+            axis=axis,
+        )
+        upper = np.take(cumulative, range(size, size + n), axis=axis)
+        lower = np.take(cumulative, range(n), axis=axis)
+        out = upper - lower
+    return np.ascontiguousarray(out)
+
+
+# Upper bound on the neighborhood tables kept alive per process; sweeps
+# reuse the same few (grid shape, radius) combinations over and over.
+NEIGHBORHOOD_CACHE_SIZE = 32
+# Bytes of neighborhood tuples cached for the agent based model, shared by
+# every table of the process.
+ROW_CACHE_BYTES = 256 * 2 ** 20
+
+
+class NeighborhoodTable:
+    """
+    Neighborhoods of the cells of a grid for one radius, kept as the offsets
+    of a single neighborhood, so a table costs (2 * radius + 1) ** 2 offsets
+    whatever the grid size. Cells are numbered x * height + y; the rows of
+    flat indices around cells are computed on demand, in the order mesa
+    enumerates them, and on a non toroidal grid rows of cells near the edge
+    are padded with -1.
+    The tuples `row` and `coordinates` return are cached for the agent based
+    model, oldest first out once the tuples of all tables take
+    ROW_CACHE_BYTES.
+    Attributes:
+        width: grid width
+        height: grid height
+        torus: whether the grid wraps around
+        radius: neighborhood radius
+        moore: Moore (True) or Von Neumann (False) neighborhood
+        include_center: whether a cell belongs to its own neighborhood
+        dx, dy: offsets of the neighborhood, taken modulo the grid size on
+            a torus
+        size: number of offsets, i.e. of entries of every row
+        dtype: dtype of the flat indices, int32 unless the grid needs more
+    """
+
+    def __init__(self, width, height, torus, radius, moore=True, include_center=False):
+        self.width = width
+        self.height = height
+        self.torus = torus
+        self.radius = radius
+        self.moore = moore
+        self.include_center = include_center
+        self.dx, self.dy = neighborhood_offsets(width, height, torus, radius, moore, include_center)
+        self.size = len(self.dx)
+        self.dtype = np.int32 if width * height < 2 ** 31 else np.int64
+        self._columns = np.arange(self.size)
+        self._rows = {}
+        self._coordinates = {}
+
+    def entries(self, cells, columns):
+        """
+        Flat index of entry `columns` of the row of each of `cells`, -1
+        outside a non toroidal grid.
+        """
+        x, y = np.divmod(np.asarray(cells, dtype=np.int64), self.height)
+        new_x = x + self.dx[columns]
+        new_y = y + self.dy[columns]
+        if self.torus:
+            return ((new_x % self.width) * self.height + new_y % self.height).astype(self.dtype)
+        inside = (new_x >= 0) & (new_x < self.width) & (new_y >= 0) & (new_y < self.height)
+        return np.where(inside, new_x * self.height + new_y, -1).astype(self.dtype)
+
+    def rows(self, cells):
+        """
+        (len(cells), size) array of the flat indices around each of `cells`.
+        """
+        cells = np.asarray(cells, dtype=np.int64)
+        indices = self.entries(cells[:, None], np.arange(self.size)[None, :])
+        if not self.torus:
+            # keep the valid cells of every row at its front, in order
+            order = np.argsort(indices < 0, axis=1, kind="stable")
+            indices = np.take_along_axis(indices, order, axis=1)
+        return indices
+
+    def row(self, index):
+        """
+        Tuple of the flat indices around cell `index`.
+        """
+        row = self._rows.get(index)
+        if row is None:
+            row = self.entries(index, self._columns)
+            if not self.torus:
+                row = row[row >= 0]
+            row = tuple(row.tolist())
+            _row_cache.put(self._rows, index, row, 64 + 36 * len(row))
+        return row
+
+    def coordinates(self, pos):
+        """
+        Tuple of the (x, y) coordinates around `pos`, as mesa's
+        get_neighborhood returns them.
+        """
+        neighborhood = self._coordinates.get(pos)
+        if neighborhood is None:
+            x, y = pos
+            cells = _cell_coordinates(self.width, self.height)
+            neighborhood = tuple(cells[i] for i in self.row(x * self.height + y))
+            _row_cache.put(self._coordinates, pos, neighborhood, 64 + 8 * len(neighborhood))
+        return neighborhood
+
+
+class _BoundedCache:
+    """
+    Byte budget of entries stored in several dicts: `put` stores an entry in
+    one of them and drops the oldest entries of all once their sizes, as
+    given to `put`, add up to more than `max_bytes`. Lookups read the dicts
+    directly.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.num_bytes = 0
+        self._order = collections.deque()
+
+    def put(self, mapping, key, value, num_bytes):
+        if num_bytes > self.max_bytes or key in mapping:
+            return
+        mapping[key] = value
+        self._order.append((mapping, key, num_bytes))
+        self.num_bytes += num_bytes
+        while self.num_bytes > self.max_bytes:
+            mapping, key, dropped = self._order.popleft()
+            del mapping[key]
+            self.num_bytes -= dropped
+
+
+_row_cache = _BoundedCache(ROW_CACHE_BYTES)
+
+
+def neighborhood_offsets(width, height, torus, radius, moore=True, include_center=False):
+    """
+    (dx, dy) arrays of the offsets making up a neighborhood, in the order
+    mesa enumerates them; on a torus, offsets reaching the same cell twice
+    are kept once and taken modulo the grid size.
+    """
+    offsets = {}
+    for dx in range(-radius, radius + 1):
+        for dy in range(-radius, radius + 1):
+            if not moore and abs(dx) + abs(dy) > radius:
+                continue
+            if torus:
+                offsets[(dx % width, dy % height)] = True
+            else:
+                offsets[(dx, dy)] = True
+    if not include_center:
+        offsets.pop((0, 0), None)
+    offsets = np.array(list(offsets.keys()), dtype=np.int64).reshape(-1, 2)
+    return offsets[:, 0], offsets[:, 1]
+
+
+@functools.lru_cache(maxsize=NEIGHBORHOOD_CACHE_SIZE)
+def get_neighborhood_table(width, height, torus, radius, moore=True, include_center=False):
+    """
+    NeighborhoodTable for a grid shape and radius, shared by every model in
+    the process.
+    """
+    return NeighborhoodTable(width, height, torus, radius, moore, include_center)
+
+
+@functools.lru_cache(maxsize=NEIGHBORHOOD_CACHE_SIZE)
+def _cell_coordinates(width, height):
+    return tuple((x, y) for x in range(width) for y in range(height))
+
+
+def _wrapped_spans(center, radius, size):
+    """
+    Split the toroidal interval [center - radius, center + radius] into at
+    most two plain half-open spans of [0, size).
+    """
+    if 2 * radius + 1 >= size:
+        return ((0, size),)
+    low = center - radius
+    high = center + radius + 1
+    if low < 0:
+        return (0, high), (low + size, size)
+    if high > size:
+        return (low, size), (0, high - size)
+    return ((low, high),)
+
+
+class SummedAreaCounts:
+    """
+    Cop and active (non jailed) citizen occupancy with prefix sums down
+    every grid column, so the number of cops and actives inside a vision
+    window is a difference of two prefix sums per column, summed by NumPy.
+    The CivilViolenceGrid owning the counts calls `add` wherever its own
+    counts change (placing, removing and moving agents, `refresh`), so an
+    agent reads the occupancy as it is when she acts, exactly as scanning
+    her neighborhood would.
+    This is not a 2D integral image: a lookup reads 2 * (2 * vision + 1)
+    entries rather than four corners, but an update touches one column
+    (O(height)) instead of the whole quadrant past the cell
+    (O(width * height)), and agents move between almost every lookup. The
+    lookup work is O(vision) inside NumPy and its cost is dominated by the
+    call overhead: about 11 to 16 us for visions 1 to 20 on grids of 40²
+    to 1000², against 4 to 6 us per update.
+    Attributes:
+        width: grid width
+        height: grid height
+        cops: cop occupancy per cell, indexed [x, y]
+        actives: active, non jailed citizen occupancy per cell
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.cops = np.zeros((width, height), dtype=np.int32)
+        self.actives = np.zeros((width, height), dtype=np.int32)
+        # [x, y] holds the occupancy of cells (x, 0) to (x, y - 1)
+        self._cops_table = np.zeros((width, height + 1), dtype=np.int32)
+        self._actives_table = np.zeros((width, height + 1), dtype=np.int32)
+
+    def rebuild(self, cops, actives):
+        """
+        Take the occupancy arrays `cops` and `actives` and recompute the
+        prefix sums.
+        """
+        self.cops[:] = cops
+        self.actives[:] = actives
+        np.cumsum(self.cops, axis=1, out=self._cops_table[:, 1:])
+        np.cumsum(self.actives, axis=1, out=self._actives_table[:, 1:])
+
+    def add(self, pos, cop, delta):
+        """
+        Add `delta` cops (`cop`) or actives to the cell `pos`.
+        """
+        x, y = pos
+        if cop:
+            self.cops[x, y] += delta
+            self._cops_table[x, y + 1:] += delta
+        else:
+            self.actives[x, y] += delta
+            self._actives_table[x, y + 1:] += delta
+
+    def _window_sum(self, table, pos, radius):
+        x, y = pos
+        total = 0
+        for x0, x1 in _wrapped_spans(x, radius, self.width):
+            for y0, y1 in _wrapped_spans(y, radius, self.height):
+                total += int(table[x0:x1, y1].sum()) - int(table[x0:x1, y0].sum())
+        return total
+
+    def vision_counts(self, agent):
+        """
+        Cops and actives (including the agent herself) in the vision of a
+        citizen, as used by the arrest probability estimate.
+        """
+        x, y = agent.pos
+        cops_in_vision = self._window_sum(self._cops_table, agent.pos, agent.vision)
+        actives_in_vision = (
+            1.0
+            + self._window_sum(self._actives_table, agent.pos, agent.vision)
+            - self.actives[x, y]
+        )
+        return cops_in_vision, actives_in_vision
+
+
+class CivilViolenceGrid(SingleGrid):
+    """
+    SingleGrid that keeps per-cell cop, active and empty counts up to date at
+    the points where they change: placing, removing and moving agents, and
+    `refresh` calls after an agent's condition or jail sentence changes.
+    For every radius in `vision_radii` it also keeps the number of cops and
+    actives inside the window around each cell, so vision counts are plain
+    lookups and a step only costs in proportion to the changes it makes.
+    With `summed_area` it keeps SummedAreaCounts up to date instead, and
+    with a `mean_field` it keeps that diffusion.LegitimacyField up to date
+    with the citizens' regime legitimacy.
+    Attributes:
+        cops: 1 where a cop stands, indexed [x, y]
+        actives: 1 where an active, non jailed citizen stands
+        num_empty: number of empty cells
+        window_cops: radius -> cops within that radius of each cell
+        window_actives: radius -> actives within that radius of each cell
+        summed_area: SummedAreaCounts of the grid, or None
+        mean_field: LegitimacyField of the grid, or None
+    """
+
+    def __init__(self, width, height, torus, vision_radii=(), summed_area=False, mean_field=None):
+        super().__init__(width, height, torus)
+        self.cops = np.zeros((width, height), dtype=np.int32)
+        self.actives = np.zeros((width, height), dtype=np.int32)
+        self.num_empty = width * height
+        self._occupied = bytearray(width * height)
+        self._cells = _cell_coordinates(width, height)
+        self.window_cops = {}
+        self.window_actives = {}
+        for radius in set(vision_radii):
+            self.window_cops[radius] = np.zeros((width, height), dtype=np.int32)
+            self.window_actives[radius] = np.zeros((width, height), dtype=np.int32)
+        self.summed_area = SummedAreaCounts(width, height) if summed_area else None
+        self.mean_field = mean_field
+
+    @staticmethod
+    def is_active(agent):
+        return agent.breed_code != COP and agent.condition_code == ACTIVE and agent.jail_sentence == 0
+
+    def rebuild_counts(self):
+        """
+        Recount everything from the grid contents, for agents that were put
+        on the grid without `place_agent`.
+        """
+        self.cops.fill(0)
+        self.actives.fill(0)
+        self.num_empty = 0
+        for contents, (x, y) in self.coord_iter():
+            self._empty_mask[x, y] = contents is None
+            self._occupied[x * self.height + y] = contents is not None
+            if contents is None:
+                self.num_empty += 1
+            elif contents.breed_code == COP:
+                self.cops[x, y] = 1
+            elif self.is_active(contents):
+                self.actives[x, y] = 1
+            if self.mean_field is not None:
+                if contents is None or contents.breed_code == COP:
+                    self.mean_field.clear((x, y))
+                else:
+                    self.mean_field.set((x, y), contents.regime_legitimacy)
+        self._empties_built = False
+        for radius in self.window_cops:
+            self.window_cops[radius][:] = toroidal_window_sum(self.cops, radius)
+            self.window_actives[radius][:] = toroidal_window_sum(self.actives, radius)
+        if self.summed_area is not None:
+            self.summed_area.rebuild(self.cops, self.actives)
+
+    def _add_to_windows(self, pos, cop, delta):
+        if self.summed_area is not None:
+            self.summed_area.add(pos, cop, delta)
+        windows = self.window_cops if cop else self.window_actives
+        x, y = pos
+        for radius, window in windows.items():
+            for x0, x1 in _wrapped_spans(x, radius, self.width):
+                for y0, y1 in _wrapped_spans(y, radius, self.height):
+                    window[x0:x1, y0:y1] += delta
+
+    def _count(self, agent, pos, delta):
+        x, y = pos
+        if agent.breed_code == COP:
+            self.cops[x, y] += delta
+            self._add_to_windows(pos, True, delta)
+            return
+        if self.mean_field is not None:
+            if delta > 0:
+                self.mean_field.set(pos, agent.regime_legitimacy)
+            else:
+                self.mean_field.clear(pos)
+        # a removed citizen takes away whatever was counted for her cell
+        counted = self.is_active(agent) if delta > 0 else self.actives[x, y]
+        if counted:
+            self.actives[x, y] += delta
+            self._add_to_windows(pos, False, delta)
+
+    def place_agent(self, agent, pos):
+        super().place_agent(agent, pos)
+        x, y = agent.pos
+        self._occupied[x * self.height + y] = 1
+        self.num_empty -= 1
+        self._count(agent, agent.pos, 1)
+
+    def remove_agent(self, agent):
+        pos = agent.pos
+        if pos is None:
+            return
+        self._count(agent, pos, -1)
+        x, y = pos
+        self._occupied[x * self.height + y] = 0
+        self.num_empty += 1
+        super().remove_agent(agent)
+
+    def refresh(self, agent):
+        """
+        Update the counts after `agent` changed condition, jail sentence or
+        regime legitimacy.
+        """
+        if agent.breed_code == COP:
+            return
+        if self.mean_field is not None:
+            self.mean_field.set(agent.pos, agent.regime_legitimacy)
+        x, y = agent.pos
+        delta = int(self.is_active(agent)) - self.actives[x, y]
+        if delta:
+            self.actives[x, y] += delta
+            self._add_to_windows(agent.pos, False, delta)
+
+    def get_neighborhood(self, pos, moore, include_center=False, radius=1):
+        """
+        Same as SingleGrid.get_neighborhood, read from the shared
+        neighborhood table of this grid shape and radius.
+        """
+        return get_neighborhood_table(
+            self.width, self.height, self.torus, radius, moore, include_center
+        ).coordinates(pos)
+
+    def get_neighborhood_indices(self, pos, radius, moore=True, include_center=False):
+        """
+        Flat cell indices (x * height + y) of the neighborhood of `pos`.
+        """
+        table = get_neighborhood_table(
+            self.width, self.height, self.torus, radius, moore, include_center
+        )
+        x, y = pos
+        return np.array(table.row(x * self.height + y), dtype=table.dtype)
+
+    def sample_empty_cell(self, pos, radius, rng, max_tries=16, standing=None):
+        """
+        Uniformly random empty cell of the Moore neighborhood of `pos`, or
+        None if it has none. Cells are drawn at random and checked against
+        the occupancy bitmap; only windows that are nearly full fall back to
+        counting their empty cells.
+        Args:
+            pos: center of the neighborhood
+            radius: neighborhood radius
+            rng: random.Random to draw from, usually the agent's
+            max_tries: draws before falling back to counting
+            standing: where the mover stands after an earlier move away
+                from `pos`; the cells empty before that move are drawn
+                from, so `standing` counts as empty and `pos` does not
+                (the original model's stale list of empty neighbors).
+        """
+        x, y = pos
+        table = get_neighborhood_table(self.width, self.height, self.torus, radius)
+        origin = x * self.height + y
+        row = table.row(origin)
+        if not row:
+            return None
+        occupied = self._occupied
+        if standing is None or tuple(standing) == tuple(pos):
+            eligible = lambda cell: not occupied[cell]
+        else:
+            standing = standing[0] * self.height + standing[1]
+            eligible = lambda cell: cell == standing or (not occupied[cell] and cell != origin)
+        for _ in range(max_tries):
+            cell = row[rng.randrange(len(row))]
+            if eligible(cell):
+                return self._cells[cell]
+        return self._pick_eligible(row, rng, eligible)
+
+    def sample_empty_cell_near(self, target, origin, radius, rng):
+        """
+        Uniformly random empty cell next to `target` (Moore, radius 1) that
+        also lies within `radius` of `origin`, or None if there is none.
+        """
+        x, y = target
+        table = get_neighborhood_table(self.width, self.height, self.torus, 1)
+        row = table.row(x * self.height + y)
+        occupied = self._occupied
+        origin_x, origin_y = origin
+
+        def eligible(cell):
+            if occupied[cell]:
+                return False
+            cell_x, cell_y = self._cells[cell]
+            dx = abs(cell_x - origin_x)
+            dy = abs(cell_y - origin_y)
+            if self.torus:
+                dx = min(dx, self.width - dx)
+                dy = min(dy, self.height - dy)
+            return dx <= radius and dy <= radius
+
+        for _ in range(len(row)):
+            cell = row[rng.randrange(len(row))]
+            if eligible(cell):
+                return self._cells[cell]
+        return self._pick_eligible(row, rng, eligible)
+
+    def _pick_eligible(self, row, rng, eligible):
+        count = sum(1 for cell in row if eligible(cell))
+        if not count:
+            return None
+        pick = rng.randrange(count)
+        for cell in row:
+            if eligible(cell):
+                if not pick:
+                    return self._cells[cell]
+                pick -= 1
+
+    def tracks_radius(self, radius):
+        return radius in self.window_cops
+
+    def actives_in_window(self, pos, radius):
+        """
+        Actives within `radius` of `pos`, the cell itself included.
+        """
+        x, y = pos
+        if radius in self.window_actives:
+            return int(self.window_actives[radius][x, y])
+        rows, cols = _window_indices(x, y, radius, self.width, self.height)
+        return int(self.actives[np.ix_(rows, cols)].sum())
+
+    def cops_in_window(self, pos, radius):
+        """
+        Cops within `radius` of `pos`, the cell itself included.
+        """
+        x, y = pos
+        if radius in self.window_cops:
+            return int(self.window_cops[radius][x, y])
+        rows, cols = _window_indices(x, y, radius, self.width, self.height)
+        return int(self.cops[np.ix_(rows, cols)].sum())
+
+    def vision_counts(self, agent):
+        """
+        Cops and actives (including the agent herself) in the vision of a
+        citizen, as used by the arrest probability estimate.
+        """
+        x, y = agent.pos
+        cops_in_vision = self.cops_in_window(agent.pos, agent.vision)
+        actives_in_vision = (
+            1.0
+            + self.actives_in_window(agent.pos, agent.vision)
+            - self.actives[x, y]
+        )
+        return cops_in_vision, actives_in_vision
+
+
+def _window_indices(x, y, radius, width, height):
+    rows = np.unique((np.arange(-radius, radius + 1) + x) % width)
+    cols = np.unique((np.arange(-radius, radius + 1) + y) % height)
+    return rows, cols
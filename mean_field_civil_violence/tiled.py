@@ -0,0 +1,761 @@
+# Domain-decomposed multi-process engine for very large grids.
+import itertools
+import mmap
+import multiprocessing
+import traceback
+
+import mesa
+import numpy as np
+
+from mean_field_civil_violence.convergence import LEGITIMACY_DROP_ITERATION, ConvergenceMonitor, update_running
+from mean_field_civil_violence.datacollection import (
+    ACTIVE,
+    CITIZEN,
+    COP,
+    MISSING_CODE,
+    QUIESCENT,
+    ColumnarDataCollector,
+)
+from mean_field_civil_violence.diffusion import initial_legitimacy, mean_field_update
+from mean_field_civil_violence.rng import CellStreams, RandomStreams
+from mean_field_civil_violence.space import neighborhood_offsets, toroidal_window_sum
+from mean_field_civil_violence.trajectory import TrajectoryStore
+
+EMPTY = -1
+
+# State of the agent in every cell, moved along with the agent.
+STATE_DTYPES = {
+    "occupant": np.int64,  # unique_id, EMPTY for an empty cell
+    "breed": np.uint8,
+    "hardship": np.float64,
+    "risk_aversion": np.float64,
+    "regime_legitimacy": np.float64,
+    "average_legitimacy": np.float64,
+    "condition": np.uint8,
+    "jail_sentence": np.int64,
+    "arrest_probability": np.float64,
+    "is_stable": np.bool_,
+    "origin": np.int64,  # cell the agent started the step's moves from
+}
+
+# Per cell messages the tiles leave each other between the phases of a step.
+SCRATCH_DTYPES = {
+    "acted": np.bool_,
+    "target": np.int64,
+    "priority": np.float64,
+    "won": np.bool_,
+}
+
+# Counts every tile reports after a step, summed into the model's tally.
+TALLY_COLUMNS = ("Quiescent", "Active", "Jailed", "Cops", "Stable Agents", "Legitimacy_Sum")
+
+# Rows of agent windows materialized at a time.
+WINDOW_CHUNK = 4096
+
+
+def shared_array(shape, dtype):
+    """
+    Zeroed array in anonymous shared memory; processes forked after its
+    creation read and write the same memory.
+    """
+    dtype = np.dtype(dtype)
+    count = int(np.prod(shape))
+    buffer = mmap.mmap(-1, max(count * dtype.itemsize, 1))
+    return np.frombuffer(buffer, dtype=dtype, count=count).reshape(shape)
+
+
+def slab_window_sum(slab, halo, radius, width):
+    """
+    Moore window sums of radius `radius` (center included) for the inner
+    columns of `slab`, a block of full grid columns padded with `halo`
+    columns of its neighbors on each side. Windows wrap around in y and,
+    when wider than the grid, count every column once as on the torus.
+    """
+    inner = len(slab) - 2 * halo
+    if 2 * radius + 1 >= width:
+        # the slab holds at least `width` consecutive columns
+        total = slab[:width].sum(axis=0, keepdims=True)
+        out = np.broadcast_to(total, (inner,) + total.shape[1:])
+    else:
+        cumulative = np.concatenate([np.zeros_like(slab[:1]), np.cumsum(slab, axis=0)])
+        out = (
+            cumulative[halo + radius + 1:halo + radius + 1 + inner]
+            - cumulative[halo - radius:halo - radius + inner]
+        )
+    return toroidal_window_sum(out, radius, axes=(-1,))
+
+
+def slab_stencil_sum(slab, halo):
+    """
+    3x3 window sums of the inner columns of `slab`, added up in the same
+    order as diffusion.stencil_sum so tiles reproduce it exactly.
+    """
+    inner = len(slab) - 2 * halo
+    center = slab[halo:halo + inner]
+    out = center + slab[halo - 1:halo - 1 + inner] + slab[halo + 1:halo + 1 + inner]
+    return out + np.roll(out, 1, axis=-1) + np.roll(out, -1, axis=-1)
+
+
+class _SingleProcessBarrier:
+    """
+    Stand-in for multiprocessing.Barrier when one tile covers the grid.
+    """
+
+    def wait(self):
+        pass
+
+    def abort(self):
+        pass
+
+
+class Tile:
+    """
+    The columns [x0, x1) of a TiledNetworkCivilViolence grid and the work
+    of one process on them. A tile only writes its own cells, except for
+    the arrest and move messages it leaves in the scratch arrays of its
+    neighbors' cells, and reads the `halo` columns on either side of it
+    straight from shared memory after every exchange barrier.
+    Args:
+        model: the model, whose shared arrays and parameters it reads
+        index: row of the tile in the model's tally array
+        x0, x1: first and past the last column of the tile
+        barrier: synchronizes the phases of a step across tiles
+    """
+
+    def __init__(self, model, index, x0, x1, barrier):
+        self.model = model
+        self.index = index
+        self.x0 = x0
+        self.x1 = x1
+        self.start = x0 * model.height
+        self.stop = x1 * model.height
+        self.barrier = barrier
+        self.halo = model.halo
+        self.columns = np.arange(x0 - self.halo, x1 + self.halo) % model.width
+        self.reach = np.arange(x0 - 2 * self.halo, x1 + 2 * self.halo) % model.width
+
+    def own(self, name):
+        """
+        View of the tile's columns of a shared array.
+        """
+        return self.model.state[name][self.x0:self.x1]
+
+    def slab(self, field):
+        """
+        The tile's columns of `field` with the halo around them.
+        """
+        return field[self.columns]
+
+    def window_cells(self, cells, radius):
+        """
+        Flat indices of the Moore neighborhood (without center) of each
+        cell in `cells`, one row per cell.
+        """
+        model = self.model
+        dx, dy = neighborhood_offsets(model.width, model.height, True, radius)
+        x, y = np.divmod(cells, model.height)
+        return ((x[:, None] + dx) % model.width) * model.height + (y[:, None] + dy) % model.height
+
+    def step(self, iteration):
+        model = self.model
+        flat = model.flat
+        occupant = self.own("occupant")
+        breed = self.own("breed")
+        condition = self.own("condition")
+        jail_sentence = self.own("jail_sentence")
+        regime_legitimacy = self.own("regime_legitimacy")
+
+        # prisoners sit the whole step out and count down at its end
+        citizens = (occupant != EMPTY) & (breed == CITIZEN)
+        jailed = citizens & (jail_sentence > 0)
+        free = citizens & ~jailed
+
+        # citizens decide from the state every tile left after the last step
+        decision = self.decide(iteration, free)
+        self.barrier.wait()
+        arrest_probability, is_stable, legitimacy, new_condition = decision
+        self.own("arrest_probability")[free] = arrest_probability[free]
+        self.own("is_stable")[free] = is_stable[free]
+        regime_legitimacy[free] = legitimacy[free]
+        condition[free] = new_condition[free]
+        self.barrier.wait()
+
+        # cops arrest in whichever tile the arrestee is
+        hunting = self.pursue(iteration)
+
+        if model.movement:
+            # free citizens and idle cops move, then the free citizens move
+            # again from where they started against the cells now empty
+            self.own("origin")[:] = np.arange(self.start, self.stop).reshape(occupant.shape)
+            cops = (occupant != EMPTY) & (breed == COP)
+            free = citizens & (jail_sentence == 0)
+            self.move(iteration, free | (cops & ~hunting), flat)
+            free = (occupant != EMPTY) & (breed == CITIZEN) & (jail_sentence == 0)
+            self.move(iteration, free, flat, from_origin=True)
+
+        jail_sentence[jailed] -= 1
+        released = jailed & (jail_sentence == 0)
+        regime_legitimacy[released] = np.clip(regime_legitimacy[released] * model.jail_factor, 0, 1)
+        self.tally()
+
+    def move(self, iteration, movers, flat, from_origin=False):
+        """
+        One synchronous move of `movers`, exchanged through the barriers
+        around the settling of claims.
+        """
+        self.propose_moves(iteration, movers, from_origin)
+        self.barrier.wait()
+        self.settle_moves(flat)
+        self.barrier.wait()
+        won = self.own("won")
+        self.own("occupant")[won] = EMPTY
+        won[:] = False
+        self.barrier.wait()
+
+    def decide(self, iteration, free):
+        """
+        Arrest probability estimate, stability, mean field legitimacy and
+        condition of the tile's cells, computed from the shared state
+        without changing it.
+        """
+        model = self.model
+        state = model.state
+        halo = self.halo
+        occupant = self.slab(state["occupant"])
+        breed = self.slab(state["breed"])
+        jail_sentence = self.slab(state["jail_sentence"])
+        citizens = (occupant != EMPTY) & (breed == CITIZEN)
+        cops = (occupant != EMPTY) & (breed == COP)
+        active = citizens & (self.slab(state["condition"]) == ACTIVE) & (jail_sentence == 0)
+
+        cops_in_vision = slab_window_sum(cops.astype(np.int64), halo, model.citizen_vision, model.width)
+        actives_in_vision = 1.0 + (
+            slab_window_sum(active.astype(np.int64), halo, model.citizen_vision, model.width)
+            - active[halo:len(active) - halo]
+        )
+        arrest_probability = 1 - np.exp(
+            -1 * model.arrest_prob_constant * (cops_in_vision / actives_in_vision)
+        )
+
+        legitimacy = self.own("regime_legitimacy")
+        is_stable = (
+            np.abs(legitimacy - self.own("average_legitimacy"))
+            < model.legitimacy_stability_threshold
+        )
+        if model.use_mean_field:
+            masked = np.where(citizens, self.slab(state["regime_legitimacy"]), 0.0)
+            legitimacy = mean_field_update(
+                masked[halo:len(masked) - halo],
+                citizens[halo:len(citizens) - halo],
+                slab_stencil_sum(citizens.astype(np.float64), halo),
+                slab_stencil_sum(masked, halo),
+                model.legitimacy_impact,
+            )
+
+        grievance = self.own("hardship") * (1 - legitimacy)
+        jail_draw = model.cell_streams.activation.integers(
+            0, model.max_jail_term + 1, iteration, 0, self.start, self.stop
+        ).reshape(free.shape).astype(np.float64)
+        net_risk = self.own("risk_aversion") * arrest_probability * jail_draw ** model.alpha
+        condition = np.where(grievance - net_risk > model.active_threshold, ACTIVE, QUIESCENT)
+        return arrest_probability, is_stable, legitimacy, condition
+
+    def pursue(self, iteration):
+        """
+        Cops arrest in turns, standing in for the unique_id order of the
+        synchronous activation: every cop still to act picks an active
+        citizen in vision at random, of the cops that picked the same
+        citizen the one with the lowest unique_id tries to arrest it, and
+        the others pick again at the next turn among the citizens left.
+        Returns the mask of the tile's cops that found a target.
+        """
+        model = self.model
+        waiting = (self.own("occupant") != EMPTY) & (self.own("breed") == COP)
+        hunting = np.zeros_like(waiting)
+        acted = self.own("acted")
+        for turn in itertools.count():
+            self.pick_targets(iteration, turn, waiting)
+            self.barrier.wait()
+            self.settle_arrests(iteration, turn)
+            self.barrier.wait()
+            hunting |= acted
+            waiting &= ~acted
+            acted[:] = False
+            model.waiting[self.index] = np.count_nonzero(waiting)
+            self.barrier.wait()
+            if not model.waiting.sum():
+                return hunting
+
+    def pick_targets(self, iteration, turn, waiting):
+        """
+        Every cop in `waiting` picks one of the active citizens in its
+        vision and leaves its cell in the target scratch array; the cops
+        with none left are taken out of `waiting`.
+        """
+        model = self.model
+        state = model.state
+        flat = model.flat
+        active = (
+            (self.slab(state["occupant"]) != EMPTY)
+            & (self.slab(state["breed"]) == CITIZEN)
+            & (self.slab(state["condition"]) == ACTIVE)
+            & (self.slab(state["jail_sentence"]) == 0)
+        )
+        waiting &= slab_window_sum(active.astype(np.int64), self.halo, model.cop_vision, model.width) > 0
+        target = self.own("target")
+        target[:] = EMPTY
+        target = target.reshape(-1)
+        cells = self.start + np.flatnonzero(waiting)
+        if len(cells) == 0:
+            return
+        pick_draws = model.cell_streams.jail.uniforms(iteration, 3 * turn, self.start, self.stop)[cells - self.start]
+        for low in range(0, len(cells), WINDOW_CHUNK):
+            chunk = slice(low, low + WINDOW_CHUNK)
+            window = self.window_cells(cells[chunk], model.cop_vision)
+            is_target = (
+                (flat["occupant"][window] != EMPTY)
+                & (flat["breed"][window] == CITIZEN)
+                & (flat["condition"][window] == ACTIVE)
+                & (flat["jail_sentence"][window] == 0)
+            )
+            cumulative = np.cumsum(is_target, axis=1)
+            pick = np.floor(pick_draws[chunk] * cumulative[:, -1]).astype(np.int64)
+            column = np.argmax(cumulative > pick[:, None], axis=1)
+            target[cells[chunk] - self.start] = window[np.arange(len(window)), column]
+
+    def settle_arrests(self, iteration, turn):
+        """
+        For every citizen of the tile some cops picked, let the one with the
+        lowest unique_id try the arrest and flag its cell as done.
+        """
+        model = self.model
+        flat = model.flat
+        sources, targets = self.claims(self.columns)
+        if len(sources) == 0:
+            return
+        order = np.lexsort((flat["occupant"][sources], targets))
+        _, first = np.unique(targets[order], return_index=True)
+        winners, targets = sources[order[first]], targets[order[first]]
+        jail = model.cell_streams.jail
+        arrest_draws = jail.uniforms(iteration, 3 * turn + 1, self.start, self.stop)[targets - self.start]
+        sentences = jail.integers(
+            0, model.max_jail_term + 1, iteration, 3 * turn + 2, self.start, self.stop
+        )[targets - self.start]
+        success = arrest_draws < flat["arrest_probability"][targets]
+        flat["condition"][targets[success]] = QUIESCENT
+        flat["jail_sentence"][targets[success]] = sentences[success]
+        flat["acted"][winners] = True
+
+    def claims(self, columns):
+        """
+        Cells of `columns` whose target lies in the tile, and their targets.
+        """
+        model = self.model
+        if len(columns) > model.width:
+            columns = np.arange(model.width)
+        cells = (columns[:, None] * model.height + np.arange(model.height)).reshape(-1)
+        targets = model.flat["target"][cells]
+        claims = (targets >= self.start) & (targets < self.stop)
+        return cells[claims], targets[claims]
+
+    def propose_moves(self, iteration, movers, from_origin=False, max_tries=8):
+        """
+        Every mover of the tile picks a uniformly random cell within vision
+        of where it stands, or of its origin with `from_origin`, that is
+        empty before anyone moves, and a priority for conflicts; both are
+        left in the scratch arrays at the mover's cell.
+        """
+        model = self.model
+        flat = model.flat
+        movement = model.cell_streams.movement
+        # each of the two moves of a step has its own draws
+        offset = max_tries + 2 if from_origin else 0
+        empty = flat["occupant"] == EMPTY
+        target = self.own("target")
+        target[:] = EMPTY
+        self.own("priority")[:] = movement.uniforms(
+            iteration, offset + max_tries + 1, self.start, self.stop
+        ).reshape(target.shape)
+        target = target.reshape(-1)
+        origin = self.own("origin").reshape(-1) if from_origin else self.start + np.arange(len(target))
+
+        breed = self.own("breed").reshape(-1)
+        local = np.flatnonzero(movers.reshape(-1))
+        vision = np.where(breed[local] == COP, model.cop_vision, model.citizen_vision)
+        for radius in np.unique(vision).tolist():
+            group = local[vision == radius]
+            dx, dy = neighborhood_offsets(model.width, model.height, True, radius)
+            x, y = np.divmod(origin[group], model.height)
+            pending = np.arange(len(group))
+            for attempt in range(max_tries):
+                if len(pending) == 0:
+                    break
+                choice = movement.integers(
+                    0, len(dx), iteration, offset + attempt, self.start, self.stop
+                )[group[pending]]
+                candidate = (
+                    ((x[pending] + dx[choice]) % model.width) * model.height
+                    + (y[pending] + dy[choice]) % model.height
+                )
+                hit = empty[candidate]
+                target[group[pending[hit]]] = candidate[hit]
+                pending = pending[~hit]
+            if len(pending):
+                draws = movement.uniforms(iteration, offset + max_tries, self.start, self.stop)
+                for low in range(0, len(pending), WINDOW_CHUNK):
+                    rows = group[pending[low:low + WINDOW_CHUNK]]
+                    window = self.window_cells(origin[rows], radius)
+                    cumulative = np.cumsum(empty[window], axis=1)
+                    has_empty = cumulative[:, -1] > 0
+                    pick = np.floor(draws[rows] * cumulative[:, -1]).astype(np.int64)
+                    column = np.argmax(cumulative > pick[:, None], axis=1)
+                    chosen = window[np.arange(len(rows)), column]
+                    target[rows[has_empty]] = chosen[has_empty]
+
+    def settle_moves(self, flat):
+        """
+        For every cell of the tile some movers picked, let the one with the
+        highest priority in and flag its old cell for its owner to empty.
+        A second move lands at most twice the halo from where the mover
+        stands, so only that many columns around the tile need to be
+        searched for claims.
+        """
+        sources, targets = self.claims(self.reach)
+        if len(sources) == 0:
+            return
+        order = np.lexsort((sources, -flat["priority"][sources], targets))
+        _, first = np.unique(targets[order], return_index=True)
+        winners, targets = sources[order[first]], targets[order[first]]
+        for name in STATE_DTYPES:
+            flat[name][targets] = flat[name][winners]
+        flat["won"][winners] = True
+
+    def tally(self):
+        model = self.model
+        occupant = self.own("occupant")
+        breed = self.own("breed")
+        citizens = (occupant != EMPTY) & (breed == CITIZEN)
+        free = citizens & (self.own("jail_sentence") == 0)
+        active = np.count_nonzero(free & (self.own("condition") == ACTIVE))
+        model.tallies[self.index] = (
+            np.count_nonzero(free) - active,
+            active,
+            np.count_nonzero(citizens) - np.count_nonzero(free),
+            np.count_nonzero((occupant != EMPTY) & (breed == COP)),
+            np.count_nonzero(self.own("is_stable") & citizens),
+            self.own("regime_legitimacy")[citizens].sum(),
+        )
+
+
+def _serve(tile, connection):
+    """
+    Worker process loop: step the tile whenever the model asks.
+    """
+    while True:
+        command, iteration = connection.recv()
+        if command == "close":
+            break
+        try:
+            tile.step(iteration)
+        except Exception:
+            tile.barrier.abort()
+            connection.send(("error", traceback.format_exc()))
+            break
+        connection.send(("done", None))
+    connection.close()
+
+
+class TiledNetworkCivilViolence(mesa.Model):
+    """
+    Domain-decomposed counterpart of VectorizedNetworkCivilViolence for grids
+    of millions of cells. The torus is cut into `num_workers` tiles of whole
+    columns, each stepped by its own process (forked on the first step) over
+    state arrays kept per cell in shared memory, so agents crossing a tile
+    border just move to a cell another process owns. Tiles read halos of
+    max(citizen_vision, cop_vision) columns around them; the phases of a step
+    (citizen decisions, arrests, movement, jail countdown) are separated by
+    barriers, which is where boundary state is exchanged. A step follows
+    the synchronous activation of the agent based model: all free citizens
+    decide from the same snapshot of the grid, the cops arrest one after
+    the other, free citizens and idle cops move and the free citizens move
+    again from where they started, and prisoners whose sentence ends are
+    released at the end of the step. The cops' unique_id order is played
+    out in turns (see Tile.pursue) and a cell picked by several movers goes
+    to the one with the highest random priority, so runs match
+    VectorizedNetworkCivilViolence in distribution rather than draw for
+    draw.
+    Random numbers are drawn per cell (see CellStreams), so a run gives the
+    same results whatever the number of workers. The global reporters are
+    reduced from per-tile counts. Unlike the vectorized engine, the model
+    holds no per-agent arrays; `agent_snapshot()` gathers them.
+    Needs the fork start method, i.e. Linux. Call `close()` to stop the
+    workers of a run that is abandoned before it stops by itself.
+    Attributes:
+        num_workers: number of tiles and worker processes; one tile steps
+            in the calling process. At most the grid width.
+        (other parameters as VectorizedNetworkCivilViolence)
+    """
+
+    def __init__(
+            self,
+            width=40,
+            height=40,
+            citizen_density=0.7,
+            cop_density=0.074,
+            citizen_vision=7,
+            cop_vision=7,
+            legitimacy=0.8,
+            max_jail_term=1000,
+            active_threshold=0.1,
+            arrest_prob_constant=2.3,
+            movement=True,
+            max_iters=1000,
+            alpha=0.1,
+            jail_factor=1.1,
+            legitimacy_impact=0.2,
+            legitimacy_type="basic",  # "basic", "heterogeneous", "by_regions"
+            legitimacy_matrix=None,
+            use_mean_field=True,
+            legitimacy_width=0.1,
+            cop_density_mode='constant',  # Parameter to select the change mode of cop density (constant, gradual)
+            legitimacy_mode='constant',  # Parameter to select the change mode of legitimacy (constant, gradual, drop)
+            legitimacy_drop=0.3,
+            seed=None,
+            agent_snapshot_every=None,
+            agent_snapshot_steps=(),
+            trajectory_path=None,
+            convergence=None,
+            num_workers=1
+    ):
+        super().__init__()
+        if min(width, height) < 3:
+            raise ValueError("The tiled engine needs a grid of at least 3x3 cells")
+        if not 1 <= num_workers <= width:
+            raise ValueError(f"num_workers must be between 1 and the grid width, got {num_workers}")
+        self.width = width
+        self.height = height
+        self.citizen_density = citizen_density
+        self.cop_density = cop_density
+        self.citizen_vision = citizen_vision
+        self.cop_vision = cop_vision
+        self.legitimacy = legitimacy
+        self.max_jail_term = max_jail_term
+        self.active_threshold = active_threshold
+        self.arrest_prob_constant = arrest_prob_constant
+        self.movement = movement
+        self.max_iters = max_iters
+        self.alpha = alpha
+        self.jail_factor = jail_factor
+        self.legitimacy_impact = legitimacy_impact
+        self.use_mean_field = bool(use_mean_field)
+        self.cop_density_mode = cop_density_mode
+        self.legitimacy_mode = legitimacy_mode
+        self.legitimacy_drop = legitimacy_drop
+        self.convergence = ConvergenceMonitor(**convergence) if convergence is not None else None
+        self.legitimacy_stability_threshold = 0.005
+        self.num_workers = num_workers
+        self.halo = max(citizen_vision, cop_vision, 1)
+        self.iteration = 0
+        self.active_outburst = False
+        self.last_outburst_ended = 0
+        self.waiting_times = []
+        self.outburst_sizes = []
+        self.current_outburst_size = 0
+        self.streams = RandomStreams(seed)
+        self.cell_streams = CellStreams(self.streams.seed_sequence.entropy)
+
+        if self.cop_density + self.citizen_density > 1:
+            raise ValueError("Cop density + citizen density must be less than 1")
+
+        self.state = {
+            name: shared_array((width, height), dtype)
+            for name, dtype in {**STATE_DTYPES, **SCRATCH_DTYPES}.items()
+        }
+        self.flat = {name: array.reshape(-1) for name, array in self.state.items()}
+        self.tallies = shared_array((num_workers, len(TALLY_COLUMNS)), np.float64)
+        self.waiting = shared_array(num_workers, np.int64)
+
+        # initial population drawn as arrays over all cells
+        num_cells = width * height
+        init = self.streams.initialization
+        is_cop = init.uniforms(num_cells) < self.cop_density
+        is_citizen = ~is_cop & (
+            init.uniforms(num_cells) < (self.cop_density + self.citizen_density)
+        )
+        cells = np.flatnonzero(is_cop | is_citizen)
+        citizen_cells = np.flatnonzero(is_citizen)
+        flat = self.flat
+        flat["occupant"][:] = EMPTY
+        flat["occupant"][cells] = np.arange(len(cells))
+        flat["breed"][cells] = np.where(is_cop[cells], COP, CITIZEN)
+        flat["condition"][:] = QUIESCENT
+        flat["hardship"][citizen_cells] = init.uniforms(len(citizen_cells))
+        flat["risk_aversion"][citizen_cells] = init.uniforms(len(citizen_cells))
+        legitimacy_field, average_legitimacy = initial_legitimacy(
+            is_citizen.reshape(width, height),
+            self.legitimacy,
+            legitimacy_type,
+            legitimacy_width,
+            legitimacy_matrix,
+            init,
+        )
+        flat["regime_legitimacy"][citizen_cells] = legitimacy_field.ravel()[citizen_cells]
+        flat["average_legitimacy"][citizen_cells] = average_legitimacy
+        flat["target"][:] = EMPTY
+        self.total_citizen = len(citizen_cells)
+
+        bounds = np.linspace(0, width, num_workers + 1).astype(int)
+        self.bounds = list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+        self._workers = None
+
+        model_reporters = {
+            "Quiescent": lambda m: self.tally["Quiescent"],
+            "Active": lambda m: self.tally["Active"],
+            "Jailed": lambda m: self.tally["Jailed"],
+            "Cops": lambda m: self.tally["Cops"],
+            "Waiting_Times": lambda m: self.waiting_times,
+            "Legitimacy": lambda m: self.legitimacy,
+            "Cop_Density": lambda m: self.cop_density,
+            "Stable Agents": lambda m: self.tally["Stable Agents"],
+            "Active_Ratio": lambda m: self.tally["Active"] / self.total_citizen,
+            "Mean_Legitimacy": lambda m: self.tally["Mean_Legitimacy"],
+        }
+        self.datacollector = ColumnarDataCollector(
+            model_reporters=model_reporters,
+            agent_snapshot_every=agent_snapshot_every,
+            agent_snapshot_steps=agent_snapshot_steps,
+            capacity=max_iters + 2,
+        )
+        if trajectory_path is not None:
+            self.datacollector.trajectory = TrajectoryStore.create(
+                trajectory_path, self.agent_snapshot()["unique_id"], capacity=max_iters + 2
+            )
+        self.running = True
+        self.stop_reason = None
+        for index, (x0, x1) in enumerate(self.bounds):
+            Tile(self, index, x0, x1, _SingleProcessBarrier()).tally()
+        self.update_tally()
+        self.datacollector.collect(self)
+
+    def agent_snapshot(self):
+        """
+        Agent level state as one array per column in unique_id order, for
+        the data collector.
+        """
+        flat = self.flat
+        cells = np.flatnonzero(flat["occupant"] != EMPTY)
+        cells = cells[np.argsort(flat["occupant"][cells], kind="stable")]
+        citizens = flat["breed"][cells] == CITIZEN
+        x, y = np.divmod(cells, self.height)
+        return {
+            "unique_id": flat["occupant"][cells],
+            "x": x,
+            "y": y,
+            "breed": flat["breed"][cells],
+            "jail_sentence": flat["jail_sentence"][cells],
+            "condition": np.where(citizens, flat["condition"][cells], MISSING_CODE),
+            "arrest_probability": np.where(citizens, flat["arrest_probability"][cells], np.nan),
+            "regime_legitimacy": np.where(citizens, flat["regime_legitimacy"][cells], np.nan),
+        }
+
+    def step(self):
+        active_count = self.tally["Active"]
+        if self.iteration == LEGITIMACY_DROP_ITERATION and self.legitimacy_mode == 'drop':
+            self.legitimacy = max(0, self.legitimacy - self.legitimacy_drop)
+        elif self.legitimacy_mode == 'gradual':
+            self.legitimacy = max(0, self.legitimacy - 0.001)
+        if self.cop_density_mode == 'gradual':
+            self.cop_density = max(0, self.cop_density - 0.00005)
+
+        if active_count >= 100 and not self.active_outburst:
+            if self.last_outburst_ended != 0:
+                wait_time = self.iteration - self.last_outburst_ended
+                self.waiting_times.append(wait_time)
+            self.active_outburst = True
+        if active_count < 100 and self.active_outburst:
+            self.last_outburst_ended = self.iteration
+            self.active_outburst = False
+
+        if active_count >= 100:
+            self.current_outburst_size += active_count
+        else:
+            if self.current_outburst_size > 0:
+                self.outburst_sizes.append(self.current_outburst_size)
+                self.current_outburst_size = 0
+
+        self.advance_agents()
+        self.update_tally()
+        self.datacollector.collect(self)
+        self.iteration += 1
+        self._steps += 1
+        update_running(self)
+        if not self.running:
+            self.close()
+
+    def advance_agents(self):
+        """
+        Step every tile once, in this process for a single tile or in the
+        workers otherwise.
+        """
+        if self.num_workers == 1:
+            x0, x1 = self.bounds[0]
+            Tile(self, 0, x0, x1, _SingleProcessBarrier()).step(self.iteration)
+            return
+        if self._workers is None:
+            self.start_workers()
+        for _, connection in self._workers:
+            connection.send(("step", self.iteration))
+        errors = []
+        for _, connection in self._workers:
+            status, message = connection.recv()
+            if status == "error":
+                errors.append(message)
+        if errors:
+            self.close()
+            raise RuntimeError("A tile worker failed:\n" + errors[0])
+
+    def start_workers(self):
+        """
+        Fork one process per tile; they inherit the shared state arrays.
+        """
+        context = multiprocessing.get_context("fork")
+        barrier = context.Barrier(self.num_workers)
+        self._workers = []
+        for index, (x0, x1) in enumerate(self.bounds):
+            parent, child = context.Pipe()
+            tile = Tile(self, index, x0, x1, barrier)
+            process = context.Process(target=_serve, args=(tile, child), daemon=True)
+            process.start()
+            child.close()
+            self._workers.append((process, parent))
+
+    def close(self):
+        """
+        Stop the worker processes; the state stays readable.
+        """
+        if not self._workers:
+            return
+        for process, connection in self._workers:
+            if process.is_alive():
+                try:
+                    connection.send(("close", None))
+                except (BrokenPipeError, OSError):
+                    pass
+        for process, connection in self._workers:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+            connection.close()
+        self._workers = None
+
+    def update_tally(self):
+        """
+        Sum the counts the tiles reported for their cells.
+        """
+        totals = dict(zip(TALLY_COLUMNS, self.tallies.sum(axis=0).tolist()))
+        citizens = totals["Quiescent"] + totals["Active"] + totals["Jailed"]
+        self.tally = {
+            name: int(totals[name])
+            for name in ("Quiescent", "Active", "Jailed", "Cops", "Stable Agents")
+        }
+        self.tally["Mean_Legitimacy"] = totals["Legitimacy_Sum"] / citizens if citizens else np.nan
@@ -0,0 +1,171 @@
+# Memory-mapped per-step agent trajectories.
+import json
+import os
+
+import numpy as np
+
+from mean_field_civil_violence.datacollection import AGENT_CODES, AGENT_DTYPES
+
+# Columns written per step; unique ids are stored once.
+TRAJECTORY_COLUMNS = {
+    name: dtype for name, dtype in AGENT_DTYPES.items()
+    if name not in ("unique_id", "arrest_probability")
+}
+
+
+class TrajectoryStore:
+    """
+    Agent state of every step in step x agent memory-mapped files, one raw
+    binary file per column with the compact dtypes of TRAJECTORY_COLUMNS
+    (uint16 positions and jail sentences, uint8 breed and condition codes,
+    float32 regime legitimacy), the unique ids in unique_id.bin, the step
+    count in num_steps.bin and a small JSON header written once.
+    A run appends one row per collected step and then stores the step count
+    in the memory-mapped num_steps.bin, so a reader opening the store mid-run
+    or after a crash sees every complete step and an append writes no file
+    of its own. The capacity follows from the size of the column files.
+    Readers map the files and slice them lazily, so trajectories never have
+    to fit in memory.
+    Stores are context managers that close on exit.
+    Attributes:
+        path: directory holding the store
+        num_agents: number of agents (columns of every array)
+        num_steps: number of steps written
+        unique_id: unique id of the agent behind every column
+    """
+
+    HEADER = "trajectory.json"
+    UNIQUE_ID = "unique_id.bin"
+    NUM_STEPS = "num_steps.bin"
+
+    def __init__(self, path, num_agents, unique_id, num_steps, capacity, mode):
+        self.path = path
+        self.num_agents = num_agents
+        self.unique_id = unique_id
+        self.num_steps = num_steps
+        self._capacity = capacity
+        self._mode = mode
+        self._arrays = {}
+        self._order = np.argsort(unique_id)
+        self._num_steps = np.memmap(
+            os.path.join(path, self.NUM_STEPS), dtype=np.int64, mode=mode, shape=(1,)
+        )
+        self._map(capacity)
+
+    @classmethod
+    def create(cls, path, unique_id, capacity=1024):
+        """
+        New, empty store for the agents `unique_id`, with room for
+        `capacity` steps before it has to grow.
+        """
+        os.makedirs(path, exist_ok=True)
+        unique_id = np.asarray(unique_id, dtype=AGENT_DTYPES["unique_id"])
+        capacity = max(1, capacity)
+        for name, dtype in TRAJECTORY_COLUMNS.items():
+            with open(cls._column_path(path, name), "wb") as f:
+                f.truncate(capacity * len(unique_id) * np.dtype(dtype).itemsize)
+        unique_id.tofile(os.path.join(path, cls.UNIQUE_ID))
+        np.zeros(1, dtype=np.int64).tofile(os.path.join(path, cls.NUM_STEPS))
+        header = {
+            "columns": {name: np.dtype(dtype).str for name, dtype in TRAJECTORY_COLUMNS.items()},
+            "codes": {name: list(labels) for name, labels in AGENT_CODES.items()},
+        }
+        temporary = os.path.join(path, cls.HEADER + ".tmp")
+        with open(temporary, "w") as f:
+            json.dump(header, f)
+        os.replace(temporary, os.path.join(path, cls.HEADER))
+        return cls(path, len(unique_id), unique_id, 0, capacity, "r+")
+
+    @classmethod
+    def open(cls, path):
+        """
+        Read-only view of an existing store.
+        """
+        unique_id = np.fromfile(os.path.join(path, cls.UNIQUE_ID), dtype=AGENT_DTYPES["unique_id"])
+        num_steps = int(np.fromfile(os.path.join(path, cls.NUM_STEPS), dtype=np.int64)[0])
+        # columns grow one after the other; the smallest bounds them all
+        capacity = min(
+            os.path.getsize(cls._column_path(path, name)) // max(1, len(unique_id) * np.dtype(dtype).itemsize)
+            for name, dtype in TRAJECTORY_COLUMNS.items()
+        )
+        return cls(path, len(unique_id), unique_id, min(num_steps, capacity), capacity, "r")
+
+    @staticmethod
+    def _column_path(path, name):
+        return os.path.join(path, name + ".bin")
+
+    def _map(self, capacity):
+        self._arrays = {}
+        if self.num_agents == 0:
+            return
+        for name, dtype in TRAJECTORY_COLUMNS.items():
+            self._arrays[name] = np.memmap(
+                self._column_path(self.path, name),
+                dtype=dtype,
+                mode=self._mode,
+                shape=(capacity, self.num_agents),
+            )
+
+    def _grow(self):
+        self.flush()
+        capacity = 2 * self._capacity
+        self._arrays = {}
+        for name, dtype in TRAJECTORY_COLUMNS.items():
+            with open(self._column_path(self.path, name), "r+b") as f:
+                f.truncate(capacity * self.num_agents * np.dtype(dtype).itemsize)
+        self._capacity = capacity
+        self._map(capacity)
+
+    def append(self, snapshot):
+        """
+        Write one step; `snapshot` maps "unique_id" and every column to a
+        per-agent array, as the models' agent_snapshot() returns. Agents may
+        come in any order.
+        """
+        if self.num_steps == self._capacity:
+            self._grow()
+        columns = self.agent_columns(snapshot["unique_id"])
+        for name, array in self._arrays.items():
+            array[self.num_steps, columns] = snapshot[name]
+        self.num_steps += 1
+        # rows go to the shared mappings before the count that exposes them
+        self._num_steps[0] = self.num_steps
+
+    def flush(self):
+        """
+        Push written rows and the step count to disk.
+        """
+        for array in self._arrays.values():
+            array.flush()
+        self._num_steps.flush()
+
+    def close(self):
+        if self._mode == "r+" and self._num_steps is not None:
+            self.flush()
+        self._arrays = {}
+        self._num_steps = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getitem__(self, name):
+        """
+        (num_steps, num_agents) memory-mapped view of a column.
+        """
+        return self._arrays[name][:self.num_steps]
+
+    def read(self, name, steps=slice(None), agents=slice(None)):
+        """
+        Lazily slice a column by step and agent. Slices return views of the
+        mapped file; index arrays copy only the selected entries.
+        """
+        return self[name][steps, agents]
+
+    def agent_columns(self, unique_ids):
+        """
+        Column positions of the agents `unique_ids`, for `read`.
+        """
+        return self._order[np.searchsorted(self.unique_id, unique_ids, sorter=self._order)]
@@ -0,0 +1,573 @@
+# Array-backed engine for the mean field civil violence model.
+import math
+
+import mesa
+import numpy as np
+
+from mean_field_civil_violence.convergence import LEGITIMACY_DROP_ITERATION, ConvergenceMonitor, update_running
+from mean_field_civil_violence.datacollection import (
+    ACTIVE,
+    CITIZEN,
+    COP,
+    MISSING_CODE,
+    QUIESCENT,
+    ColumnarDataCollector,
+)
+from mean_field_civil_violence.diffusion import mean_field_step
+from mean_field_civil_violence.rng import RandomStreams
+from mean_field_civil_violence.space import get_neighborhood_table, toroidal_window_sum
+from mean_field_civil_violence.trajectory import TrajectoryStore
+
+EMPTY = -1
+
+# Random cells an agent draws within vision before counting the empty ones
+# (CivilViolenceGrid.sample_empty_cell).
+MAX_TRIES = 16
+
+
+def estimate_arrest_probability(cops_in_vision, actives_in_vision, arrest_prob_constant):
+    """
+    1 - exp(-arrest_prob_constant * cops / actives) for every pair of counts,
+    with math.exp as the agents compute it (NumPy's exp may differ in the
+    last bit); there are few distinct pairs.
+    """
+    pairs, inverse = np.unique(
+        np.stack([cops_in_vision, actives_in_vision], axis=1), axis=0, return_inverse=True
+    )
+    probability = np.array([
+        1 - math.exp(-1 * arrest_prob_constant * (cops / actives))
+        for cops, actives in pairs.tolist()
+    ], dtype=np.float64)
+    return probability[inverse.reshape(-1)]
+
+
+class VectorizedNetworkCivilViolence(mesa.Model):
+    """
+    EpsteinNetworkCivilViolence with activation="synchronous" on array
+    state. Every agent is a row in a set of NumPy arrays (breed, hardship,
+    risk_aversion, regime_legitimacy, condition, release, jail_sentence,
+    arrest_probability and cell), its row being its unique_id. Agents are
+    placed with the same draws as the agent based model, and a step goes
+    through the phases of EpsteinNetworkCivilViolence.step_synchronous
+    consuming the random streams in the same order: the decisions of all
+    free citizens are batched array operations on the state at the start
+    of the step, while the arrests (cops one after the other in unique_id
+    order) and the moves (citizens twice, contested cells given to a random
+    claimant) go agent by agent, since each depends on the ones before it.
+    For the same seed a run reproduces the synchronous activation of the
+    agent based model; KernelNetworkCivilViolence does the same for its
+    default random activation.
+    Attributes:
+        height: grid height
+        width: grid width
+        citizen_density: approximate % of cells occupied by citizens.
+        cop_density: approximate % of cells occupied by cops.
+        citizen_vision: number of cells in each direction (N, S, E and W) that
+            citizen can inspect
+        cop_vision: number of cells in each direction (N, S, E and W) that cop
+            can inspect
+        legitimacy:  (L) citizens' perception of regime legitimacy, equal
+            across all citizens
+        max_jail_term: (J_max)
+        active_threshold: if (grievance - (risk_aversion * arrest_probability))
+            > threshold, citizen rebels
+        arrest_prob_constant: set to ensure agents make plausible arrest
+            probability estimates
+        movement: binary, whether agents try to move at step end
+        max_iters: model may not have a natural stopping point, so we set a
+            max.
+        alpha: Deterrent effect.
+        legitimacy_drop: legitimacy lost at LEGITIMACY_DROP_ITERATION when
+            legitimacy_mode is 'drop'.
+        seed: seed of the model's random streams (see RandomStreams).
+        agent_snapshot_every: record agent level data every this many steps;
+            None (the default) records none.
+        agent_snapshot_steps: steps at which agent level data is recorded in
+            any case.
+        trajectory_path: directory of a TrajectoryStore the state of every
+            agent is written to at every step; None writes none.
+        convergence: keyword arguments of a ConvergenceMonitor (e.g.
+            {"window": 50, "pad": True}) to stop the run once it settles;
+            None runs to max_iters. Why the run stopped is kept in
+            `stop_reason`.
+    """
+
+    def __init__(
+            self,
+            width=40,
+            height=40,
+            citizen_density=0.7,
+            cop_density=0.074,
+            citizen_vision=7,
+            cop_vision=7,
+            legitimacy=0.8,
+            max_jail_term=1000,
+            active_threshold=0.1,
+            arrest_prob_constant=2.3,
+            movement=True,
+            max_iters=1000,
+            alpha=0.1,
+            jail_factor=1.1,
+            legitimacy_impact=0.2,
+            legitimacy_type="basic",  # "basic", "heterogeneous", "by_regions"
+            legitimacy_matrix=None,
+            use_mean_field=True,
+            legitimacy_width=0.1,
+            cop_density_mode='constant',  # Parameter to select the change mode of cop density (constant, gradual)
+            legitimacy_mode='constant',  # Parameter to select the change mode of legitimacy (constant, gradual, drop)
+            legitimacy_drop=0.3,
+            seed=None,
+            agent_snapshot_every=None,
+            agent_snapshot_steps=(),
+            trajectory_path=None,
+            convergence=None
+    ):
+        super().__init__()
+        self.width = width
+        self.height = height
+        self.citizen_density = citizen_density
+        self.cop_density = cop_density
+        self.citizen_vision = citizen_vision
+        self.cop_vision = cop_vision
+        self.legitimacy = legitimacy
+        self.max_jail_term = max_jail_term
+        self.active_threshold = active_threshold
+        self.arrest_prob_constant = arrest_prob_constant
+        self.movement = movement
+        self.max_iters = max_iters
+        self.alpha = alpha
+        self.jail_factor = jail_factor
+        self.legitimacy_impact = legitimacy_impact
+        self.use_mean_field = bool(use_mean_field)
+        self.cop_density_mode = cop_density_mode
+        self.legitimacy_mode = legitimacy_mode
+        self.legitimacy_drop = legitimacy_drop
+        self.convergence = ConvergenceMonitor(**convergence) if convergence is not None else None
+        self.legitimacy_stability_threshold = 0.005
+        self.iteration = 0
+        self.active_outburst = False
+        self.last_outburst_ended = 0
+        self.waiting_times = []
+        self.outburst_sizes = []
+        self.current_outburst_size = 0
+        self.streams = RandomStreams(seed)
+
+        if self.cop_density + self.citizen_density > 1:
+            raise ValueError("Cop density + citizen density must be less than 1")
+
+        self.populate(legitimacy_type, legitimacy_width, legitimacy_matrix)
+
+        model_reporters = {
+            "Quiescent": lambda m: self.tally["Quiescent"],
+            "Active": lambda m: self.tally["Active"],
+            "Jailed": lambda m: self.tally["Jailed"],
+            "Cops": lambda m: self.tally["Cops"],
+            "Waiting_Times": lambda m: self.waiting_times,
+            "Legitimacy": lambda m: self.legitimacy,
+            "Cop_Density": lambda m: self.cop_density,
+            "Stable Agents": lambda m: self.tally["Stable Agents"],
+            "Active_Ratio": lambda m: self.tally["Active"] / self.total_citizen,
+            "Mean_Legitimacy": lambda m: self.tally["Mean_Legitimacy"],
+        }
+        self.datacollector = ColumnarDataCollector(
+            model_reporters=model_reporters,
+            agent_snapshot_every=agent_snapshot_every,
+            agent_snapshot_steps=agent_snapshot_steps,
+            capacity=max_iters + 2,
+        )
+        if trajectory_path is not None:
+            self.datacollector.trajectory = TrajectoryStore.create(
+                trajectory_path, self.agent_snapshot()["unique_id"], capacity=max_iters + 2
+            )
+        self.running = True
+        self.stop_reason = None
+        self.update_tally()
+        self.datacollector.collect(self)
+
+    def populate(self, legitimacy_type, legitimacy_width, legitimacy_matrix):
+        """
+        Place the initial agents with the same draws, in the same order, as
+        EpsteinNetworkCivilViolence.
+        """
+        init = self.streams.initialization
+        if legitimacy_matrix is not None:
+            legitimacy_matrix = np.asarray(legitimacy_matrix)
+            region_height = self.height / legitimacy_matrix.shape[0]
+            region_width = self.width / legitimacy_matrix.shape[1]
+        cells, breeds, attributes = [], [], []
+        for x in range(self.width):
+            for y in range(self.height):
+                if init.random() < self.cop_density:
+                    cells.append(x * self.height + y)
+                    breeds.append(COP)
+                    attributes.append((0.0, 0.0, 0.0, 0.0))
+                elif init.random() < (self.cop_density + self.citizen_density):
+                    regime_legitimacy = self.legitimacy
+                    average_legitimacy = self.legitimacy
+                    if legitimacy_type == "heterogeneous":
+                        regime_legitimacy = init.uniform(max(0, regime_legitimacy - legitimacy_width),
+                                                         min(1, regime_legitimacy + legitimacy_width))
+                    elif legitimacy_type == "by_regions" and legitimacy_matrix is not None:
+                        regime_legitimacy = legitimacy_matrix[int(y // region_height), int(x // region_width)]
+                        average_legitimacy = np.mean(legitimacy_matrix)
+                    hardship = init.random()
+                    risk_aversion = init.random()
+                    # Inhabitant draws whether her ideology changes, unused
+                    init.random()
+                    cells.append(x * self.height + y)
+                    breeds.append(CITIZEN)
+                    attributes.append((hardship, risk_aversion, regime_legitimacy, average_legitimacy))
+
+        num_agents = len(cells)
+        attributes = np.array(attributes, dtype=np.float64).reshape(num_agents, 4)
+        self.cell = np.array(cells, dtype=np.int64)
+        self.breed = np.array(breeds, dtype=np.uint8)
+        self.hardship = attributes[:, 0].copy()
+        self.risk_aversion = attributes[:, 1].copy()
+        self.regime_legitimacy = attributes[:, 2].copy()
+        self.average_legitimacy = attributes[:, 3].copy()
+        self.condition = np.full(num_agents, QUIESCENT, dtype=np.uint8)
+        # iteration in which a jailed citizen is freed, EMPTY when free;
+        # jail_sentence is what is left of her term after a step
+        self.release = np.full(num_agents, EMPTY, dtype=np.int64)
+        self.jail_sentence = np.zeros(num_agents, dtype=np.int64)
+        self.arrest_probability = np.zeros(num_agents)
+        self.is_stable = np.zeros(num_agents, dtype=bool)
+        self.total_citizen = int((self.breed == CITIZEN).sum())
+        self.occupant = np.full(self.width * self.height, EMPTY, dtype=np.int64)
+        self.occupant[self.cell] = np.arange(num_agents)
+        # deterrence of every jail term, as the agents compute it: NumPy's
+        # power may differ from Python's in the last bit
+        self.deterrence = np.array([term ** self.alpha for term in range(self.max_jail_term + 1)], dtype=np.float64)
+
+    @property
+    def pos(self):
+        """
+        (x, y) grid coordinates of every agent, one row per agent.
+        """
+        return np.stack(np.divmod(self.cell, self.height), axis=1)
+
+    def agent_snapshot(self):
+        """
+        Agent level state as one array per column, for the data collector.
+        """
+        citizens = self.breed == CITIZEN
+        x, y = np.divmod(self.cell, self.height)
+        return {
+            "unique_id": np.arange(len(self.cell)),
+            "x": x,
+            "y": y,
+            "breed": self.breed,
+            "jail_sentence": self.jail_sentence,
+            "condition": np.where(citizens, self.condition, MISSING_CODE),
+            "arrest_probability": np.where(citizens, self.arrest_probability, np.nan),
+            "regime_legitimacy": np.where(citizens, self.regime_legitimacy, np.nan),
+        }
+
+    def step(self):
+        active_count = self.tally["Active"]
+        if self.iteration == LEGITIMACY_DROP_ITERATION and self.legitimacy_mode == 'drop':
+            self.legitimacy = max(0, self.legitimacy - self.legitimacy_drop)
+        elif self.legitimacy_mode == 'gradual':
+            self.legitimacy = max(0, self.legitimacy - 0.001)
+        if self.cop_density_mode == 'gradual':
+            self.cop_density = max(0, self.cop_density - 0.00005)
+
+        if active_count >= 100 and not self.active_outburst:
+            if self.last_outburst_ended != 0:
+                wait_time = self.iteration - self.last_outburst_ended
+                self.waiting_times.append(wait_time)
+            self.active_outburst = True
+        if active_count < 100 and self.active_outburst:
+            self.last_outburst_ended = self.iteration
+            self.active_outburst = False
+
+        if active_count >= 100:
+            self.current_outburst_size += active_count
+        else:
+            if self.current_outburst_size > 0:
+                self.outburst_sizes.append(self.current_outburst_size)
+                self.current_outburst_size = 0
+
+        self.advance_agents()
+        self.update_tally()
+        self.datacollector.collect(self)
+        self.iteration += 1
+        self._steps += 1
+        update_running(self)
+
+    def advance_agents(self):
+        """
+        One step of EpsteinNetworkCivilViolence.step_synchronous: decisions,
+        arrests in unique_id order, two moves of the citizens still free and
+        one of the cops that arrested no one, then the releases due.
+        """
+        free = np.flatnonzero((self.breed == CITIZEN) & (self.release == EMPTY))
+        self.update_citizens(free)
+        self.arrest_and_move(free)
+
+    def arrest_and_move(self, free):
+        """
+        The phases of a step after the decisions of the citizens `free`,
+        which go agent by agent.
+        """
+        hunting = self.make_arrests()
+
+        if self.movement:
+            free = free[self.release[free] == EMPTY]
+            cops = np.flatnonzero(self.breed == COP)
+            idle_cops = cops[~np.isin(cops, hunting)]
+            origins = self.cell[free]
+            self.move_synchronously(np.concatenate([free, idle_cops]), np.concatenate([origins, self.cell[idle_cops]]))
+            self.move_synchronously(free, origins)
+
+        self.release_prisoners()
+
+    def grid_field(self, values, mask=None):
+        """
+        Scatter per-agent values onto a (width, height) grid; empty cells and
+        agents outside `mask` contribute zero.
+        """
+        field = np.zeros(self.width * self.height, dtype=np.float64)
+        if mask is None:
+            field[self.cell] = values
+        else:
+            field[self.cell[mask]] = values[mask] if np.ndim(values) else values
+        return field.reshape(self.width, self.height)
+
+    def active_mask(self):
+        return (
+            (self.breed == CITIZEN)
+            & (self.condition == ACTIVE)
+            & (self.release == EMPTY)
+        )
+
+    def update_citizens(self, free):
+        """
+        Arrest probability estimate, mean field legitimacy update and
+        activation decision of the free citizens `free`, all from the state
+        at the start of the step (Inhabitant.decide), then taken on at once.
+        """
+        if len(free) == 0:
+            return
+        cells = self.cell[free]
+        active = self.active_mask()
+        cops_field = self.grid_field(1.0, self.breed == COP)
+        actives_field = self.grid_field(1.0, active)
+        cops_in_vision = toroidal_window_sum(cops_field, self.citizen_vision).ravel()[cells]
+        actives_in_vision = 1.0 + (
+            toroidal_window_sum(actives_field, self.citizen_vision).ravel()[cells]
+            - active[free]
+        )
+        self.arrest_probability[free] = estimate_arrest_probability(
+            cops_in_vision, actives_in_vision, self.arrest_prob_constant
+        )
+
+        legitimacy = self.regime_legitimacy[free]
+        self.is_stable[free] = (
+            np.abs(legitimacy - self.average_legitimacy[free])
+            < self.legitimacy_stability_threshold
+        )
+
+        if self.use_mean_field:
+            citizens = self.breed == CITIZEN
+            legitimacy_field = mean_field_step(
+                self.grid_field(self.regime_legitimacy, citizens),
+                self.grid_field(1.0, citizens) > 0,
+                self.legitimacy_impact,
+            )
+            legitimacy = legitimacy_field.ravel()[cells]
+            self.regime_legitimacy[free] = legitimacy
+
+        grievance = self.hardship[free] * (1 - legitimacy)
+        jail_term = self.streams.activation.integers(0, self.max_jail_term + 1, len(free))
+        net_risk = self.risk_aversion[free] * self.arrest_probability[free] * self.deterrence[jail_term]
+        self.condition[free] = np.where(
+            grievance - net_risk > self.active_threshold, ACTIVE, QUIESCENT
+        )
+
+    def make_arrests(self):
+        """
+        The cops, one after the other in unique_id order, pick a random
+        active citizen in vision and arrest her with her estimated arrest
+        probability, as Police.pursue does; a citizen arrested by one cop is
+        no longer a target for the next. Cops without an active citizen in
+        vision at the start of the phase cannot find one later and are
+        skipped without drawing.
+        Returns the cops that found a target, in unique_id order.
+        """
+        active = self.active_mask()
+        cops = np.flatnonzero(self.breed == COP)
+        counts = toroidal_window_sum(self.grid_field(1.0, active), self.cop_vision).ravel()[self.cell[cops]]
+        candidates = cops[counts > 0].tolist()
+        table = get_neighborhood_table(self.width, self.height, True, self.cop_vision)
+        jail = self.streams.jail
+        # at most 8 + 1 draws next to the arrestee and MAX_TRIES + 1 in vision
+        draws = self.streams.movement.peek((MAX_TRIES + 10) * len(candidates)).tolist()
+        used = 0
+        # nobody moves while the cops arrest
+        occupant = self.occupant.tolist()
+        is_target = active.tolist()
+        hunting = []
+        for cop in candidates:
+            cell = int(self.cell[cop])
+            targets = [occupant[other] for other in table.row(cell) if occupant[other] != EMPTY and is_target[occupant[other]]]
+            if not targets:
+                continue
+            hunting.append(cop)
+            arrestee = jail.choice(targets)
+            if jail.random() < self.arrest_probability[arrestee]:
+                sentence = jail.randint(0, self.max_jail_term)
+                self.condition[arrestee] = QUIESCENT
+                is_target[arrestee] = False
+                if sentence:
+                    self.release[arrestee] = self.iteration + sentence
+            # the cop draws a cell next to the arrestee but stays put
+            near, used = self.sample_empty_cell_near(
+                occupant, int(self.cell[arrestee]), cell, self.cop_vision, draws, used
+            )
+            if near is None:
+                _, used = self.sample_empty_cell(occupant, cell, self.cop_vision, draws, used)
+        self.streams.movement.skip(used)
+        return np.array(hunting, dtype=np.int64)
+
+    def move_synchronously(self, movers, origins):
+        """
+        Move `movers` at once as EpsteinNetworkCivilViolence.move_synchronously
+        does: in order, each draws an empty cell within vision of its origin
+        (`origins`, one per mover) as the grid is before any of them moves,
+        then every cell drawn goes, in the order it was first drawn, to its
+        only claimant or to a random one of several.
+        """
+        vision = np.where(self.breed[movers] == COP, self.cop_vision, self.citizen_vision)
+        draws = self.streams.movement.peek((MAX_TRIES + 2) * len(movers)).tolist()
+        used = 0
+        occupant = self.occupant.tolist()
+        claims = {}
+        for mover, origin, radius in zip(movers.tolist(), origins.tolist(), vision.tolist()):
+            target, used = self.sample_empty_cell(occupant, origin, radius, draws, used)
+            if target is not None:
+                claims.setdefault(target, []).append(mover)
+        for target, claimants in claims.items():
+            winner = claimants[0]
+            if len(claimants) > 1:
+                winner = claimants[min(int(draws[used] * len(claimants)), len(claimants) - 1)]
+                used += 1
+            self.occupant[self.cell[winner]] = EMPTY
+            self.occupant[target] = winner
+            self.cell[winner] = target
+        self.streams.movement.skip(used)
+
+    def sample_empty_cell(self, occupant, origin, radius, draws, used, max_tries=MAX_TRIES):
+        """
+        CivilViolenceGrid.sample_empty_cell on flat cells: a uniformly random
+        cell of the Moore neighborhood of `origin` that is empty in
+        `occupant` (a list of the occupant of every cell), or None. Draws
+        are taken from the list `draws` from position `used` on, as
+        RandomStream.randrange would take them.
+        Returns:
+            (cell, position of the next unused draw)
+        """
+        row = get_neighborhood_table(self.width, self.height, True, radius).row(origin)
+        size = len(row)
+        if not size:
+            return None, used
+        for position in range(used, used + max_tries):
+            cell = row[min(int(draws[position] * size), size - 1)]
+            if occupant[cell] == EMPTY:
+                return cell, position + 1
+        return self._pick_eligible(row, lambda cell: occupant[cell] == EMPTY, draws, used + max_tries)
+
+    def sample_empty_cell_near(self, occupant, target, origin, radius, draws, used):
+        """
+        CivilViolenceGrid.sample_empty_cell_near on flat cells: a uniformly
+        random cell next to `target` within `radius` of `origin` that is
+        empty in `occupant`, or None, drawn as in `sample_empty_cell`.
+        """
+        row = get_neighborhood_table(self.width, self.height, True, 1).row(target)
+        origin_x, origin_y = divmod(origin, self.height)
+
+        def eligible(cell):
+            if occupant[cell] != EMPTY:
+                return False
+            cell_x, cell_y = divmod(cell, self.height)
+            dx = abs(cell_x - origin_x)
+            dy = abs(cell_y - origin_y)
+            return min(dx, self.width - dx) <= radius and min(dy, self.height - dy) <= radius
+
+        size = len(row)
+        for position in range(used, used + size):
+            cell = row[min(int(draws[position] * size), size - 1)]
+            if eligible(cell):
+                return cell, position + 1
+        return self._pick_eligible(row, eligible, draws, used + size)
+
+    @staticmethod
+    def _pick_eligible(row, eligible, draws, used):
+        cells = [cell for cell in row if eligible(cell)]
+        if not cells:
+            return None, used
+        return cells[min(int(draws[used] * len(cells)), len(cells) - 1)], used + 1
+
+    def release_prisoners(self):
+        """
+        Free the citizens whose sentence ends this iteration, with their
+        regime legitimacy raised by the jail factor, and update what is
+        left of the others' sentences.
+        """
+        released = self.release == self.iteration
+        self.regime_legitimacy[released] = np.clip(
+            self.regime_legitimacy[released] * self.jail_factor, 0, 1
+        )
+        self.release[released] = EMPTY
+        jailed = self.release != EMPTY
+        self.jail_sentence[:] = 0
+        self.jail_sentence[jailed] = self.release[jailed] - self.iteration
+
+    def update_tally(self):
+        """
+        Count quiescent, active and jailed citizens, cops and stable agents,
+        and average the citizens' regime legitimacy, once per step for the
+        reporters, the outburst logic and the convergence monitor.
+        """
+        citizens = self.breed == CITIZEN
+        free = citizens & (self.jail_sentence == 0)
+        active = np.count_nonzero(free & (self.condition == ACTIVE))
+        self.tally = {
+            "Quiescent": int(np.count_nonzero(free)) - int(active),
+            "Active": int(active),
+            "Jailed": int(np.count_nonzero(citizens)) - int(np.count_nonzero(free)),
+            "Cops": len(citizens) - int(np.count_nonzero(citizens)),
+            "Stable Agents": int(np.count_nonzero(self.is_stable & citizens)),
+            # summed one after the other in unique_id order, as the agent
+            # based model does
+            "Mean_Legitimacy": (
+                float(np.cumsum(self.regime_legitimacy[citizens])[-1]) / self.total_citizen
+                if citizens.any() else np.nan
+            ),
+        }
+
+    def count_type_citizens(self, condition, exclude_jailed=True):
+        """
+        Helper method to count agents by Quiescent/Active.
+        """
+        code = ACTIVE if condition == "Active" else QUIESCENT
+        mask = (self.breed == CITIZEN) & (self.condition == code)
+        if exclude_jailed:
+            mask &= self.jail_sentence == 0
+        return int(mask.sum())
+
+    def count_jailed(self):
+        """
+        Helper method to count jailed agents.
+        """
+        return int(((self.breed == CITIZEN) & (self.jail_sentence > 0)).sum())
+
+    def count_cops(self):
+        """
+        Helper method to count cops.
+        """
+        return int((self.breed == COP).sum())
+
+    def count_stable_agents(self):
+        return int((self.is_stable & (self.breed == CITIZEN)).sum())
@@ -0,0 +1,20 @@
+import numpy as np
+
+from mean_field_civil_violence.batched import BATCH_REPORTERS, BatchedNetworkCivilViolence
+from mean_field_civil_violence.vectorized import VectorizedNetworkCivilViolence
+
+PARAMS = dict(width=20, height=20, legitimacy=0.6, cop_density=0.06, max_jail_term=5, max_iters=30)
+
+
+def test_batch_rows_are_the_vectorized_runs():
+    seeds = [3, 11, 42]
+    batch = BatchedNetworkCivilViolence(PARAMS, seeds)
+    batch.run(30)
+    for row, seed in enumerate(seeds):
+        model = VectorizedNetworkCivilViolence(**PARAMS, seed=seed)
+        for _ in range(30):
+            model.step()
+        model_vars = model.datacollector.model_vars
+        for name in BATCH_REPORTERS:
+            np.testing.assert_array_equal(batch.series[name][row, :batch.iteration + 1], model_vars[name])
+        assert batch.outburst_sizes[row] == model.outburst_sizes
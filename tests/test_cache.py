@@ -0,0 +1,35 @@
+import numpy as np
+
+from mean_field_civil_violence.cache import RunCache
+from mean_field_civil_violence.ensemble import run_ensemble
+from mean_field_civil_violence.model import EpsteinNetworkCivilViolence
+
+PARAMS = {"width": 12, "height": 12}
+
+
+def test_run_cache_round_trip(tmp_path):
+    cache = RunCache(str(tmp_path))
+    series = cache.run(EpsteinNetworkCivilViolence, PARAMS, seed=7, steps=5)
+    assert len(cache.entries(width=12)) == 1
+    # the same parameters, in another order and with defaults spelled out
+    cached = cache.get(
+        EpsteinNetworkCivilViolence, {"height": 12, "width": 12, "legitimacy": 0.8}, 7, 5,
+        ["Active", "Jailed"],
+    )
+    for name in ("Active", "Jailed"):
+        np.testing.assert_array_equal(cached[name], series[name])
+    assert cache.get(EpsteinNetworkCivilViolence, PARAMS, 8, 5) is None
+    assert cache.get(EpsteinNetworkCivilViolence, PARAMS, 7, 5, ["Not_A_Reporter"]) is None
+    cache.close()
+
+
+def test_ensemble_uses_the_cache_only_with_a_seed(tmp_path):
+    cache = RunCache(str(tmp_path))
+    first = run_ensemble(PARAMS, 2, 5, ["Active"], processes=1, seed=3, cache=cache)
+    assert len(cache.entries()) == 2
+    second = run_ensemble(PARAMS, 2, 5, ["Active"], processes=1, seed=3, cache=cache)
+    np.testing.assert_array_equal(first["Active"], second["Active"])
+
+    run_ensemble(PARAMS, 2, 5, ["Active"], processes=1, seed=None, cache=cache)
+    assert len(cache.entries()) == 2
+    cache.close()
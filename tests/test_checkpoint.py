@@ -0,0 +1,50 @@
+import numpy as np
+
+from mean_field_civil_violence.checkpoint import ModelSnapshot
+from mean_field_civil_violence.model import EpsteinNetworkCivilViolence
+
+PARAMS = dict(width=20, height=20, legitimacy=0.6, cop_density=0.06, max_jail_term=8, max_iters=40, seed=5)
+
+
+def finish(model):
+    while model.running:
+        model.step()
+    return model
+
+
+def assert_same_run(ours, theirs):
+    for name, values in theirs.datacollector.model_vars.items():
+        if name == "Waiting_Times":
+            assert ours.datacollector.model_vars[name] == values
+        else:
+            np.testing.assert_array_equal(ours.datacollector.model_vars[name], values)
+    ours_agents, theirs_agents = ours.agent_snapshot(), theirs.agent_snapshot()
+    ours_order = np.argsort(ours_agents["unique_id"])
+    theirs_order = np.argsort(theirs_agents["unique_id"])
+    for name, values in theirs_agents.items():
+        np.testing.assert_array_equal(np.asarray(ours_agents[name])[ours_order], np.asarray(values)[theirs_order])
+
+
+def test_restored_snapshot_resumes_the_run_exactly(tmp_path):
+    model = EpsteinNetworkCivilViolence(**PARAMS)
+    for _ in range(20):
+        model.step()
+    assert model.tally["Jailed"] > 0
+    path = str(tmp_path / "snapshot.pkl")
+    model.snapshot().save(path)
+
+    restored = finish(EpsteinNetworkCivilViolence.restore(ModelSnapshot.load(path)))
+    assert_same_run(restored, finish(model))
+
+
+def test_fork_keeps_the_shared_warmup():
+    model = EpsteinNetworkCivilViolence(**PARAMS)
+    for _ in range(10):
+        model.step()
+    same, other = EpsteinNetworkCivilViolence.fork(model.snapshot(), [{}, {"legitimacy_drop": 0.5}])
+    finish(model)
+    assert_same_run(finish(same), model)
+    finish(other)
+    np.testing.assert_array_equal(
+        other.datacollector.model_vars["Active"][:11], model.datacollector.model_vars["Active"][:11]
+    )
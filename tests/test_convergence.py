@@ -0,0 +1,44 @@
+import numpy as np
+
+from mean_field_civil_violence.model import EpsteinNetworkCivilViolence
+
+PARAMS = dict(width=20, height=20, legitimacy=0.85, legitimacy_type="heterogeneous", max_iters=300, seed=1)
+WINDOW = 10
+
+
+def run(pad):
+    model = EpsteinNetworkCivilViolence(**PARAMS, convergence={"window": WINDOW, "stable_share": 0.9, "pad": pad})
+    while model.running:
+        model.step()
+    return model
+
+
+def converged(model_vars, total_citizen, iteration):
+    stable = model_vars["Stable Agents"][iteration] / total_citizen >= 0.9
+    variance = np.var(model_vars["Active_Ratio"][iteration - WINDOW + 1:iteration + 1]) <= 1e-4
+    legitimacy = model_vars["Mean_Legitimacy"]
+    drift = abs(legitimacy[iteration] - legitimacy[iteration - WINDOW]) <= 1e-3
+    return stable and variance and drift
+
+
+def test_run_stops_at_the_first_steady_window():
+    model = run(pad=False)
+    stop = model.iteration
+    assert WINDOW < stop < PARAMS["max_iters"]
+    assert model.stop_reason.startswith(f"steady state at iteration {stop} ")
+    model_vars = model.datacollector.model_vars
+    assert len(model_vars["Active"]) == stop + 1
+    assert converged(model_vars, model.total_citizen, stop)
+    for iteration in range(WINDOW, stop):
+        assert not converged(model_vars, model.total_citizen, iteration)
+
+
+def test_padded_series_line_up_with_full_runs():
+    padded, plain = run(pad=True), run(pad=False)
+    assert padded.iteration == plain.iteration
+    stop = plain.iteration
+    for name, values in padded.datacollector.model_vars.items():
+        assert len(values) == PARAMS["max_iters"] + 2
+        if name != "Waiting_Times":
+            np.testing.assert_array_equal(values[:stop + 1], plain.datacollector.model_vars[name])
+            assert np.all(np.asarray(values[stop:]) == values[stop])
@@ -0,0 +1,32 @@
+import numpy as np
+
+from mean_field_civil_violence.datacollection import ColumnarDataCollector
+from mean_field_civil_violence.model import EpsteinNetworkCivilViolence
+
+
+def test_integral_column_becomes_float_on_a_fractional_value():
+    values = iter([1, 2, 2.5, 3])
+    collector = ColumnarDataCollector({"value": lambda model: next(values)}, capacity=2)
+    for _ in range(4):
+        collector.collect(None)
+    column = collector.model_vars["value"]
+    assert column.dtype == np.float64
+    np.testing.assert_array_equal(column, [1.0, 2.0, 2.5, 3.0])
+
+
+def test_counts_stay_integral():
+    collector = ColumnarDataCollector({"count": lambda model: 4})
+    collector.collect(None)
+    assert collector.model_vars["count"].dtype == np.int64
+
+
+def test_gradual_legitimacy_from_one_is_not_truncated():
+    model = EpsteinNetworkCivilViolence(
+        width=10, height=10, legitimacy=1, legitimacy_mode="gradual", max_iters=5, seed=0
+    )
+    for _ in range(5):
+        model.step()
+    legitimacy = model.datacollector.model_vars["Legitimacy"]
+    assert legitimacy[0] == 1
+    assert legitimacy[-1] == model.legitimacy
+    assert 0.99 < model.legitimacy < 1
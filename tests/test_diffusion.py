@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from mean_field_civil_violence.datacollection import CITIZEN
+from mean_field_civil_violence.diffusion import mean_field_step
+from mean_field_civil_violence.model import EpsteinNetworkCivilViolence
+
+INITIALIZATIONS = {
+    "basic": {},
+    "heterogeneous": dict(legitimacy_width=0.3),
+    "by_regions": dict(legitimacy_matrix=np.array([[0.2, 0.9, 0.4], [0.6, 0.1, 0.8]])),
+}
+
+
+@pytest.mark.parametrize("legitimacy_type", sorted(INITIALIZATIONS))
+def test_mean_field_step_is_the_per_agent_update(legitimacy_type):
+    model = EpsteinNetworkCivilViolence(
+        width=18, height=12, legitimacy_type=legitimacy_type, legitimacy_impact=0.4, max_iters=10, seed=5,
+        **INITIALIZATIONS[legitimacy_type],
+    )
+    for _ in range(3):
+        model.step()
+    citizens = [agent for agent in model.population() if agent.breed_code == CITIZEN]
+    legitimacy, mask = model.grid.mean_field.arrays()
+    expected = np.zeros_like(legitimacy)
+    for citizen in citizens:
+        assert legitimacy[citizen.pos] == citizen.regime_legitimacy
+        assert mask[citizen.pos]
+        expected[citizen.pos] = citizen.mean_field_legitimacy(citizen.update_next_neighbors())
+        # the field gives the per-agent update to the bit
+        assert model.grid.mean_field.update_at(citizen.pos, citizen.legitimacy_impact) == expected[citizen.pos]
+    assert mask.sum() == len(citizens)
+    # the stencil sums in another order
+    np.testing.assert_allclose(mean_field_step(legitimacy, mask, 0.4), expected, rtol=0, atol=1e-14)
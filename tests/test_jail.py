@@ -0,0 +1,64 @@
+import mesa
+import numpy as np
+
+from mean_field_civil_violence import model as model_module
+from mean_field_civil_violence.agent import Inhabitant
+from mean_field_civil_violence.datacollection import QUIESCENT
+from mean_field_civil_violence.model import EpsteinNetworkCivilViolence
+
+PARAMS = dict(width=20, height=20, legitimacy=0.6, cop_density=0.06, max_jail_term=5, max_iters=30, seed=2)
+
+
+def run(model):
+    while model.running:
+        model.step()
+    return model
+
+
+def test_jail_activation_steps_only_free_citizens(monkeypatch):
+    step = Inhabitant.step
+
+    def free_step(self):
+        assert self.release is None
+        step(self)
+
+    monkeypatch.setattr(Inhabitant, "step", free_step)
+    model = run(EpsteinNetworkCivilViolence(**PARAMS))
+    assert max(model.datacollector.model_vars["Jailed"]) > 0
+
+
+def test_jail_activation_gives_the_sentence_countdown(monkeypatch):
+    ours = run(EpsteinNetworkCivilViolence(**PARAMS))
+
+    # the original model: every agent stepped in a shuffled order, a jailed
+    # citizen counting her sentence down at her turn and leaving at zero
+    sentences = {}
+    released = []
+    step = Inhabitant.step
+
+    def countdown_step(self):
+        if self in sentences:
+            sentences[self] -= 1
+            if not sentences[self]:
+                del sentences[self]
+                released.append(self)
+                self.model.release_prisoner(self)
+            return
+        step(self)
+
+    def arrest(self, citizen, sentence):
+        citizen.condition_code = QUIESCENT
+        if sentence:
+            sentences[citizen] = sentence
+            self.imprison(citizen, self.iteration + sentence)
+        self.grid.refresh(citizen)
+
+    monkeypatch.setattr(model_module, "JailActivation", mesa.time.RandomActivation)
+    monkeypatch.setattr(Inhabitant, "step", countdown_step)
+    monkeypatch.setattr(EpsteinNetworkCivilViolence, "arrest", arrest)
+    theirs = run(EpsteinNetworkCivilViolence(**PARAMS))
+
+    assert released
+    for name in ("Active", "Jailed", "Quiescent", "Mean_Legitimacy"):
+        np.testing.assert_array_equal(ours.datacollector.model_vars[name], theirs.datacollector.model_vars[name])
+    assert [(a.unique_id, a.pos) for a in ours.population()] == [(a.unique_id, a.pos) for a in theirs.population()]
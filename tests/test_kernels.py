@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from mean_field_civil_violence.kernels import KernelNetworkCivilViolence
+from mean_field_civil_violence.model import EpsteinNetworkCivilViolence
+
+PARAMS = dict(width=20, height=20, legitimacy=0.6, cop_density=0.06, max_jail_term=5, max_iters=30)
+SERIES = ("Active", "Jailed", "Quiescent")
+
+
+def run(model):
+    while model.running:
+        model.step()
+    return model.datacollector.model_vars
+
+
+@pytest.mark.parametrize("seed", [1, 2])
+def test_kernel_reproduces_agent_model(seed):
+    ours = run(KernelNetworkCivilViolence(**PARAMS, seed=seed, backend="python"))
+    theirs = run(EpsteinNetworkCivilViolence(**PARAMS, seed=seed))
+    assert max(theirs["Jailed"]) > 0
+    for name in SERIES:
+        np.testing.assert_array_equal(ours[name], theirs[name])
+
+
+def test_kernel_scans_vision_windows_that_wrap():
+    # vision 7 windows cover a 12 cell wide torus more than once
+    params = dict(PARAMS, width=12, height=14)
+    ours = run(KernelNetworkCivilViolence(**params, seed=3, backend="python"))
+    theirs = run(EpsteinNetworkCivilViolence(**params, seed=3))
+    assert max(theirs["Jailed"]) > 0
+    for name in SERIES:
+        np.testing.assert_array_equal(ours[name], theirs[name])
+
+
+def test_numba_backend_matches_python():
+    pytest.importorskip("numba")
+    compiled = KernelNetworkCivilViolence(**PARAMS, seed=3, backend="numba")
+    assert compiled.backend == "numba"
+    ours = run(compiled)
+    theirs = run(KernelNetworkCivilViolence(**PARAMS, seed=3, backend="python"))
+    for name in SERIES + ("Mean_Legitimacy",):
+        np.testing.assert_array_equal(ours[name], theirs[name])
@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+import pytest
+
+from mean_field_civil_violence import results
+from mean_field_civil_violence.results import ResultStore
+
+CONDITIONS = {"legitimacy_type": "U16", "alpha": np.float64}
+
+
+def series(value, length=6):
+    return {"Active_Ratio": np.full(length, value, dtype=float)}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ResultStore.create(str(tmp_path / "runs.cvr"), ["Active_Ratio"], 5, CONDITIONS, {"width": 40})
+
+
+def test_runs_read_back(store):
+    basic = {"legitimacy_type": "basic", "alpha": 0.1}
+    regions = {"legitimacy_type": "by_regions", "alpha": 0.1}
+    store.append_many(basic, [11, 12], [series(0.1), series(0.2)])
+    store.append(regions, 21, series(0.3, length=4))
+    store.append(basic, 13, series(0.4))
+
+    reopened = ResultStore.open(store.path)
+    assert len(reopened) == 4
+    assert reopened.params == {"width": 40}
+    assert reopened.conditions() == [basic, regions]
+    runs = reopened.runs(basic)
+    np.testing.assert_array_equal(runs["run_index"], [0, 1, 2])
+    np.testing.assert_array_equal(runs["seed"], [11, 12, 13])
+    conditions, cube = reopened.cube("Active_Ratio")
+    assert cube.shape == (2, 3, 6)
+    np.testing.assert_array_equal(cube[0, :, 0], [0.1, 0.2, 0.4])
+    # shorter series and missing runs are padded with NaN
+    np.testing.assert_array_equal(cube[1, 0], [0.3] * 4 + [np.nan] * 2)
+    assert np.isnan(cube[1, 1:]).all()
+
+
+def test_torn_record_is_ignored_then_cut_off(store):
+    condition = {"legitimacy_type": "basic", "alpha": 0.1}
+    store.append(condition, 1, series(0.1))
+    size = os.path.getsize(store.path)
+    # a crash halfway through writing the second record
+    with open(store.path, "ab") as f:
+        f.write(store.record(condition, 2, series(0.2), 1)[:store.dtype.itemsize // 2])
+    assert len(store) == 1
+    np.testing.assert_array_equal(store.records["seed"], [1])
+
+    store.append(condition, 3, series(0.3))
+    assert os.path.getsize(store.path) == size + store.dtype.itemsize
+    np.testing.assert_array_equal(store.runs(condition)["seed"], [1, 3])
+    np.testing.assert_array_equal(store.runs(condition)["run_index"], [0, 1])
+
+
+def test_appends_are_synced(store, monkeypatch):
+    synced = []
+    fsync = os.fsync
+
+    def record_fsync(fd):
+        synced.append(os.fstat(fd).st_size)
+        fsync(fd)
+
+    monkeypatch.setattr(results.os, "fsync", record_fsync)
+    condition = {"legitimacy_type": "basic", "alpha": 0.1}
+    store.append_many(condition, [1, 2], [series(0.1), series(0.2)])
+    store.append(condition, 3, series(0.3))
+    # once per append, after the whole records are written
+    assert synced == [store.offset + 2 * store.dtype.itemsize, store.offset + 3 * store.dtype.itemsize]
+
+
+def test_appends_without_file_locking(store, monkeypatch):
+    monkeypatch.setattr(results, "fcntl", None)
+    monkeypatch.setattr(results, "msvcrt", None)
+    store.append({"legitimacy_type": "basic", "alpha": 0.1}, 1, series(0.1))
+    assert len(ResultStore.open(store.path)) == 1
@@ -0,0 +1,62 @@
+import numpy as np
+
+from mean_field_civil_violence.model import EpsteinNetworkCivilViolence
+from mean_field_civil_violence.rng import PURPOSES, RandomStream, RandomStreams, spawn_seeds
+
+PARAMS = dict(width=20, height=20, legitimacy=0.6, cop_density=0.06, max_jail_term=5, max_iters=20)
+
+
+def series(seed):
+    model = EpsteinNetworkCivilViolence(**PARAMS, seed=seed)
+    while model.running:
+        model.step()
+    return model.datacollector.model_vars, model.agent_snapshot()
+
+
+def test_same_seed_gives_the_same_run():
+    (model_vars, agents), (again, again_agents) = series(4), series(4)
+    for name in ("Active", "Jailed", "Quiescent", "Mean_Legitimacy"):
+        np.testing.assert_array_equal(model_vars[name], again[name])
+    for name, values in agents.items():
+        np.testing.assert_array_equal(values, again_agents[name])
+    assert not np.array_equal(model_vars["Active"], series(5)[0]["Active"])
+
+
+def test_streams_do_not_depend_on_each_other():
+    streams, other = RandomStreams(7), RandomStreams(7)
+    for _ in range(5000):
+        other.activation.random()
+    other.jail.uniforms(3)
+    for purpose in PURPOSES:
+        if purpose not in ("activation", "jail"):
+            np.testing.assert_array_equal(streams[purpose].uniforms(100), other[purpose].uniforms(100))
+    assert len(set(spawn_seeds(0, 50))) == 50
+    assert spawn_seeds(0, 3) == spawn_seeds(0, 3)
+
+
+def test_peek_skip_and_arrays_match_scalar_draws_across_blocks():
+    scalar = RandomStreams(3, block_size=8).movement
+    batched = RandomStreams(3, block_size=8).movement
+    expected = [scalar.random() for _ in range(40)]
+
+    assert batched.random() == expected[0]
+    # within the block, across one boundary, and from an exhausted block
+    np.testing.assert_array_equal(batched.peek(5), expected[1:6])
+    np.testing.assert_array_equal(batched.peek(12), expected[1:13])
+    batched.skip(7)
+    assert batched._next == len(batched._buffer)
+    np.testing.assert_array_equal(batched.peek(3), expected[8:11])
+    np.testing.assert_array_equal(batched.uniforms(10), expected[8:18])
+    batched.skip(0)
+    assert batched.random() == expected[18]
+    np.testing.assert_array_equal(batched.peek(21), expected[19:40])
+
+
+def test_state_resumes_at_a_block_boundary():
+    stream = RandomStream(np.random.SeedSequence(9), block_size=4)
+    for _ in range(4):
+        stream.random()
+    state = stream.get_state()
+    expected = [stream.random() for _ in range(6)]
+    stream.set_state(state)
+    assert [stream.random() for _ in range(6)] == expected
@@ -0,0 +1,63 @@
+import numpy as np
+
+from mean_field_civil_violence.sensitivity import run_pawn_analysis
+
+PROBLEM = {"num_vars": 2, "names": ["x", "y"], "bounds": [[0, 1], [0, 1]]}
+
+
+class SampleModel:
+    """
+    Stand-in model whose output is its first parameter; it fails for x
+    above `fail_above`.
+    """
+
+    def __init__(self, x, y, fail_above, seed):
+        if x > fail_above:
+            raise RuntimeError("failed sample")
+        self.x = x
+        self.seed = seed
+        self.running = False
+
+
+def model_x(model):
+    return model.x
+
+
+def model_seed(model):
+    return model.seed
+
+
+OUTPUTS = {"x": model_x, "seed": model_seed}
+
+
+def analysis(checkpoint, fail_above):
+    return run_pawn_analysis(
+        PROBLEM,
+        {"fail_above": fail_above},
+        steps=1,
+        num_samples=40,
+        outputs=OUTPUTS,
+        processes=2,
+        batch_size=10,
+        checkpoint=str(checkpoint),
+        S=4,
+        model_cls=SampleModel,
+    )
+
+
+def test_unseeded_analysis_resumes_and_retries_failures(tmp_path):
+    checkpoint = tmp_path / "pawn.npz"
+    first = analysis(checkpoint, fail_above=0.5)
+    failed = np.isnan(first.outputs["x"])
+    assert failed.any() and not failed.all()
+    with np.load(checkpoint) as saved:
+        np.testing.assert_array_equal(saved["done"], ~failed)
+
+    # no seed: the resumed run must reuse the checkpoint's sample and seeds
+    second = analysis(checkpoint, fail_above=2.0)
+    np.testing.assert_array_equal(second.samples, first.samples)
+    assert not np.isnan(second.outputs["x"]).any()
+    np.testing.assert_array_equal(second.outputs["x"], second.samples[:, 0])
+    np.testing.assert_array_equal(second.outputs["seed"][~failed], first.outputs["seed"][~failed])
+    with np.load(checkpoint) as saved:
+        assert saved["done"].all()
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+from mesa.space import SingleGrid
+
+from mean_field_civil_violence.space import NeighborhoodTable
+
+
+@pytest.mark.parametrize("torus", [True, False])
+@pytest.mark.parametrize("radius", [1, 3, 12])
+def test_neighborhood_rows_match_mesa(torus, radius):
+    width, height = 9, 7
+    grid = SingleGrid(width, height, torus)
+    table = NeighborhoodTable(width, height, torus, radius)
+    rows = table.rows(np.arange(width * height))
+    for x in range(width):
+        for y in range(height):
+            expected = grid.get_neighborhood((x, y), True, False, radius)
+            index = x * height + y
+            assert list(table.coordinates((x, y))) == list(expected)
+            assert list(table.row(index)) == [a * height + b for a, b in expected]
+            assert list(rows[index][rows[index] >= 0]) == list(table.row(index))
+
+
+def test_neighborhood_table_keeps_offsets_only():
+    table = NeighborhoodTable(400, 400, True, 10)
+    assert table.size == 21 ** 2 - 1
+    assert table.dx.nbytes + table.dy.nbytes < 10_000
+    columns = np.array([0, 5, table.size - 1])
+    np.testing.assert_array_equal(table.entries([1234] * 3, columns), table.rows([1234])[0][columns])
+
+
+@pytest.mark.parametrize("mode", ["summed_area", "incremental"])
+def test_neighborhood_counts_give_the_scanned_run(mode):
+    from mean_field_civil_violence.model import EpsteinNetworkCivilViolence
+
+    params = dict(width=25, height=35, citizen_vision=3, cop_vision=5, legitimacy=0.7,
+                  cop_density=0.04, max_jail_term=30, max_iters=40, seed=2)
+    series = []
+    for counts in (None, mode):
+        model = EpsteinNetworkCivilViolence(neighborhood_counts=counts, **params)
+        while model.running:
+            model.step()
+        series.append(model.datacollector.model_vars)
+    for name in ("Active", "Jailed", "Quiescent", "Mean_Legitimacy"):
+        np.testing.assert_array_equal(series[0][name], series[1][name])
+
+
+def test_citizens_move_within_the_empty_cells_seen_before_moving(monkeypatch):
+    from mean_field_civil_violence.agent import Inhabitant
+    from mean_field_civil_violence.model import EpsteinNetworkCivilViolence
+
+    params = dict(width=15, height=15, citizen_density=0.8, legitimacy=0.6, max_iters=20, seed=4)
+    theirs = EpsteinNetworkCivilViolence(**params)
+    while theirs.running:
+        theirs.step()
+
+    # the original model's list of empty neighbors, taken before the first
+    # move and reused by the second, sampled with the grid's draws
+    stale = {}
+    stays = []
+
+    def move(self, origin):
+        grid = self.model.grid
+        neighborhood = grid.get_neighborhood(origin, moore=True, radius=self.vision)
+        if self.pos == origin:
+            stale[self] = [c for c in neighborhood if not grid.get_cell_list_contents([c])]
+        empty = stale[self]
+        rng = self.model.streams.movement
+        new_pos = None
+        for _ in range(16):
+            cell = neighborhood[rng.randrange(len(neighborhood))]
+            if cell in empty:
+                new_pos = cell
+                break
+        else:
+            if empty:
+                new_pos = empty[rng.randrange(len(empty))]
+        if new_pos is not None:
+            if new_pos == self.pos:
+                stays.append(self)
+            grid.move_agent(self, new_pos)
+
+    monkeypatch.setattr(Inhabitant, "move", move)
+    ours = EpsteinNetworkCivilViolence(**params)
+    while ours.running:
+        ours.step()
+    assert stays
+    for name in ("Active", "Jailed", "Quiescent"):
+        np.testing.assert_array_equal(ours.datacollector.model_vars[name], theirs.datacollector.model_vars[name])
+    assert [a.pos for a in ours.population()] == [a.pos for a in theirs.population()]
@@ -0,0 +1,61 @@
+import numpy as np
+
+from mean_field_civil_violence.agent import Inhabitant
+from mean_field_civil_violence.datacollection import CITIZEN
+from mean_field_civil_violence.model import EpsteinNetworkCivilViolence
+
+PARAMS = dict(width=20, height=20, legitimacy=0.6, cop_density=0.06, max_jail_term=5, max_iters=30,
+              activation="synchronous", seed=4)
+
+
+def run(model):
+    while model.running:
+        model.step()
+    return model
+
+
+def free_citizens(model):
+    return sorted(
+        (agent for agent in model.population() if agent.breed_code == CITIZEN and agent.release is None),
+        key=lambda agent: agent.unique_id,
+    )
+
+
+def test_synchronous_runs_repeat_for_the_same_seed():
+    first, second = run(EpsteinNetworkCivilViolence(**PARAMS)), run(EpsteinNetworkCivilViolence(**PARAMS))
+    assert max(first.datacollector.model_vars["Active"]) > 0
+    for name, values in first.datacollector.model_vars.items():
+        np.testing.assert_array_equal(second.datacollector.model_vars[name], values)
+    for name, values in first.agent_snapshot().items():
+        np.testing.assert_array_equal(second.agent_snapshot()[name], values)
+
+
+def test_citizens_decide_from_the_state_at_the_start_of_the_step(monkeypatch):
+    model = EpsteinNetworkCivilViolence(**PARAMS)
+    for _ in range(5):
+        model.step()
+
+    # every decision taken from the same state, nothing committed in between
+    reference = EpsteinNetworkCivilViolence.restore(model.snapshot())
+    reference.legitimacy_field = reference.mean_field_legitimacy()
+    expected = {citizen.unique_id: citizen.decide() for citizen in free_citizens(reference)}
+
+    # committing each decision before the next citizen decides
+    sequential = EpsteinNetworkCivilViolence.restore(model.snapshot())
+    sequential.legitimacy_field = sequential.mean_field_legitimacy()
+    one_by_one = {}
+    for citizen in free_citizens(sequential):
+        one_by_one[citizen.unique_id] = citizen.decide()
+        citizen.commit(*one_by_one[citizen.unique_id])
+    assert one_by_one != expected
+
+    committed = {}
+    commit = Inhabitant.commit
+
+    def recording_commit(self, *decision):
+        committed[self.unique_id] = decision
+        commit(self, *decision)
+
+    monkeypatch.setattr(Inhabitant, "commit", recording_commit)
+    model.step()
+    assert committed == expected
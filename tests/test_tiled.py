@@ -0,0 +1,45 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from mean_field_civil_violence.tiled import TiledNetworkCivilViolence
+
+PARAMS = dict(width=24, height=20, legitimacy=0.6, cop_density=0.06, max_jail_term=5, max_iters=25, seed=7)
+
+pytestmark = pytest.mark.skipif(
+    "fork" not in multiprocessing.get_all_start_methods(), reason="the tiled engine forks its workers"
+)
+
+
+def run(num_workers):
+    model = TiledNetworkCivilViolence(**PARAMS, num_workers=num_workers)
+    try:
+        while model.running:
+            model.step()
+    finally:
+        model.close()
+    return model
+
+
+def test_results_do_not_depend_on_the_number_of_workers():
+    single, tiled = run(1), run(3)
+    for name in ("Active", "Jailed", "Quiescent", "Active_Ratio"):
+        np.testing.assert_array_equal(tiled.datacollector.model_vars[name], single.datacollector.model_vars[name])
+    for name, values in single.agent_snapshot().items():
+        np.testing.assert_array_equal(tiled.agent_snapshot()[name], values)
+
+
+def test_prisoners_sit_out_their_sentence():
+    model = TiledNetworkCivilViolence(**PARAMS)
+    released = 0
+    for _ in range(PARAMS["max_iters"]):
+        before = model.agent_snapshot()
+        model.step()
+        after = model.agent_snapshot()
+        jailed = before["jail_sentence"] > 0
+        np.testing.assert_array_equal(after["jail_sentence"][jailed], before["jail_sentence"][jailed] - 1)
+        for name in ("x", "y", "condition"):
+            np.testing.assert_array_equal(after[name][jailed], before[name][jailed])
+        released += np.count_nonzero(before["jail_sentence"] == 1)
+    assert released
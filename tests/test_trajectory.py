@@ -0,0 +1,69 @@
+import numpy as np
+
+from mean_field_civil_violence.model import EpsteinNetworkCivilViolence
+from mean_field_civil_violence.trajectory import TRAJECTORY_COLUMNS, TrajectoryStore
+
+PARAMS = dict(width=20, height=20, max_iters=15, seed=3)
+
+
+def test_trajectory_reads_back_a_finished_run(tmp_path):
+    model = EpsteinNetworkCivilViolence(
+        **PARAMS, trajectory_path=str(tmp_path), agent_snapshot_every=1
+    )
+    while model.running:
+        model.step()
+    # stopping the run closes the store
+    assert model.datacollector.trajectory is None
+
+    arrays = model.datacollector.agent_arrays()
+    store = TrajectoryStore.open(str(tmp_path))
+    assert store.num_steps == model.datacollector.num_collected == len(arrays["snapshot_steps"])
+    for step in range(store.num_steps):
+        columns = store.agent_columns(arrays["unique_id"][step])
+        for name in TRAJECTORY_COLUMNS:
+            np.testing.assert_array_equal(store.read(name, step, columns), arrays[name][step])
+
+
+def test_steps_are_visible_before_the_store_is_closed(tmp_path):
+    model = EpsteinNetworkCivilViolence(**PARAMS, trajectory_path=str(tmp_path))
+    for _ in range(4):
+        model.step()
+    store = TrajectoryStore.open(str(tmp_path))
+    assert store.num_steps == 5
+    np.testing.assert_array_equal(
+        store["x"][-1], model.datacollector.trajectory["x"][-1]
+    )
+
+
+def test_store_grows_past_its_capacity(tmp_path):
+    unique_id = np.array([5, 1, 3])
+    with TrajectoryStore.create(str(tmp_path), unique_id, capacity=2) as store:
+        for step in range(5):
+            snapshot = {name: np.full(3, step, dtype=dtype) for name, dtype in TRAJECTORY_COLUMNS.items()}
+            snapshot["unique_id"] = unique_id[::-1]
+            snapshot["x"] = np.array([step, 10 + step, 20 + step])
+            store.append(snapshot)
+    store = TrajectoryStore.open(str(tmp_path))
+    assert store.num_steps == 5
+    np.testing.assert_array_equal(store.read("x", 4, store.agent_columns([1, 3, 5])), [14, 4, 24])
+    np.testing.assert_array_equal(store["jail_sentence"][:, 0], np.arange(5))
+
+
+def test_appends_only_update_the_step_count(tmp_path, monkeypatch):
+    from mean_field_civil_violence import trajectory
+
+    unique_id = np.array([2, 0, 1])
+    store = TrajectoryStore.create(str(tmp_path), unique_id, capacity=8)
+    header = (tmp_path / TrajectoryStore.HEADER).read_text()
+
+    def replace(*args):
+        raise AssertionError("an append rewrote a file")
+
+    monkeypatch.setattr(trajectory.os, "replace", replace)
+    for step in range(3):
+        snapshot = {name: np.full(3, step, dtype=dtype) for name, dtype in TRAJECTORY_COLUMNS.items()}
+        snapshot["unique_id"] = unique_id
+        store.append(snapshot)
+        assert TrajectoryStore.open(str(tmp_path)).num_steps == step + 1
+    store.close()
+    assert (tmp_path / TrajectoryStore.HEADER).read_text() == header
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from mean_field_civil_violence.model import EpsteinNetworkCivilViolence
+from mean_field_civil_violence.vectorized import VectorizedNetworkCivilViolence
+
+PARAMS = dict(width=20, height=20, legitimacy=0.6, cop_density=0.06, max_jail_term=5, max_iters=40, seed=2)
+
+INITIALIZATIONS = {
+    "basic": {},
+    "heterogeneous": dict(legitimacy_width=0.3),
+    "by_regions": dict(legitimacy_matrix=np.array([[0.2, 0.9, 0.4], [0.6, 0.1, 0.8]])),
+}
+
+
+def run(model):
+    while model.running:
+        model.step()
+    return model
+
+
+@pytest.mark.parametrize("legitimacy_type", sorted(INITIALIZATIONS))
+def test_vectorized_engine_is_the_synchronous_activation(legitimacy_type):
+    params = dict(PARAMS, legitimacy_type=legitimacy_type, **INITIALIZATIONS[legitimacy_type])
+    ours = run(VectorizedNetworkCivilViolence(**params))
+    theirs = run(EpsteinNetworkCivilViolence(**params, activation="synchronous"))
+
+    assert max(theirs.datacollector.model_vars["Jailed"]) > 0
+    for name in ("Active", "Jailed", "Quiescent", "Stable Agents", "Mean_Legitimacy"):
+        np.testing.assert_array_equal(ours.datacollector.model_vars[name], theirs.datacollector.model_vars[name])
+    for name, values in theirs.agent_snapshot().items():
+        np.testing.assert_array_equal(ours.agent_snapshot()[name], values)